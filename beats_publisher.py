@@ -1,48 +1,105 @@
 import sys
+import json
 import time
 import signal
-import json
-import socket
 import logging
 from datetime import datetime
 
 from modules.audio_reactor import AudioReactor
 from modules import config
+from modules.ipc import BackgroundSender, DaemonClient, DatagramSender, FLAG_TRACE
+from modules.latency import new_trace
+from modules import metrics
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('beats_publisher')
 
-# UNIXソケットパス
-SOCKET_PATH = config.SOCKET_PATH
+# 音声キューの統計をログに出す間隔 (秒)
+STATS_INTERVAL = 10.0
+# MQTTデーモンへの送信を待つビートの上限 (超えたら古いものから捨てる)
+SEND_QUEUE_SIZE = 16
 
-def send_mqtt_message(payload, topic=None):
-    """UNIXソケット経由でMQTTデーモンにメッセージを送信する"""
-    try:
-        # UNIXソケットに接続
-        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        client.connect(SOCKET_PATH)
-        
-        # トピックが指定されていなければデフォルト値を使用
-        if not topic:
-            topic = f"{config.MQTT_TOPIC_BASE}/beats"
-        
-        # メッセージを準備
-        message = {
-            "topic": topic,
-            "payload": payload
-        }
-        
-        # メッセージを送信
-        client.sendall(json.dumps(message).encode('utf-8'))
-        client.close()
-        
-        logger.debug(f"Message sent to MQTT daemon for topic: {topic}")
-        return True
-    except Exception as e:
-        logger.error(f"Error sending message to MQTT daemon: {e}")
-        return False
+# MQTTデーモンへの常設接続 (切断時は自動で再接続する)
+daemon_client = DaemonClient(config.SOCKET_PATH, default_topic=f"{config.MQTT_TOPIC_BASE}/beats")
+
+# led_subscriber へブローカーを経由せずに直接送る経路 (同じJSONをMQTTにも送る)
+fast_path = DatagramSender(config.BEATS_SOCKET_PATH) if config.BEATS_FAST_PATH else None
+
+# メトリクス
+detect_seconds = metrics.registry.histogram("beats_detect_seconds", "Time spent in detect_beats per audio block")
+beats_detected = metrics.registry.counter("beats_detected_total", "Beats detected", ["band"])
+messages_sent = metrics.registry.counter("beats_messages_sent_total", "Beat messages sent to the MQTT daemon")
+send_failures = metrics.registry.counter("beats_send_failures_total", "Beat messages that could not be sent")
+fast_path_sent = metrics.registry.counter("beats_fast_path_sent_total", "Beat messages sent directly to the LED subscriber")
+
+# MQTTデーモンへの送信は専用スレッドで行う (オーディオスレッドをソケットへの書き込みで止めない)
+sender = BackgroundSender(daemon_client, SEND_QUEUE_SIZE, on_sent=messages_sent.inc, on_failed=send_failures.inc)
+metrics.registry.counter("beats_send_dropped_total", "Beat messages dropped while waiting for the MQTT daemon",
+                         func=lambda: sender.dropped)
+
+def log_queue_stats(reactor, last_counts):
+    """音声キューのオーバーランや入力オーバーフロー、送信待ちのビートの破棄が前回から増えていれば警告を出し、現在の値を返す"""
+    ring = reactor.ring
+    counts = (ring.overruns, reactor.input_overflows, sender.dropped)
+    if counts[:2] != last_counts[:2]:
+        logger.warning(f"Audio dropped: {counts[0] - last_counts[0]} queue overruns, "
+                       f"{counts[1] - last_counts[1]} input overflows "
+                       f"(depth {ring.depth}, max depth {ring.max_depth}/{ring.capacity})")
+    if counts[2] != last_counts[2]:
+        logger.warning(f"Beat messages dropped: {counts[2] - last_counts[2]} waiting for the MQTT daemon")
+    return counts
+
+def publish_beats(detected_beats, timestamp, onsets=None, tempo=None):
+    """検出したビートをMQTTデーモンに送信する (ブロックしない)
+
+    Args:
+        detected_beats: 帯域ごとの検出結果
+        timestamp: 音声を取得した時刻
+        onsets: 検出した帯域ごとのオンセット時刻 (解析フレーム単位の精度)
+        tempo: テンポ推定による次のビートの予測 (bpm, confidence, next_beat)
+    """
+    # 検出されたビートの詳細をログに記録
+    detected_bands = [band for band, detected in detected_beats.items() if detected]
+    logger.debug(f"Beat detected in bands: {', '.join(detected_bands)}")
+    for band in detected_bands:
+        beats_detected.labels(band).inc()
+    
+    # 音声を取得した時刻をタイムスタンプとする
+    payload = {
+        "timestamp": timestamp,
+        "beats": detected_beats
+    }
+    if onsets:
+        payload["onsets"] = onsets
+    if tempo:
+        payload["tempo"] = tempo
+
+    # 音声の取得からLEDに表示されるまでの各段階の時刻を記録していくトレース
+    trace = new_trace(timestamp)
+    payload["trace"] = trace
+    trace["sent"] = time.time()
+    data = json.dumps(payload).encode('utf-8')
+
+    # 同じマシンの led_subscriber には直接送る (受信側はトレースのIDでMQTT経由の重複を捨てる)
+    if fast_path is not None and fast_path.send(data):
+        fast_path_sent.inc()
+    
+    # MQTTデーモンへの送信は送信スレッドに任せる (結果はメトリクスで数える)
+    sender.put(data, flags=FLAG_TRACE)
+
+def register_reactor_metrics(reactor):
+    """AudioReactor の状態を出力時に読み出すメトリクスを登録する"""
+    ring = reactor.ring
+    metrics.registry.gauge("beats_queue_depth", "Audio blocks waiting in the ring buffer", func=lambda: ring.depth)
+    metrics.registry.counter("beats_queue_overruns_total", "Audio blocks dropped because the ring buffer was full",
+                             func=lambda: ring.overruns)
+    metrics.registry.counter("beats_input_overflows_total", "Input overflows reported by the audio device",
+                             func=lambda: reactor.input_overflows)
+    if reactor.tempo is not None:
+        metrics.registry.gauge("beats_tempo_bpm", "Estimated tempo (0 while unknown)",
+                               func=lambda: reactor.tempo.bpm or 0)
 
 def main():
     """エントリーポイント"""
@@ -62,48 +119,54 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
     
     # AudioReactorインスタンスを作成
-    reactor = AudioReactor()
-    if not reactor.start():
+    reactor = AudioReactor(fft_size=config.BEATS_FFT_SIZE, hop_size=config.BEATS_HOP_SIZE,
+                           detector=config.BEATS_DETECTOR, tempo_band=config.BEATS_TEMPO_BAND,
+                           log_beats=False)
+    reactor.on_detect_time = detect_seconds.observe
+    register_reactor_metrics(reactor)
+    metrics.start_http_server(config.BEATS_METRICS_PORT, config.METRICS_HOST)
+
+    def on_beats(detected_beats, captured_at, onsets):
+        publish_beats(detected_beats, captured_at, onsets, reactor.tempo_prediction(captured_at))
+
+    # コールバックモードではオーディオスレッドでブロックが届いた直後に検出・送信する
+    callback = on_beats if config.BEATS_DETECT_IN_CALLBACK else None
+    if not reactor.start(on_beats=callback):
         logger.error("Failed to start AudioReactor")
         return 1
     
-    logger.info("Beat detection started")
+    logger.info(f"Beat detection started ({reactor.detector.name} detector, "
+                f"{'callback' if callback else 'iterator'} mode)")
+    last_stats = time.monotonic()
+    last_counts = (0, 0, 0)
     
     try:
-        while running:
-            # オーディオチャンクを取得
-            audio_chunk = reactor.get_audio_chunk()
-            
-            if audio_chunk is not None:
+        if callback:
+            # 検出はオーディオスレッドで行われるので、ここでは統計の確認だけを行う
+            while running:
+                time.sleep(STATS_INTERVAL)
+                last_counts = log_queue_stats(reactor, last_counts)
+        else:
+            # ブロックが届くたびに復帰するイテレータで処理する (ポーリングなし)
+            for audio_chunk in reactor.chunks():
                 # オーディオデータ取得のログ
                 logger.debug(f"Processing audio chunk: {audio_chunk.shape}")
+                captured_at = time.time()
                 
                 # ビート検出
+                started = time.perf_counter()
                 detected_beats = reactor.detect_beats(audio_chunk)
+                detect_seconds.observe(time.perf_counter() - started)
                 
                 # ビートが検出されたらMQTTデーモンに送信
                 if any(detected_beats.values()):
-                    # 検出されたビートの詳細をログに記録
-                    detected_bands = [band for band, detected in detected_beats.items() if detected]
-                    logger.info(f"Beat detected in bands: {', '.join(detected_bands)}")
-                    
-                    # 現在のタイムスタンプを追加
-                    payload = {
-                        "timestamp": time.time(),
-                        "beats": detected_beats
-                    }
-                    
-                    # MQTTデーモンにメッセージを送信
-                    success = send_mqtt_message(payload)
-                    if success:
-                        logger.debug("Beat message sent successfully")
-                    else:
-                        logger.warning("Failed to send beat message")
-            
-            else:
-                # キューが空の場合は少し待つ
-                logger.debug("No audio chunk available, waiting...")
-                time.sleep(0.01)
+                    publish_beats(detected_beats, captured_at, reactor.onset_times(captured_at),
+                                  reactor.tempo_prediction(captured_at))
+
+                # 古い音声が捨てられていないか定期的に確認する
+                if time.monotonic() - last_stats >= STATS_INTERVAL:
+                    last_counts = log_queue_stats(reactor, last_counts)
+                    last_stats = time.monotonic()
 
     except KeyboardInterrupt:
         logger.info("Interrupted by user")
@@ -113,6 +176,10 @@ def main():
         # 終了処理
         if reactor:
             reactor.stop()
+        sender.close()
+        daemon_client.close()
+        if fast_path is not None:
+            fast_path.close()
         logger.info("Beat detection stopped")
     
     return 0
@@ -1,7 +1,5 @@
 import paho.mqtt.client as mqtt
-import base64
 from PIL import Image
-import io
 import threading
 import time
 import signal
@@ -10,84 +8,376 @@ import json
 import logging
 import random
 import os
-
-from rgbmatrix import RGBMatrix, RGBMatrixOptions
+import importlib
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from modules import config
 from modules.led_matrix import LEDMatrix
-# from modules.led.rotation import LEDRotationEffect, RotationAxis
-import importlib
-led_jukebox_renderer = importlib.import_module("modules.LED-Jukebox-Visualizer.renderer.scroll_renderer")
-import pyglet
+from modules.frame_scheduler import FrameScheduler
+from modules.frame_profiler import FrameProfiler
+from modules.panorama_textures import PanoramaTextures
+from modules.rotation_cache import RotationFrameCache
+from modules.latency import LatencyStats, TRACE_STAGES
+from modules import metrics
+from modules.track_message import decode_track_message, is_track_message, pixels_to_array
+from modules.ipc import bind_datagram_socket
 
 # ログ設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-try:
-    # LEDマトリックスの初期化
-    led_matrix = LEDMatrix()
-    matrix = led_matrix.matrix
-    
-    # 回転エフェクト処理クラスの初期化
-    os.environ['DISPLAY'] = ':1' 
+# 起動時刻 (起動の各段階の経過時間の基準)
+process_started = time.monotonic()
+
+# 回転アニメーションの設定
+ROTATION_START_DEG = 0
+ROTATION_END_DEG = 90
+ROTATION_STEP_DEG = 5
+
+def rotation_angles():
+    """回転アニメーションの1フレームごとの回転角"""
+    angles = []
+    deg = ROTATION_START_DEG
+    while deg < ROTATION_END_DEG:
+        deg = min(deg + ROTATION_STEP_DEG, ROTATION_END_DEG)
+        angles.append(deg)
+    return angles
+
+ROTATION_ANGLES = rotation_angles()
+
+# パノラマテクスチャにアルバムアートを並べる数
+PANORAMA_REPEAT = 6
+
+# テンポ推定で予測したビートに合わせて回転を先行して始める (0なら予測を使わない)
+BEAT_LEAD_TIME = config.LED_BEAT_LEAD_TIME
+# 予測で再生済みのビートとみなす実際のビートとの時刻差 (秒)
+PREDICTED_BEAT_TOLERANCE = 0.1
+predicted_beat_played = None  # 予測で回転を始めたビートの時刻
+
+mqtt_client = None
+
+# ビートが音声の取得からLEDに表示されるまでの区間ごとの遅延
+latency_stats = LatencyStats()
+last_latency_log = time.monotonic()
+
+# 表示系は main() の start_display() で初期化する (MQTTの接続を先に始めるため)
+led_jukebox_renderer = None  # LED-Jukebox-Visualizer のレンダラーモジュール
+led_matrix = None
+renderer = None
+readback = None  # FBOを使い回しのNumPyバッファに読み出す場合の FrameReadback
+textures = None  # パノラマテクスチャ (同じ内容の再アップロードを省く)
+rotation_axes = []  # レンダラーの回転軸
+renderer_angles = {}  # レンダラーに設定した軸ごとの回転角 (rotate_renderer() で更新する)
+
+# 表示中のテクスチャの回転アニメーションを空き時間に描画しておくキャッシュ (ビートではGLを使わずに再生する)
+rotation_cache = (RotationFrameCache(int(config.LED_ROTATION_CACHE_MB * 1024 * 1024))
+                  if config.LED_ROTATION_CACHE_MB > 0 else None)
+
+# 表示の準備ができるまでに届いたトラックは、最新の1件 (表示関数, 引数) だけを保持しておく
+startup_lock = threading.Lock()
+display_ready = False
+startup_track = None
+
+# 起動の段階ごとの所要時間と、各時点の起動からの経過時間 (秒)
+startup_phases = {}
+startup_marks = {}
+
+# 描画はすべてこのレンダーループ (メインスレッド) で行う
+# (フレームレートはLEDマトリクスの初期化後に設定し直す)
+scheduler = FrameScheduler(fps=30)
+
+# メトリクス
+frame_seconds = metrics.registry.histogram("led_frame_seconds", "Time to render and present one frame")
+messages_received = metrics.registry.counter("led_messages_received_total", "MQTT messages received", ["topic"])
+# 直接の経路はマイクロ秒単位なので細かい区切りを足す
+beat_latency = metrics.registry.histogram("led_beat_latency_seconds", "Beat latency per pipeline stage", ["stage"],
+                                          buckets=(0.00005, 0.0001, 0.00025) + metrics.DEFAULT_BUCKETS)
+metrics.registry.counter("led_animations_started_total", "Rotation animations started", func=lambda: scheduler.started_animations)
+metrics.registry.counter("led_animations_merged_total", "Beats merged into a pending animation", func=lambda: scheduler.merged_animations)
+metrics.registry.counter("led_animations_dropped_total", "Animations dropped because they were stale", func=lambda: scheduler.dropped_animations)
+# 直近に表示したフレームの時刻 (fps の算出用)
+present_times = deque(maxlen=120)
+
+def current_fps():
+    times = list(present_times)
+    if len(times) < 2 or time.monotonic() - times[-1] > 1.0:
+        return 0.0
+    return (len(times) - 1) / (times[-1] - times[0])
+
+metrics.registry.gauge("led_fps", "Frames presented per second (recent)", func=current_fps)
+if rotation_cache is not None:
+    metrics.registry.gauge("led_rotation_cache_bytes", "Memory used by pre-rendered rotation frames",
+                           func=lambda: rotation_cache.total_bytes)
+    metrics.registry.gauge("led_rotation_cache_rotations", "Rotations held in the frame cache",
+                           func=lambda: len(rotation_cache))
+    metrics.registry.counter("led_rotation_cache_hits_total", "Beats played from the frame cache",
+                             func=lambda: rotation_cache.hits)
+    metrics.registry.counter("led_rotation_cache_misses_total", "Beats rendered live because the cache was cold",
+                             func=lambda: rotation_cache.misses)
+    metrics.registry.counter("led_rotation_cache_evictions_total", "Rotations evicted from the frame cache",
+                             func=lambda: rotation_cache.evictions)
+
+# beats_publisher から直接ビートを受け取るソケット (MQTT経由でも同じビートが届く)
+fast_path_socket = None
+FAST_PATH_LABEL = "direct:beats"
+# 両方の経路で届いたビートを1回だけ処理するための、直近に受け取ったトレースID
+recent_trace_ids = deque(maxlen=64)
+recent_trace_lock = threading.Lock()
+duplicate_beats = metrics.registry.counter("led_duplicate_beats_total",
+                                           "Beats dropped because they already arrived on the other transport")
+
+# フレームの段階ごとの時間の計測 (SIGUSR1 または制御トピックで有効にする)
+profiler = FrameProfiler()
+CONTROL_TOPIC = f"{config.MQTT_TOPIC_BASE}/control/profile"
+
+def mark_startup(name):
+    """起動からの経過時間を記録する (最初の1回だけ)"""
+    startup_marks.setdefault(name, time.monotonic() - process_started)
+
+
+def timed_phase(name, func, *args):
+    """起動の1段階を実行し、所要時間を記録する"""
+    started = time.monotonic()
+    try:
+        return func(*args)
+    finally:
+        startup_phases[name] = time.monotonic() - started
+
+
+def format_startup():
+    phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in startup_phases.items())
+    marks = ", ".join(f"{name} at {seconds * 1000:.0f} ms" for name, seconds in startup_marks.items())
+    return f"Startup: {phases}; {marks}"
+
+
+def init_renderer():
+    """OpenGLのレンダラーとテクスチャ・読み出しバッファを用意する (メインスレッドで実行)"""
+    global led_jukebox_renderer, renderer, readback, textures, rotation_axes
+    if config.LED_GL_DISPLAY:
+        os.environ['DISPLAY'] = config.LED_GL_DISPLAY
+    led_jukebox_renderer = importlib.import_module("modules.LED-Jukebox-Visualizer.renderer.scroll_renderer")
+    rotation_axes = [led_jukebox_renderer.RotationAxis.X, led_jukebox_renderer.RotationAxis.Y,
+                     led_jukebox_renderer.RotationAxis.Z]
     renderer = led_jukebox_renderer.ScrollRenderer(64, 64, use_offscreen=True)
-    
+
+    # FBOを使い回しのNumPyバッファに読み出す (サイズはレンダラーのパノラマ画像に合わせる)
+    if config.LED_READBACK_MODE in ("numpy", "pbo"):
+        # PyOpenGL の読み込みも重いので、使う場合だけ読み込む
+        from modules.frame_readback import FrameReadback
+        renderer.on_draw()
+        probe_img = renderer.get_current_panorama_frame()
+        if probe_img:
+            readback = FrameReadback(probe_img.width, probe_img.height,
+                                     use_pbo=config.LED_READBACK_MODE == "pbo",
+                                     fbo=getattr(renderer, "fbo", None))
+            logger.info(f"Using {config.LED_READBACK_MODE} readback ({probe_img.width}x{probe_img.height})")
+        else:
+            logger.warning("Could not probe panorama frame size, falling back to PIL readback")
+
+    textures = PanoramaTextures(renderer, repeat=PANORAMA_REPEAT)
+
+
+def start_display():
+    """LEDマトリクスとレンダラーを初期化し、保留していたトラックをレンダーループに渡す
+
+    LED_PARALLEL_INIT が有効なら、LEDマトリクスは別スレッドで、
+    OpenGLのコンテキストはレンダーループと同じメインスレッドで同時に初期化する。
+    """
+    global led_matrix
+    if config.LED_PARALLEL_INIT:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="matrix-init") as executor:
+            matrix_future = executor.submit(timed_phase, "matrix", LEDMatrix)
+            timed_phase("renderer", init_renderer)
+            led_matrix = matrix_future.result()
+    else:
+        led_matrix = timed_phase("matrix", LEDMatrix)
+        timed_phase("renderer", init_renderer)
+
+    led_matrix.profiler = profiler
+    scheduler.frame_interval = led_matrix.framerate / led_matrix.options.limit_refresh_rate_hz
+    mark_display_ready()
+    mark_startup("display ready")
     logger.info("LED Matrix and rotation effect initialized successfully")
-except Exception as e:
-    logger.error(f"Matrix initialization error: {e}")
-    sys.exit(1)
 
-# 現在表示中の画像を管理するための変数
-current_display = None
-mqtt_client = None
-rotation_lock = threading.Lock()  # 回転処理の排他制御用ロック
 
-def process_track_message(message_data):
-    """トラック情報メッセージを処理する関数"""
-    global current_display
-    
+def submit_track(func, *args):
+    """トラックの表示をレンダーループに要求する (表示の準備ができるまでは最新の1件だけを保持する)"""
+    global startup_track
+    with startup_lock:
+        if not display_ready:
+            startup_track = (func, args)
+            return
+        scheduler.submit(func, *args)
+
+
+def mark_display_ready():
+    """表示の準備ができたことを記録し、保留していたトラックをレンダーループに渡す"""
+    global display_ready, startup_track
+    with startup_lock:
+        display_ready = True
+        if startup_track is not None:
+            func, args = startup_track
+            startup_track = None
+            scheduler.submit(func, *args)
+
+
+def draw_frame(stream=False):
+    """FBOに描画してLEDマトリクスに表示し、表示したフレームを返す (レンダースレッドで実行)
+
+    readbackが有効な場合は使い回しのNumPyバッファ (下の行が先頭) を、
+    そうでなければレンダラーのPILイメージを返す。
+    stream=TrueのときはPBOの非同期読み出しを使う (アニメーションの途中フレーム向け)。
+    この場合は1つ前に描画したフレームを表示して返し、最初のフレームではNoneを返す。
+    残った最後のフレームは flush_frame() で表示する。
+    """
+    started = time.perf_counter()
+    profiler.begin()
+    renderer.on_draw()  # FBOに描画
+    profiler.lap("draw")
+    if readback is not None:
+        frame = readback.read(sync=not stream)
+        profiler.lap("readback")
+        if frame is None:
+            # PBOの最初の読み出しでは、まだ表示できるフレームがない
+            profiler.end()
+            return None
+        led_matrix.present(frame, flip_vertical=True)
+    else:
+        frame = renderer.get_current_panorama_frame()
+        profiler.lap("readback")
+        if frame:
+            # オフスクリーンキャンバスに描画してVSyncで切り替えるので、事前のクリアは不要
+            led_matrix.present(frame)
+    frame_presented(started)
+    return frame
+
+
+def flush_frame():
+    """PBOに残っている最後のフレームを表示して返す (なければNone、レンダースレッドで実行)"""
+    if readback is None:
+        return None
+    started = time.perf_counter()
+    profiler.begin()
+    frame = readback.flush()
+    profiler.lap("readback")
+    if frame is None:
+        profiler.end()
+        return None
+    led_matrix.present(frame, flip_vertical=True)
+    frame_presented(started)
+    return frame
+
+
+def present_frame(frame):
+    """キャッシュしたフレーム (上の行が先頭のRGB配列) をGLを使わずに表示する (レンダースレッドで実行)"""
+    started = time.perf_counter()
+    profiler.begin()
+    led_matrix.present(frame)
+    frame_presented(started)
+
+
+def frame_presented(started):
+    """1フレームを表示し終えたときの計測"""
+    profiler.end()
+    frame_seconds.observe(time.perf_counter() - started)
+    present_times.append(time.monotonic())
+    if "first frame" not in startup_marks:
+        mark_startup("first frame")
+        logger.info(format_startup())
+
+
+def rotate_renderer(axis, deg):
+    """レンダラーの回転角を設定し、元に戻せるよう覚えておく (レンダースレッドで実行)"""
+    renderer.rotate(axis, deg)
+    renderer_angles[axis] = deg
+
+
+def reset_rotation():
+    """すべての軸の回転を元の姿勢に戻す (レンダースレッドで実行)
+
+    途中で取り消された回転アニメーションは finish_rotation() を通らないので、表示を切り替えるときに戻す。
+    """
+    for axis in rotation_axes:
+        rotate_renderer(axis, ROTATION_START_DEG)
+
+
+def render_rotation_frame(axis, deg):
+    """回転角 deg のフレームを描画して (高さ, 幅, 3) の配列で返す (表示はせず、回転は元に戻す)"""
+    previous = renderer_angles.get(axis, ROTATION_START_DEG)
+    renderer.rotate(axis, deg)
+    renderer.on_draw()
+    if readback is not None:
+        frame = readback.read(sync=True)[::-1]
+    else:
+        frame = np.asarray(renderer.get_current_panorama_frame().convert('RGB'))
+    renderer.rotate(axis, previous)
+    return frame
+
+
+def finish_rotation(axis, direction, capture):
+    """回転し終えたら回転後の見た目をテクスチャにして元の姿勢に戻す (レンダースレッドで実行)
+
+    キャッシュの再生とその場での描画のどちらで回転しても、同じレンダラーの状態で終わるようにする。
+    capture は回転後のフレームを (高さ, 幅, 3) の配列で返す関数 (PanoramaTextures.rotated() を参照)。
+    """
+    # テクスチャが変わらなかった場合も、回転だけは元の姿勢に戻す
+    textures.rotated(axis, direction, capture)
+    rotate_renderer(axis, ROTATION_START_DEG)
+    renderer.on_draw()
+    start_prerender()
+
+
+def start_prerender():
+    """表示中のテクスチャの回転フレームを、レンダーループの空き時間に描画し始める (レンダースレッドで実行)"""
+    if rotation_cache is None or textures.resident is None:
+        return
+    key = textures.resident
+    rotations = [(axis, direction) for axis in rotation_axes for direction in (-1, 1)]
+    steps = rotation_cache.prerender(key, rotations, ROTATION_ANGLES, render_rotation_frame,
+                                     lambda: textures.resident == key)
+    scheduler.set_idle_task(lambda: next(steps, False) is not False)
+
+
+def frame_to_image(frame):
+    """draw_frame() の戻り値をRGBのPILイメージに変換する"""
+    if readback is not None:
+        return Image.fromarray(frame[::-1])
+    return frame.convert('RGB')
+
+
+def show_track(art):
+    """トラックのアルバムアートをテクスチャに設定して表示する (レンダースレッドで実行)"""
+    reset_rotation()
+    textures.set_tile(art)
+    if draw_frame() is None:
+        logger.error("Failed to get current panorama frame")
+    start_prerender()
+
+
+def show_blank():
+    """黒画面を表示する (レンダースレッドで実行)"""
+    reset_rotation()
+    led_matrix.clear()
+
+
+def process_track_message(message):
+    """トラック情報メッセージ (TrackMessage) を処理する関数"""
     try:
         # event情報を取得
-        event = message_data.get('event')
+        event = message.event
         logger.info(f"Processing track event: {event}")
         
         if event == "playing":
-            # Base64エンコードされた画像データを取得
-            image_data = message_data.get('image')
-            if not image_data:
+            # 画素はペイロードをそのまま参照する (Base64やPNGのデコードは不要)
+            art = pixels_to_array(message)
+            if art is None:
                 logger.error("No image data provided")
                 return
             
-            # Base64デコード
-            image_binary = base64.b64decode(image_data)
-            
-            # PILイメージに変換
-            img = Image.open(io.BytesIO(image_binary))
-            
-            # 必要に応じてリサイズ
-            if img.size[0] != 64 or img.size[1] != 64:
-                img = img.resize((64, 64), resample=Image.BICUBIC)
-            
-            # 画像を横に5回連結
-            concatenated_img = Image.new('RGBA', (img.width * 6, img.height))
-            for i in range(6):
-                concatenated_img.paste(img, (i * img.width, 0))
-            
-            # LEDマトリクスをクリア
-            matrix.Clear()
-            
-            renderer.set_panorama_texture(concatenated_img)
-            renderer.on_draw()  # FBOに描画
-            out_img = renderer.get_current_panorama_frame()
-            if out_img:
-                matrix.SetImage(out_img.convert("RGB"))
-            else:
-                logger.error("Failed to get current panorama frame")
-
-            # 画像を保存
-            current_display = concatenated_img.convert('RGB')
-            
+            # 描画はレンダーループで行う
+            submit_track(show_track, art)
 
         # elif event == "paused":
         #     logger.info("Track paused")
@@ -96,10 +386,9 @@ def process_track_message(message_data):
 
         elif event == "stopped":
             logger.info("Track stopped")
-            # マトリックスをクリア（黒画面表示）
-            matrix.Clear()
-            black_image = Image.new('RGB', (matrix.width, matrix.height), color=(0, 0, 0))
-            matrix.SetImage(black_image)
+            # 再生中の回転を止めてからマトリックスをクリア（黒画面表示）
+            scheduler.cancel_animations()
+            submit_track(show_blank)
             
             logger.info(f"Display {event}")
             
@@ -110,54 +399,210 @@ def process_track_message(message_data):
         logger.error(f"Error processing track message: {e}")
 
 
+def record_latency(trace):
+    """ビートのトレースを集計し、一定間隔で区間ごとの遅延をログに出す (レンダースレッドで実行)"""
+    global last_latency_log
+    latency_stats.record_trace(trace)
+    for stage, start, end in TRACE_STAGES:
+        if start in trace and end in trace:
+            beat_latency.labels(stage).observe(trace[end] - trace[start])
+    if time.monotonic() - last_latency_log >= config.LATENCY_LOG_INTERVAL:
+        logger.info(latency_stats.format())
+        last_latency_log = time.monotonic()
+
+
+def mark_presented(trace):
+    """最初のフレームを表示した時刻を trace に記録して遅延を集計する (以降は記録しないよう None を返す)"""
+    if trace is not None:
+        trace["presented"] = time.time()
+        record_latency(trace)
+    return None
+
+
+def rotation_animation(axis, direction, trace=None):
+    """キューブを90度回転させるアニメーション (1フレームごとにyieldする)
+
+    trace があれば、回転を始めた時刻と最初のフレームを表示した時刻を記録する。
+    途中でトラックが変わった (show_track() がテクスチャを差し替えた) 場合は、その時点で回転をやめる。
+    古いテクスチャの回転を新しいテクスチャの回転後の見た目として覚えないようにするため。
+    """
+    if trace is not None:
+        trace["started"] = time.time()
+
+    key = textures.resident
+    frames = rotation_cache.get(key, axis, direction) if rotation_cache is not None else None
+    if frames is not None:
+        # 事前に描画したフレームを再生する (GLの描画・読み出しなし)
+        for frame in frames:
+            if textures.resident != key:
+                return
+            present_frame(frame)
+            trace = mark_presented(trace)
+            yield
+        if textures.resident != key:
+            return
+        # 回転後のテクスチャもキャッシュの最終フレームから作れる
+        finish_rotation(axis, direction, lambda: frames[-1])
+        return
+
+    # キャッシュがまだなければその場で描画する
+    frame = None
+    for deg in ROTATION_ANGLES:
+        if textures.resident != key:
+            return
+        logger.debug(f"Rotating {axis} to {deg} degrees")
+        rotate_renderer(axis, deg * direction)
+        # PBOモードでは1つ前のフレームが表示される (最初のフレームでは何も表示されない)
+        presented = draw_frame(stream=True)
+        if presented is not None:
+            frame = presented
+            trace = mark_presented(trace)
+        yield
+
+    if textures.resident != key:
+        return
+    # PBOに残っている最終フレーム (回転し終えた姿勢) を表示する
+    presented = flush_frame()
+    if presented is not None:
+        frame = presented
+        mark_presented(trace)
+
+    if frame is not None:
+        finish_rotation(axis, direction, lambda: np.asarray(frame_to_image(frame)))
+    else:
+        start_prerender()
+
+
+def random_rotation(trace=None):
+    """ランダムな軸・向きの回転アニメーションを作る"""
+    axis = random.choice(rotation_axes)
+    direction = random.choice([-1, 1])
+    return rotation_animation(axis, direction, trace)
+
+
+def predicted_rotation(beat_time):
+    """予測したビートに合わせて先行して始める回転アニメーションを作る"""
+    global predicted_beat_played
+    predicted_beat_played = beat_time
+    return random_rotation()
+
+
 def process_beat_message(message_data):
-    """ビート検出メッセージを処理し、回転エフェクトを適用する関数"""
-    global current_deg, target_deg
+    """ビート検出メッセージを処理し、回転エフェクトをレンダーループに要求する関数"""
     try:
-        with rotation_lock:
-            beats = message_data.get('beats', {})
-            if beats.get('Bass'):
-                logger.info("Bass beat detected")
-                axis = random.choice([led_jukebox_renderer.RotationAxis.X, led_jukebox_renderer.RotationAxis.Y, led_jukebox_renderer.RotationAxis.Z])
-                direction = random.choice([-1, 1])
-                start_deg = 0
-                end_deg = 90
-                step = 5
-                interval = 0.01
-                deg = start_deg
-                while deg < end_deg:
-                    logger.debug(f"Rotating {axis} to {deg} degrees")
-                    deg = min(deg + step, end_deg)
-                    renderer.rotate(axis, deg * direction)
-                    renderer.on_draw()
-                    out_img = renderer.get_current_panorama_frame()
-                    if out_img:
-                        matrix.SetImage(out_img.convert("RGB"))
-                    current_deg = deg
-                    time.sleep(interval)
-
-                current_display = out_img.convert('RGB')
-                renderer.set_panorama_texture(current_display)
-                renderer.on_draw()
+        beats = message_data.get('beats', {})
+        if beats.get('Bass'):
+            logger.debug("Bass beat detected")
+            onset = message_data.get('onsets', {}).get('Bass', message_data.get('timestamp'))
+            if (predicted_beat_played is not None and onset is not None
+                    and abs(onset - predicted_beat_played) <= PREDICTED_BEAT_TOLERANCE):
+                # 予測で先に回転を始めたビートなので、二重に再生しない
+                logger.debug("Bass beat already played from tempo prediction")
+            else:
+                # 描画はレンダーループ側で行い、MQTTのスレッドはブロックしない
+                trace = message_data.get('trace')
+                scheduler.request_animation(lambda: random_rotation(trace))
+
+        tempo = message_data.get('tempo')
+        if BEAT_LEAD_TIME > 0 and tempo:
+            # 次の予測ビートの BEAT_LEAD_TIME 秒前に回転を始めるよう予約する
+            beat_time = tempo['next_beat']
+            scheduler.schedule_animation(lambda: predicted_rotation(beat_time), beat_time - BEAT_LEAD_TIME)
 
     except Exception as e:
         logger.error(f"Error processing beat message: {e}")
 
 
+def capture_profile(seconds=None):
+    """レンダースレッドの cProfile を seconds 秒間取り、PROFILE_DIR に保存する"""
+    seconds = seconds or config.PROFILE_CAPTURE_SECONDS
+    path = os.path.join(config.PROFILE_DIR, time.strftime("render-%Y%m%d-%H%M%S.pstats"))
+    profiler.capture_for(seconds, path, scheduler.submit)
+
+
+def process_control_message(message_data):
+    """プロファイルの制御メッセージを処理する
+
+    {"stages": true/false} で段階ごとの計測を切り替え、{"capture": 秒数} で cProfile を取る。
+    """
+    try:
+        if 'stages' in message_data:
+            scheduler.submit(profiler.enable if message_data['stages'] else profiler.disable)
+        if message_data.get('capture'):
+            capture_profile(float(message_data['capture']))
+    except Exception as e:
+        logger.error(f"Error processing control message: {e}")
+
+
+def first_delivery(trace_id):
+    """このトレースIDのビートを初めて受け取ったなら True を返す"""
+    if trace_id is None:
+        return True
+    with recent_trace_lock:
+        if trace_id in recent_trace_ids:
+            return False
+        recent_trace_ids.append(trace_id)
+        return True
+
+
+def receive_beat(payload):
+    """ビートのJSONメッセージを受け取って処理する (MQTTと直接の経路のどちらからも呼ばれる)"""
+    received_at = time.time()
+    message_data = json.loads(payload)
+    trace = message_data.get('trace')
+    if trace is not None:
+        if not first_delivery(trace.get('id')):
+            duplicate_beats.inc()
+            return
+        trace['received'] = received_at
+    process_beat_message(message_data)
+
+
+def serve_fast_path():
+    """直接の経路でビートを受け取り続ける (バックグラウンドスレッドで実行)"""
+    while True:
+        try:
+            data = fast_path_socket.recv(65536)
+        except OSError:
+            break
+        messages_received.labels(FAST_PATH_LABEL).inc()
+        try:
+            receive_beat(data)
+        except Exception as e:
+            logger.error(f"Error handling direct beat message: {e}")
+
+
+def start_fast_path():
+    """beats_publisher からブローカーを経由せずにビートを受け取る経路を開く"""
+    global fast_path_socket
+    try:
+        fast_path_socket = bind_datagram_socket(config.BEATS_SOCKET_PATH)
+    except OSError as e:
+        logger.warning(f"Could not open direct beat socket {config.BEATS_SOCKET_PATH}, using MQTT only: {e}")
+        return
+    threading.Thread(target=serve_fast_path, name="beats-fast-path", daemon=True).start()
+    logger.info(f"Receiving beats directly at {config.BEATS_SOCKET_PATH}")
+
+
 def on_connect(client, userdata, flags, rc, properties=None):
     """MQTTブローカーに接続した際のコールバック"""
     if rc == 0:
         logger.info("Connected to MQTT broker")
+        mark_startup("mqtt connected")
         
         # トラック情報トピックをサブスクライブ
         track_topic = f"{config.MQTT_TOPIC_BASE}/track"
-        client.subscribe(track_topic)
+        client.subscribe(track_topic, qos=config.MQTT_TRACK_QOS)
         logger.info(f"Subscribed to topic: {track_topic}")
         
         # ビート情報トピックをサブスクライブ
         beat_topic = f"{config.MQTT_TOPIC_BASE}/beats"
         client.subscribe(beat_topic)
         logger.info(f"Subscribed to topic: {beat_topic}")
+
+        # プロファイルの制御トピックをサブスクライブ
+        client.subscribe(CONTROL_TOPIC)
+        logger.info(f"Subscribed to topic: {CONTROL_TOPIC}")
         
     else:
         logger.error(f"Failed to connect to MQTT broker with code: {rc}")
@@ -165,16 +610,27 @@ def on_connect(client, userdata, flags, rc, properties=None):
 def on_message(client, userdata, msg):
     """MQTTメッセージを受信した際のコールバック"""
     try:
-        # JSONメッセージをデコード
-        payload = msg.payload.decode('utf-8')
-        message_data = json.loads(payload)
-        logger.info(f"Received message on topic {msg.topic}")
+        logger.debug(f"Received message on topic {msg.topic}")
+        messages_received.labels(msg.topic).inc()
         
         # トピックに応じて処理を分岐
         if msg.topic == f"{config.MQTT_TOPIC_BASE}/track":
-            process_track_message(message_data)
+            # トラック情報はバイナリ形式 (modules/track_message.py)
+            if not is_track_message(msg.payload):
+                # 以前のJSON形式で保持されたメッセージなどは表示しない
+                logger.warning(f"Ignoring non-binary track message ({len(msg.payload)} bytes"
+                               f"{', retained' if msg.retain else ''})")
+                return
+            message = decode_track_message(msg.payload)
+            if msg.retain:
+                # 起動 (再接続) 直後にブローカーが保持していた現在の表示
+                logger.info(f"Restoring retained track state: {message.event}")
+            process_track_message(message)
         elif msg.topic == f"{config.MQTT_TOPIC_BASE}/beats":
-            process_beat_message(message_data)
+            # JSONメッセージ (直接の経路で先に届いていれば捨てる)
+            receive_beat(msg.payload)
+        elif msg.topic == CONTROL_TOPIC:
+            process_control_message(json.loads(msg.payload))
         else:
             logger.warning(f"Received message on unknown topic: {msg.topic}")
             
@@ -204,10 +660,21 @@ def signal_handler(sig, frame):
     """シグナルハンドラ関数"""
     global mqtt_client
     logger.info("Shutting down...")
+
+    # レンダーループを停止し、取得中のプロファイルがあれば保存する
+    scheduler.stop()
+    profiler.stop_capture()
         
-    # マトリックスをクリア
-    matrix.Clear()
+    # マトリックスをクリア (初期化の途中で止めた場合はまだない)
+    if led_matrix is not None:
+        led_matrix.matrix.Clear()
     
+    # 直接の経路のソケットを閉じる
+    if fast_path_socket is not None:
+        fast_path_socket.close()
+        if os.path.exists(config.BEATS_SOCKET_PATH):
+            os.unlink(config.BEATS_SOCKET_PATH)
+
     # MQTTクライアントを停止
     if mqtt_client:
         mqtt_client.loop_stop()
@@ -222,18 +689,34 @@ def main():
     # シグナルハンドラをセットアップ
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
+    # SIGUSR1: 段階ごとの計測の切り替え, SIGUSR2: cProfile の取得 (再起動せずに調べる)
+    signal.signal(signal.SIGUSR1, lambda sig, frame: scheduler.submit(profiler.toggle))
+    signal.signal(signal.SIGUSR2, lambda sig, frame: capture_profile())
     
     # MQTTクライアントを初期化
-    mqtt_client = setup_mqtt_client()
+    # 表示系の初期化より先に受信を始め、その間に届いたトラックは保持しておく
+    mqtt_client = timed_phase("mqtt", setup_mqtt_client)
     if not mqtt_client:
         logger.error("Failed to setup MQTT client. Exiting.")
         return
-    
+    # MQTTの受信はバックグラウンドスレッドで行う
+    mqtt_client.loop_start()
+    if config.BEATS_FAST_PATH:
+        start_fast_path()
+    metrics.start_http_server(config.LED_METRICS_PORT, config.METRICS_HOST)
+
+    try:
+        start_display()
+    except Exception as e:
+        logger.error(f"Matrix initialization error: {e}")
+        mqtt_client.loop_stop()
+        sys.exit(1)
+
     logger.info("Starting LED subscriber...")
     
     try:
-        # メインループ開始
-        mqtt_client.loop_forever()
+        # メインスレッド (OpenGLコンテキストを作成したスレッド) でレンダーループを回す
+        scheduler.run()
     except KeyboardInterrupt:
         signal_handler(None, None)
     except Exception as e:
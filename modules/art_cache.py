@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path, data):
+    """一時ファイルに書き込んでから置き換え、書きかけのファイルが読まれないようにする"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ArtCache:
+    """リサイズ済みのアルバムアート (RGBのビットマップ) をディスクに保存するキャッシュ
+
+    ビットマップは内容のハッシュを名前にして blobs/ に1つずつ保存し、
+    トラックIDとアルバムIDからハッシュへの対応を index.json に持つ。
+    同じアルバムのトラックは1つのビットマップを共有する。
+    合計サイズが max_bytes を超えたら、最後に使われた時刻 (ファイルの更新時刻) が古いものから削除する。
+    """
+
+    def __init__(self, directory, max_bytes=32 * 1024 * 1024):
+        """
+        Args:
+            directory: キャッシュを置くディレクトリ
+            max_bytes: ビットマップの合計サイズの上限
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(directory, "blobs")
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._tracks, self._albums = self._load_index()
+        # ハッシュ → [サイズ, 最終使用時刻]
+        self._blobs = {}
+        for name in os.listdir(self.blob_dir):
+            if name.endswith(".rgb"):
+                stat = os.stat(os.path.join(self.blob_dir, name))
+                self._blobs[name[:-4]] = [stat.st_size, stat.st_mtime]
+        self._total_bytes = sum(size for size, _ in self._blobs.values())
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            return index.get("tracks", {}), index.get("albums", {})
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring broken art cache index: {e}")
+            return {}, {}
+
+    def _save_index(self):
+        data = json.dumps({"tracks": self._tracks, "albums": self._albums}).encode("utf-8")
+        atomic_write(self.index_path, data)
+
+    def _blob_path(self, key):
+        return os.path.join(self.blob_dir, key + ".rgb")
+
+    def _read_blob(self, key):
+        """ビットマップを読み込み、最終使用時刻を更新する (失われていればNone)"""
+        path = self._blob_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            self._forget(key)
+            return None
+        if key in self._blobs:
+            self._blobs[key][1] = now
+        return data
+
+    def _forget(self, key):
+        """ビットマップとそれを指す対応を削除する"""
+        entry = self._blobs.pop(key, None)
+        if entry:
+            self._total_bytes -= entry[0]
+        for aliases in (self._tracks, self._albums):
+            for alias in [alias for alias, value in aliases.items() if value == key]:
+                del aliases[alias]
+
+    def get(self, track_id=None, album_id=None):
+        """トラックID、なければアルバムIDでビットマップを探す (見つからなければNone)
+
+        アルバムIDで見つかった場合は、次からトラックIDだけで引けるよう対応を追加する。
+        """
+        with self._lock:
+            key = self._tracks.get(track_id) if track_id else None
+            if key is None and album_id:
+                key = self._albums.get(album_id)
+                if key is not None and track_id:
+                    self._tracks[track_id] = key
+                    self._save_index()
+            if key is None:
+                return None
+            data = self._read_blob(key)
+            if data is None:
+                self._save_index()
+            return data
+
+    def put(self, data, track_id=None, album_id=None):
+        """ビットマップを保存してトラックID・アルバムIDを対応付け、ハッシュを返す"""
+        key = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            if key not in self._blobs:
+                atomic_write(self._blob_path(key), data)
+                self._blobs[key] = [len(data), time.time()]
+                self._total_bytes += len(data)
+            if track_id:
+                self._tracks[track_id] = key
+            if album_id:
+                self._albums[album_id] = key
+            self._evict(keep=key)
+            self._save_index()
+        return key
+
+    def _evict(self, keep=None):
+        """合計サイズが上限に収まるまで古いビットマップを削除する"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._blobs.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.unlink(self._blob_path(key))
+            except OSError:
+                pass
+            self._forget(key)
+            logger.debug(f"Evicted album art {key}")
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._blobs)
@@ -1,9 +1,79 @@
-import sounddevice as sd
 import numpy as np
-import queue
 import sys
+import threading
 import time
-from collections import deque
+
+from modules.beat_detectors import create_detector, TempoTracker
+
+
+class AudioBlockRing:
+    """固定容量のオーディオブロック用リングバッファ
+
+    ブロック用の領域は最初に確保し、書き込み時にはメモリ確保を行わない。
+    満杯のときは最も古いブロックを捨てて (オーバーラン) 最新の音声を優先する。
+    """
+
+    def __init__(self, capacity, block_size, channels, dtype=np.float32):
+        """
+        Args:
+            capacity: 保持できるブロック数
+            block_size: 1ブロックのサンプル数
+            channels: チャネル数
+            dtype: サンプルのデータ型
+        """
+        self.capacity = capacity
+        self.block_size = block_size
+        self._blocks = np.zeros((capacity, block_size, channels), dtype=dtype)
+        self._read_pos = 0
+        self._count = 0
+        self._cond = threading.Condition()
+
+        # 統計情報
+        self.overruns = 0
+        self.max_depth = 0
+        self.total_blocks = 0
+
+    @property
+    def depth(self):
+        """現在キューに溜まっているブロック数"""
+        return self._count
+
+    def put(self, block):
+        """ブロックを書き込む (満杯なら最も古いブロックを捨てる)"""
+        with self._cond:
+            if self._count == self.capacity:
+                self._read_pos = (self._read_pos + 1) % self.capacity
+                self._count -= 1
+                self.overruns += 1
+
+            slot = self._blocks[(self._read_pos + self._count) % self.capacity]
+            frames = min(len(block), self.block_size)
+            slot[:frames] = block[:frames]
+            if frames < self.block_size:
+                slot[frames:] = 0
+
+            self._count += 1
+            self.total_blocks += 1
+            if self._count > self.max_depth:
+                self.max_depth = self._count
+            self._cond.notify()
+
+    def get(self, out, timeout=None):
+        """最も古いブロックを out にコピーして取り出す。timeout 内に届かなければFalseを返す"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._count > 0, timeout):
+                return False
+            np.copyto(out, self._blocks[self._read_pos])
+            self._read_pos = (self._read_pos + 1) % self.capacity
+            self._count -= 1
+            return True
+
+    def clear(self):
+        """溜まっているブロックを捨てる"""
+        with self._cond:
+            self._read_pos = 0
+            self._count = 0
+
 
 class AudioReactor:
     """音声からビートを検出するためのクラス"""
@@ -17,7 +87,13 @@ class AudioReactor:
                  history_len=15,
                  threshold_ratio=None,
                  min_energy_threshold=None,
-                 cooldown_blocks=None):
+                 cooldown_blocks=None,
+                 log_beats=True,
+                 queue_capacity=4,
+                 fft_size=None,
+                 hop_size=None,
+                 detector="energy",
+                 tempo_band=None):
         """
         AudioReactorの初期化
         
@@ -31,6 +107,13 @@ class AudioReactor:
             threshold_ratio: 閾値比率辞書 {'名前': 比率}
             min_energy_threshold: 最小エネルギー閾値辞書 {'名前': 閾値}
             cooldown_blocks: クールダウンブロック数辞書 {'名前': ブロック数}
+            log_beats: ビート検出ごとにログを出力するかどうか
+            queue_capacity: 音声ブロックキューの容量 (ブロック数)。溢れたら古いものから捨てる
+            fft_size: FFTの窓長 (サンプル数)。省略時はブロックサイズ
+            hop_size: 解析フレームの間隔 (サンプル数)。省略時はブロックサイズ
+                (history_len と cooldown_blocks はブロック単位のまま指定し、内部で時間が同じになるフレーム数に換算する)
+            detector: ビート検出エンジン ("energy", "flux" または BeatDetector のインスタンス)
+            tempo_band: 指定した帯域のオンセットからテンポを推定し、次のビートを予測する
         """
         # オーディオ設定
         self.device_name = device_name
@@ -39,6 +122,12 @@ class AudioReactor:
         self.block_duration_ms = block_duration_ms
         self.block_size = int(self.sample_rate * self.block_duration_ms / 1000)
         
+        # 解析フレームの設定 (デフォルトはブロックごとに重なりなしで解析)
+        self.fft_size = fft_size or self.block_size
+        self.hop_size = hop_size or self.block_size
+        if self.hop_size > self.fft_size:
+            raise ValueError("hop_size must not be larger than fft_size")
+        
         # 周波数帯域の設定（デフォルト値またはカスタム値）
         self.freq_bands = freq_bands or {
             "Bass":   (50, 100),     # 低域 (キックなど)
@@ -46,32 +135,43 @@ class AudioReactor:
             "Treble": (4000, 10000), # 高域 (ハイハット、シンバルなど)
         }
         
-        # ビート検出パラメータ
+        # ビート検出パラメータ (指定された帯域だけデフォルト値を上書きする)
         self.history_len = history_len
-        self.threshold_ratio = threshold_ratio or {
+        self.threshold_ratio = {
             "Bass":   2.0,
             "Mid":    2.5,
             "Treble": 3.0,
+            **(threshold_ratio or {}),
         }
-        self.min_energy_threshold = min_energy_threshold or {
+        self.min_energy_threshold = {
             "Bass":   1e-2,
             "Mid":    5e-7,
             "Treble": 1e-7,
+            **(min_energy_threshold or {}),
         }
-        self.cooldown_blocks = cooldown_blocks or {
+        self.cooldown_blocks = {
             "Bass":   4,
             "Mid":    3,
             "Treble": 2,
+            **(cooldown_blocks or {}),
         }
         
+        self.log_beats = log_beats
+        self.detector = create_detector(detector)
+        self.tempo_band = tempo_band
+        self.tempo = TempoTracker() if tempo_band else None
+        
         # ストリーム制御
         self.stream = None
         self.is_running = False
+        self.on_beats = None
+        # コールバックモードでの detect_beats() の所要時間 (秒) を受け取る関数 (メトリクス用)
+        self.on_detect_time = None
         
-        # データキューとビート検出状態の初期化
-        self.q = queue.Queue()
-        self.energy_histories = {}
-        self.beat_cooldown_counters = {}
+        # データキュー (事前確保したリングバッファ) とビート検出状態の初期化
+        self.ring = AudioBlockRing(queue_capacity, self.block_size, self.channels)
+        self._chunk = np.zeros((self.block_size, self.channels), dtype=np.float32)
+        self.input_overflows = 0
         self.band_indices = {}
         self.valid_bands = {}
         
@@ -85,7 +185,7 @@ class AudioReactor:
         """FFT関連の前計算を行う"""
         try:
             # FFT結果の各ビンに対応する周波数リスト
-            self.freqs = np.fft.rfftfreq(self.block_size, 1.0 / self.sample_rate)
+            self.freqs = np.fft.rfftfreq(self.fft_size, 1.0 / self.sample_rate)
             
             # 各帯域に対応するFFTインデックスを事前に計算
             print("--- Frequency Band Setup ---")
@@ -115,85 +215,194 @@ class AudioReactor:
             raise
     
     def _initialize_histories(self):
-        """各帯域のエネルギー履歴とクールダウンカウンターを初期化"""
-        self.energy_histories = {name: deque(maxlen=self.history_len) for name in self.freq_bands.keys()}
-        self.beat_cooldown_counters = {name: 0 for name in self.freq_bands.keys()}
-        
-        # 各帯域の履歴をゼロで初期化
-        for name in self.freq_bands.keys():
-            for _ in range(self.history_len):
-                self.energy_histories[name].append(0.0)
+        """検出処理用の作業バッファを用意し、ビート検出エンジンを初期化"""
+        self.band_names = list(self.freq_bands.keys())
+        n_bands = len(self.band_names)
+        n_bins = len(self.freqs)
+
+        # ブロック単位のパラメータを解析フレーム単位に換算する
+        frames_per_block = self.block_size / self.hop_size
+        self.history_frames = max(1, round(self.history_len * frames_per_block))
+        self.cooldown_frames = np.array([int(np.ceil(self.cooldown_blocks[name] * frames_per_block))
+                                         for name in self.band_names], dtype=np.int64)
+
+        # ハニング窓 (モノラル化の 1/channels もここに含めておく)
+        self._window = np.hanning(self.fft_size) / self.channels
+
+        # 帯域ごとの振幅を合計する行列 (各行が1帯域の連続したビン範囲)
+        self.band_matrix = np.zeros((n_bands, n_bins))
+        for i, name in enumerate(self.band_names):
+            indices = self.band_indices[name]
+            self.band_matrix[i, indices[0]:indices[-1] + 1] = 1.0
+
+        # モノラル音声のスライディングバッファ (直近 fft_size + block_size サンプル)
+        # ずらす際に重なったコピーで一時配列が作られないよう、2つを交互に使う
+        self._samples = np.zeros(self.fft_size + self.block_size)
+        self._samples_back = np.zeros_like(self._samples)
+        self._sample_count = 0  # これまでに受け取った総サンプル数
+
+        # 毎ブロック使い回す作業バッファ (1ブロックで最大 max_frames フレームを解析する)
+        max_frames = -(-self.block_size // self.hop_size) + 1
+        self._frame_starts = np.zeros(max_frames, dtype=np.intp)
+        self._frames = np.zeros((max_frames, self.fft_size))
+        self._spectrum = np.zeros((max_frames, n_bins), dtype=np.complex128)
+        self._amplitude = np.zeros((max_frames, n_bins))
+        self._energies = np.zeros((max_frames, n_bands))
+        self._mask = np.zeros(n_bands, dtype=bool)
+        self._detected = np.zeros(n_bands, dtype=bool)
+        self._onset_offsets = np.zeros(n_bands, dtype=np.int64)
+
+        self._tempo_index = self.band_names.index(self.tempo_band) if self.tempo is not None else None
+        self.detector.setup(self)
     
-    def audio_callback(self, indata, frames, time, status):
-        """オーディオ入力コールバック関数: 音声データをキューに入れる"""
+    def audio_callback(self, indata, frames, time_info, status):
+        """オーディオ入力コールバック関数
+
+        on_beats が設定されていればこのスレッドでそのままビート検出を行って結果を渡し、
+        そうでなければ音声データをリングバッファに書き込む。
+        """
         if status:
+            if status.input_overflow:
+                self.input_overflows += 1
             print(status, file=sys.stderr)
-        self.q.put(indata.copy())
+
+        if self.on_beats is None:
+            self.ring.put(indata)
+            return
+
+        captured_at = time.time()
+        try:
+            started = time.perf_counter()
+            detected_beats = self.detect_beats(indata)
+            if self.on_detect_time is not None:
+                self.on_detect_time(time.perf_counter() - started)
+            if any(detected_beats.values()):
+                self.on_beats(detected_beats, captured_at, self.onset_times(captured_at))
+        except Exception as e:
+            # 例外でストリームが止まらないようにする
+            print(f"Error in beat callback: {e}", file=sys.stderr)
     
     def detect_beats(self, audio_chunk):
-        """音声チャンクから各周波数帯域のビート(エネルギー上昇)を検出する関数"""
+        """音声チャンクから各周波数帯域のビート(エネルギー上昇)を検出する関数
+
+        スライディングバッファ上で hop_size ごとに fft_size の窓をとり、
+        このチャンクで完成した全フレームのFFTをまとめて計算する (STFT)。
+        作業バッファはすべて事前に確保したものを使い、全帯域の判定を配列演算で行う。
+        各帯域のビートを検出したフレームの位置は onset_times() で取得できる。
+        """
+        block_size = self.block_size
+        if audio_chunk.shape[0] != block_size:
+            raise ValueError(f"Expected {block_size} frames, got {audio_chunk.shape[0]}")
+
+        # --- 1. スライディングバッファの更新 ---
+        # 古いサンプルを前に詰め、チャネルを合計したモノラル音声を末尾に書き込む
+        samples = self._samples_back
+        np.copyto(samples[:-block_size], self._samples[block_size:])
+        np.sum(audio_chunk, axis=1, out=samples[-block_size:])
+        self._samples, self._samples_back = samples, self._samples
+        prev_count = self._sample_count
+        self._sample_count += block_size
+
+        # このチャンクで終端を迎えるフレーム (終端位置が hop_size の倍数) の開始位置を求める
+        first_end = (prev_count // self.hop_size + 1) * self.hop_size
+        n_frames = 0
+        for frame_end in range(first_end, self._sample_count + 1, self.hop_size):
+            self._frame_starts[n_frames] = len(samples) - (self._sample_count - frame_end) - self.fft_size
+            n_frames += 1
+
+        self._detected[:] = False
+        if n_frames == 0:
+            return {name: False for name in self.band_names}
+
+        # --- 2. STFT (全フレーム・全帯域まとめて) ---
+        frames = self._frames[:n_frames]
+        starts = self._frame_starts[:n_frames]
+        for i in range(n_frames):
+            np.copyto(frames[i], samples[starts[i]:starts[i] + self.fft_size])
+        np.multiply(frames, self._window, out=frames)
+        np.fft.rfft(frames, axis=1, out=self._spectrum[:n_frames])
+        np.abs(self._spectrum[:n_frames], out=self._amplitude[:n_frames])
+
+        # 各フレーム・各帯域のエネルギー (振幅の合計)
+        energies = self._energies[:n_frames]
+        np.matmul(self._amplitude[:n_frames], self.band_matrix.T, out=energies)
+
+        # --- 3. フレームごとにビート判定 (判定方法は検出エンジンによる) ---
+        chunk_start = len(samples) - block_size
+        for i in range(n_frames):
+            hits = self.detector.process(self._amplitude[i], energies[i])
+            # 初めて検出したフレームについて、最新ホップの先頭位置 (チャンク先頭からのサンプル数) を記録
+            onset_offset = starts[i] + self.fft_size - self.hop_size - chunk_start
+            np.logical_and(hits, ~self._detected, out=self._mask)
+            np.copyto(self._onset_offsets, onset_offset, where=self._mask)
+            np.logical_or(self._detected, hits, out=self._detected)
+            if self._tempo_index is not None and hits[self._tempo_index]:
+                # テンポ推定はストリーム先頭からのサンプル時刻で行う
+                self.tempo.add_onset((prev_count + onset_offset) / self.sample_rate)
+
         # 検出結果を格納する辞書 (例: {"Bass": True, "Mid": False, ...})
-        detected_beats = {name: False for name in self.freq_bands.keys()}
-        
-        # --- 1. FFT 計算 (全帯域共通) ---
-        # ステレオの場合はモノラルに変換
-        if self.channels > 1:
-            mono_chunk = np.mean(audio_chunk, axis=1)
-        else:
-            mono_chunk = audio_chunk[:, 0]
-        
-        # ハニング窓を適用
-        window = np.hanning(len(mono_chunk))
-        mono_chunk_windowed = mono_chunk * window
-        
-        # FFT を実行し、振幅スペクトルを取得
-        fft_result = np.fft.rfft(mono_chunk_windowed)
-        amplitude_spectrum = np.abs(fft_result)
-        
-        # --- 2 & 3. 各帯域でエネルギー計算と比較、判定 ---
-        for name in self.freq_bands.keys():
-            # この帯域に対応するインデックスを取得
-            indices = self.band_indices[name]
-            
-            # この帯域のエネルギーを計算 (振幅の合計)
-            current_band_energy = np.sum(amplitude_spectrum[indices])
-            
-            # 履歴と比較してビート判定
-            avg_energy = 0.0
-            # 履歴が十分溜まっていれば平均を計算
-            if len(self.energy_histories[name]) == self.history_len:
-                avg_energy = np.mean(self.energy_histories[name])
-            
-            # ビート判定ロジック
-            if self.beat_cooldown_counters[name] == 0 and \
-               len(self.energy_histories[name]) == self.history_len and \
-               current_band_energy > avg_energy * self.threshold_ratio[name] and \
-               current_band_energy > self.min_energy_threshold[name]:
-                
-                detected_beats[name] = True # この帯域でビート検出
-                self.beat_cooldown_counters[name] = self.cooldown_blocks[name] # クールダウン開始
-                
+        detected_beats = {}
+        for i, name in enumerate(self.band_names):
+            detected = bool(self._detected[i])
+            detected_beats[name] = detected
+            if detected and self.log_beats:
                 # ビート検出時のログ
-                print(f"Beat ({name:>6s})! E:{current_band_energy:.3f}")
-                
-            # 履歴を更新
-            self.energy_histories[name].append(current_band_energy)
-            
-            # クールダウンカウンターを減らす
-            if self.beat_cooldown_counters[name] > 0:
-                self.beat_cooldown_counters[name] -= 1
-        
+                print(f"Beat ({name:>6s})! E:{energies[:, i].max():.3f}")
+
         return detected_beats
+
+    def onset_offsets(self):
+        """直前の detect_beats() で検出した帯域ごとの、オンセット位置 (チャンク先頭からの秒数) を返す"""
+        return {name: float(self._onset_offsets[i]) / self.sample_rate
+                for i, name in enumerate(self.band_names) if self._detected[i]}
+
+    def onset_times(self, captured_at):
+        """直前の detect_beats() で検出したビートのオンセット時刻を返す
+
+        Args:
+            captured_at: チャンクを受け取った時刻 (チャンクの末尾の時刻とみなす)
+        """
+        chunk_start = captured_at - self.block_size / self.sample_rate
+        return {name: chunk_start + offset for name, offset in self.onset_offsets().items()}
+
+    def tempo_prediction(self, captured_at, min_confidence=0.5):
+        """テンポ推定が十分に安定していれば、次のビートの予測を辞書で返す
+
+        Args:
+            captured_at: 直前のチャンクを受け取った時刻 (ストリーム時刻を実時刻に換算するのに使う)
+            min_confidence: 予測を返すのに必要な信頼度
+        """
+        if self.tempo is None or self.tempo.confidence < min_confidence:
+            return None
+        stream_now = self._sample_count / self.sample_rate
+        next_beat = self.tempo.next_beat(stream_now)
+        if next_beat is None:
+            return None
+        return {
+            "bpm": float(self.tempo.bpm),
+            "confidence": float(self.tempo.confidence),
+            "next_beat": float(captured_at + (next_beat - stream_now)),
+        }
     
-    def start(self):
-        """オーディオストリームを開始する"""
+    def start(self, on_beats=None):
+        """オーディオストリームを開始する
+
+        Args:
+            on_beats: 指定した場合はオーディオスレッド上でブロックが届くたびにビート検出を行い、
+                ビートがあれば on_beats(検出結果の辞書, 取得時刻, 帯域ごとのオンセット時刻) を呼ぶ
+        """
         if self.is_running:
             print("AudioReactor is already running")
             return False
         
         try:
+            # サウンドデバイスのない環境 (オフライン解析など) でも使えるよう、ここで読み込む
+            import sounddevice as sd
+
             print(f"Attempting to use input device: {self.device_name}")
             print(f"Sample Rate: {self.sample_rate}, Channels: {self.channels}, Block Size: {self.block_size}")
+            self.on_beats = on_beats
+            self.ring.clear()
             
             self.stream = sd.InputStream(
                 device=self.device_name,
@@ -212,6 +421,7 @@ class AudioReactor:
             if "Invalid device" in str(e) or "No such device" in str(e) or "Device unavailable" in str(e):
                 print(f"Audio device '{self.device_name}' not found or unavailable")
                 try:
+                    import sounddevice as sd
                     devices_info = sd.query_devices()
                     print("Available audio devices:")
                     for i, dev in enumerate(devices_info):
@@ -238,8 +448,21 @@ class AudioReactor:
         print("AudioReactor stopped")
     
     def get_audio_chunk(self, timeout=0.1):
-        """キューから音声チャンクを取得する"""
-        try:
-            return self.q.get(timeout=timeout)
-        except queue.Empty:
-            return None
\ No newline at end of file
+        """キューから音声チャンクを取得する
+
+        返す配列は毎回同じバッファを使い回すため、次の呼び出しまでに処理を終えること。
+        """
+        if self.ring.get(self._chunk, timeout=timeout):
+            return self._chunk
+        return None
+
+    def chunks(self, timeout=0.5):
+        """ストリームの実行中、届いた音声チャンクを順に返すイテレータ
+
+        ブロックが届いた時点で待機から復帰するため、ポーリングによる遅延は生じない。
+        timeout は停止を確認する間隔 (秒)。返す配列は get_audio_chunk() と同じく使い回される。
+        """
+        while self.is_running:
+            chunk = self.get_audio_chunk(timeout=timeout)
+            if chunk is not None:
+                yield chunk
\ No newline at end of file
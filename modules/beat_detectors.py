@@ -0,0 +1,261 @@
+import numpy as np
+
+
+class BeatDetector:
+    """AudioReactor のビート検出エンジンの基底クラス
+
+    setup() で AudioReactor の帯域構成や解析フレームの設定を受け取り、
+    process() を解析フレームごとに呼び出す。process() はビートを検出した帯域を
+    True とする bool 配列 (帯域の並びは reactor.band_names) を返す。
+    """
+
+    name = None
+
+    def setup(self, reactor):
+        raise NotImplementedError
+
+    def process(self, amplitude, energies):
+        """
+        Args:
+            amplitude: このフレームの振幅スペクトル
+            energies: このフレームの帯域ごとのエネルギー (振幅の合計)
+        """
+        raise NotImplementedError
+
+
+class EnergyDetector(BeatDetector):
+    """帯域エネルギーが直近の平均 × 比率を超えたらビートとする検出器 (従来の方式)"""
+
+    name = "energy"
+
+    def setup(self, reactor):
+        band_names = reactor.band_names
+        n_bands = len(band_names)
+        self.history_frames = reactor.history_frames
+
+        # 帯域ごとのパラメータ配列
+        # (窓長が長いほど帯域の振幅の合計は大きくなるので、最小エネルギー閾値も比例させる)
+        energy_scale = reactor.fft_size / reactor.block_size
+        self._threshold_scale = np.array([reactor.threshold_ratio[name] for name in band_names]) / self.history_frames
+        self._min_energy = np.array([reactor.min_energy_threshold[name] for name in band_names]) * energy_scale
+        self._cooldown_frames = reactor.cooldown_frames
+
+        # エネルギー履歴のリングバッファ (ゼロで初期化) と、その合計
+        self._history = np.zeros((n_bands, self.history_frames))
+        self._history_sum = np.zeros(n_bands)
+        self._history_pos = 0
+        self._cooldowns = np.zeros(n_bands, dtype=np.int64)
+
+        # 作業バッファ
+        self._threshold = np.zeros(n_bands)
+        self._delta = np.zeros(n_bands)
+        self._hits = np.zeros(n_bands, dtype=bool)
+        self._mask = np.zeros(n_bands, dtype=bool)
+
+    def process(self, amplitude, energies):
+        # 閾値 = 履歴の平均 × 比率
+        np.multiply(self._history_sum, self._threshold_scale, out=self._threshold)
+        hits = self._hits
+        np.greater(energies, self._threshold, out=hits)
+        np.greater(energies, self._min_energy, out=self._mask)
+        np.logical_and(hits, self._mask, out=hits)
+        np.equal(self._cooldowns, 0, out=self._mask)
+        np.logical_and(hits, self._mask, out=hits)
+
+        # クールダウン開始
+        np.copyto(self._cooldowns, self._cooldown_frames, where=hits)
+
+        # 履歴を更新 (最も古い値と入れ替えて合計を差分更新する)
+        oldest = self._history[:, self._history_pos]
+        np.subtract(energies, oldest, out=self._delta)
+        np.add(self._history_sum, self._delta, out=self._history_sum)
+        np.copyto(oldest, energies)
+        self._history_pos = (self._history_pos + 1) % self.history_frames
+        if self._history_pos == 0:
+            # 浮動小数点の誤差が溜まらないよう、1周ごとに合計を計算し直す
+            np.sum(self._history, axis=1, out=self._history_sum)
+
+        # クールダウンカウンターを減らす
+        np.subtract(self._cooldowns, 1, out=self._cooldowns)
+        np.maximum(self._cooldowns, 0, out=self._cooldowns)
+        return hits
+
+
+class SpectralFluxDetector(BeatDetector):
+    """半波整流したスペクトルフラックスと適応閾値によるオンセット検出器
+
+    対数圧縮した振幅スペクトルの、前フレームからの増加分だけを帯域ごとに合計し (フラックス)、
+    直近のフラックスの平均 × 比率 + 帯域のビン数 × delta を超えて上昇したフレームをオンセットとする。
+    エネルギーの絶対量ではなく立ち上がりを見るため、小さな音のアタックも拾いやすい。
+    """
+
+    name = "flux"
+
+    def __init__(self, flux_ratio=None, delta=0.1, compression=1000.0):
+        """
+        Args:
+            flux_ratio: 帯域ごとの閾値比率辞書 {'名前': 比率}
+            delta: 閾値に加えるビン1つあたりのフラックス量
+            compression: 対数圧縮 log(1 + compression * 振幅) の係数
+        """
+        self.flux_ratio = flux_ratio or {}
+        self.delta = delta
+        self.compression = compression
+
+    def setup(self, reactor):
+        band_names = reactor.band_names
+        n_bands = len(band_names)
+        n_bins = len(reactor.freqs)
+        self.history_frames = reactor.history_frames
+        self._band_matrix = reactor.band_matrix
+
+        # 窓関数の合計で割って振幅を窓長に依存しない大きさにそろえ、対数圧縮の係数を掛ける
+        self._amplitude_scale = self.compression * reactor.channels / np.sum(np.hanning(reactor.fft_size))
+        self._threshold_scale = np.array([self.flux_ratio.get(name, 1.5) for name in band_names]) / self.history_frames
+        self._threshold_offset = self.delta * np.sum(self._band_matrix, axis=1)
+        self._cooldown_frames = reactor.cooldown_frames
+
+        # フラックス履歴のリングバッファとその合計
+        self._history = np.zeros((n_bands, self.history_frames))
+        self._history_sum = np.zeros(n_bands)
+        self._history_pos = 0
+        self._cooldowns = np.zeros(n_bands, dtype=np.int64)
+
+        # 作業バッファ
+        self._log_amplitude = np.zeros(n_bins)
+        self._prev_log_amplitude = np.zeros(n_bins)
+        self._diff = np.zeros(n_bins)
+        self._flux = np.zeros(n_bands)
+        self._prev_flux = np.zeros(n_bands)
+        self._threshold = np.zeros(n_bands)
+        self._delta = np.zeros(n_bands)
+        self._hits = np.zeros(n_bands, dtype=bool)
+        self._mask = np.zeros(n_bands, dtype=bool)
+
+    def process(self, amplitude, energies):
+        # 対数圧縮した振幅の、前フレームからの増加分 (半波整流) を帯域ごとに合計する
+        np.multiply(amplitude, self._amplitude_scale, out=self._log_amplitude)
+        np.log1p(self._log_amplitude, out=self._log_amplitude)
+        np.subtract(self._log_amplitude, self._prev_log_amplitude, out=self._diff)
+        np.maximum(self._diff, 0, out=self._diff)
+        self._log_amplitude, self._prev_log_amplitude = self._prev_log_amplitude, self._log_amplitude
+        flux = self._flux
+        np.matmul(self._band_matrix, self._diff, out=flux)
+
+        # 適応閾値を超え、かつ前フレームより上昇しているときにオンセットとする
+        np.multiply(self._history_sum, self._threshold_scale, out=self._threshold)
+        np.add(self._threshold, self._threshold_offset, out=self._threshold)
+        hits = self._hits
+        np.greater(flux, self._threshold, out=hits)
+        np.greater(flux, self._prev_flux, out=self._mask)
+        np.logical_and(hits, self._mask, out=hits)
+        np.equal(self._cooldowns, 0, out=self._mask)
+        np.logical_and(hits, self._mask, out=hits)
+        np.copyto(self._cooldowns, self._cooldown_frames, where=hits)
+
+        # 履歴を更新
+        oldest = self._history[:, self._history_pos]
+        np.subtract(flux, oldest, out=self._delta)
+        np.add(self._history_sum, self._delta, out=self._history_sum)
+        np.copyto(oldest, flux)
+        self._history_pos = (self._history_pos + 1) % self.history_frames
+        if self._history_pos == 0:
+            np.sum(self._history, axis=1, out=self._history_sum)
+
+        np.copyto(self._prev_flux, flux)
+        np.subtract(self._cooldowns, 1, out=self._cooldowns)
+        np.maximum(self._cooldowns, 0, out=self._cooldowns)
+        return hits
+
+
+DETECTORS = {
+    EnergyDetector.name: EnergyDetector,
+    SpectralFluxDetector.name: SpectralFluxDetector,
+}
+
+
+def create_detector(detector):
+    """名前 ("energy" / "flux") または BeatDetector インスタンスから検出器を返す"""
+    if isinstance(detector, BeatDetector):
+        return detector
+    try:
+        return DETECTORS[detector]()
+    except KeyError:
+        raise ValueError(f"Unknown beat detector: {detector}") from None
+
+
+class TempoTracker:
+    """オンセット時刻からテンポと位相をオンラインで推定し、次のビート時刻を予測する
+
+    直近のオンセット間隔を [min_bpm, max_bpm] の範囲に折り返して周期を推定し、
+    予測に近いオンセットが来るたびに周期・位相を少しずつ補正する。
+    予測どおりのオンセットが続くほど confidence が上がる。
+    """
+
+    def __init__(self, min_bpm=60, max_bpm=180, history=8, tolerance=0.15, smoothing=0.2):
+        """
+        Args:
+            min_bpm: 推定するテンポの下限
+            max_bpm: 推定するテンポの上限
+            history: 周期の推定に使うオンセット数
+            tolerance: 予測と一致したとみなす誤差 (周期に対する割合)
+            smoothing: 一致したオンセットで周期・位相を補正する割合
+        """
+        self.min_period = 60.0 / max_bpm
+        self.max_period = 60.0 / min_bpm
+        self.history = history
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        self.onsets = []
+        self.period = None
+        self.last_beat = None
+        self.confidence = 0.0
+
+    @property
+    def bpm(self):
+        return 60.0 / self.period if self.period else None
+
+    def _fold(self, interval):
+        """間隔を周期の範囲に収まるよう2倍・1/2倍する"""
+        while interval < self.min_period:
+            interval *= 2
+        while interval > self.max_period:
+            interval /= 2
+        return interval
+
+    def add_onset(self, t):
+        """オンセット時刻 (秒) を追加する"""
+        self.onsets.append(t)
+        del self.onsets[:-self.history]
+
+        if self.period is None or self.confidence <= 0:
+            # 周期が定まっていなければ直近の間隔の中央値から推定し直す
+            intervals = [self._fold(b - a) for a, b in zip(self.onsets, self.onsets[1:]) if b > a]
+            if len(intervals) >= 2:
+                self.period = float(np.median(intervals))
+                self.last_beat = t
+                self.confidence = 0.1
+            return
+
+        # 直前のビートから見て最も近い予測ビートとの誤差を調べる
+        beats_ahead = max(1, round((t - self.last_beat) / self.period))
+        predicted = self.last_beat + beats_ahead * self.period
+        error = t - predicted
+        if abs(error) <= self.tolerance * self.period:
+            # 予測と一致: 位相と周期を補正して信頼度を上げる
+            self.period += self.smoothing * error / beats_ahead
+            self.last_beat = predicted + self.smoothing * error
+            self.confidence = min(1.0, self.confidence + 0.2)
+        else:
+            # 裏拍やノイズの可能性があるので、信頼度だけ下げる
+            self.confidence = max(0.0, self.confidence - 0.1)
+
+    def next_beat(self, now):
+        """now より後の次の予測ビート時刻を返す (推定できていなければNone)"""
+        if self.period is None or self.last_beat is None:
+            return None
+        beats_ahead = max(1, int((now - self.last_beat) // self.period) + 1)
+        return self.last_beat + beats_ahead * self.period
@@ -3,8 +3,71 @@ from dotenv import load_dotenv
 load_dotenv()
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_SECRET_KEY = os.getenv("SPOTIFY_SECRET_KEY")
+# Spotify API の接続先 (テスト用のスタブサーバーに向ける場合に変更する)
+SPOTIFY_API_PREFIX = os.getenv("SPOTIFY_API_PREFIX", "https://api.spotify.com/v1/")
+SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
 
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 MQTT_TOPIC_BASE = "led-jukebox"
-SOCKET_PATH = "/tmp/led_jukebox_mqtt.sock"
\ No newline at end of file
+SOCKET_PATH = "/tmp/led_jukebox_mqtt.sock"
+# MQTTデーモンのトピックごとのQoS
+MQTT_BEATS_QOS = int(os.getenv("MQTT_BEATS_QOS", "0"))
+MQTT_TRACK_QOS = int(os.getenv("MQTT_TRACK_QOS", "1"))
+# ブローカーに送れない間に保持するビートの有効期限 (秒) と、トピックごとに保持するメッセージ数の上限
+MQTT_BEATS_MAX_AGE = float(os.getenv("MQTT_BEATS_MAX_AGE", "0.25"))
+MQTT_OUTBOX_SIZE = int(os.getenv("MQTT_OUTBOX_SIZE", "32"))
+# beats_publisher から led_subscriber へブローカーを経由せずにビートを送るUNIXデータグラムソケット
+# (MQTTへの送信はそのまま続ける。BEATS_FAST_PATH=0 なら使わない)
+BEATS_FAST_PATH = os.getenv("BEATS_FAST_PATH", "1") == "1"
+BEATS_SOCKET_PATH = os.getenv("LED_JUKEBOX_BEATS_SOCKET", "/tmp/led_jukebox_beats.sock")
+# 常駐した track_publisher がイベントを受け取るソケット (track_event.py と同じ値にする)
+TRACK_SOCKET_PATH = os.getenv("LED_JUKEBOX_TRACK_SOCKET", "/tmp/led_jukebox_track.sock")
+
+# リサイズ済みアルバムアートのキャッシュ (空ならキャッシュしない) とその合計サイズの上限
+ART_CACHE_DIR = os.getenv("ART_CACHE_DIR", os.path.expanduser("~/.cache/led-jukebox/art"))
+ART_CACHE_MAX_BYTES = int(os.getenv("ART_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# LEDマトリクスの出力先 ("rgbmatrix": 実機, "framebuffer": メモリ上のエミュレータ, "recorder": エミュレータ + 記録)
+LED_BACKEND = os.getenv("LED_BACKEND", "rgbmatrix")
+# recorder で記録するファイル (.png なら連番のPNG、それ以外は rgb24 の生ビデオ)
+LED_RECORD_PATH = os.getenv("LED_RECORD_PATH", "led_frames.rgb")
+
+# レンダラーが使うXディスプレイ (Xvfb, 空なら環境変数 DISPLAY をそのまま使う)
+LED_GL_DISPLAY = os.getenv("LED_GL_DISPLAY", ":1")
+# LEDマトリクスとOpenGLのレンダラーを同時に初期化する (0なら従来どおり順に初期化する)
+LED_PARALLEL_INIT = os.getenv("LED_PARALLEL_INIT", "1") == "1"
+
+# 回転アニメーションのフレームをテクスチャごとに事前に描画しておくキャッシュの上限 (MB, 0なら毎回描画する)
+LED_ROTATION_CACHE_MB = float(os.getenv("LED_ROTATION_CACHE_MB", "32"))
+
+# FBOの読み出し方法 ("pil": レンダラーのPILイメージ, "numpy": 使い回しのNumPyバッファ, "pbo": PBOによる非同期読み出し)
+LED_READBACK_MODE = os.getenv("LED_READBACK_MODE", "pil")
+
+# Trueならオーディオスレッド上でブロックが届いた直後にビート検出・送信を行う
+BEATS_DETECT_IN_CALLBACK = os.getenv("BEATS_DETECT_IN_CALLBACK", "1") == "1"
+
+# ビート検出のFFT窓長・ホップサイズ (サンプル数, 0ならブロックサイズ = 重なりなし)
+BEATS_FFT_SIZE = int(os.getenv("BEATS_FFT_SIZE", "0")) or None
+BEATS_HOP_SIZE = int(os.getenv("BEATS_HOP_SIZE", "0")) or None
+
+# ビート検出エンジン ("energy": 帯域エネルギー, "flux": スペクトルフラックス)
+BEATS_DETECTOR = os.getenv("BEATS_DETECTOR", "energy")
+# テンポを推定する帯域 (空ならテンポ推定を行わない)
+BEATS_TEMPO_BAND = os.getenv("BEATS_TEMPO_BAND", "Bass") or None
+
+# テンポ推定で予測したビートの何秒前に回転を始めるか (0なら予測を使わない)
+LED_BEAT_LEAD_TIME = float(os.getenv("LED_BEAT_LEAD_TIME", "0"))
+
+# ビートの区間ごとの遅延 (p50/p95/p99) をログに出す間隔 (秒)
+LATENCY_LOG_INTERVAL = float(os.getenv("LATENCY_LOG_INTERVAL", "60"))
+
+# 各デーモンのメトリクス (Prometheus形式, http://<host>:<port>/metrics) のポート (0なら公開しない)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+MQTT_DAEMON_METRICS_PORT = int(os.getenv("MQTT_DAEMON_METRICS_PORT", "9101"))
+BEATS_METRICS_PORT = int(os.getenv("BEATS_METRICS_PORT", "9102"))
+LED_METRICS_PORT = int(os.getenv("LED_METRICS_PORT", "9103"))
+
+# プロファイル (cProfile) の保存先ディレクトリと、1回に計測する秒数
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/led-jukebox-profiles")
+PROFILE_CAPTURE_SECONDS = float(os.getenv("PROFILE_CAPTURE_SECONDS", "10"))
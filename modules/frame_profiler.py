@@ -0,0 +1,120 @@
+import cProfile
+import logging
+import os
+import threading
+import time
+
+from modules.latency import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+
+class FrameProfiler:
+    """レンダーループの1フレームを段階ごとに計測するプロファイラ
+
+    描画側は begin() でフレームの計測を始め、各段階の終わりで lap(段階名) を呼び、
+    end() でフレームを締める。計測は enable() するまで何もしない (lap() は属性の確認だけ)。
+    段階ごとの時間は直近 window フレーム分を保持し、log_interval 秒ごとにパーセンタイルをログに出す。
+
+    start_capture() / stop_capture() で cProfile によるプロファイルを取り、pstats 形式で保存する。
+    cProfile は呼び出したスレッドだけを計測するので、どちらもレンダースレッドで呼び出すこと。
+    """
+
+    def __init__(self, window=300, log_interval=10.0):
+        self.stats = LatencyStats(window)
+        self.log_interval = log_interval
+        self.enabled = False
+        self._frame_start = None
+        self._last = None
+        self._last_log = time.monotonic()
+        self._profile = None
+        self._capture_path = None
+        self._capture_timer = None
+
+    def enable(self):
+        self.enabled = True
+        self._last_log = time.monotonic()
+        logger.info("Frame stage profiling enabled")
+
+    def disable(self):
+        """計測を止め、それまでの集計をログに出す"""
+        if self.enabled:
+            self.enabled = False
+            self._last = None
+            logger.info(self.stats.format("frame stages"))
+            logger.info("Frame stage profiling disabled")
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def begin(self):
+        """フレームの計測を始める"""
+        if self.enabled:
+            self._frame_start = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """直前の lap() (または begin()) からの時間を stage の時間として記録する"""
+        if self._last is None:
+            return
+        now = time.perf_counter()
+        self.stats.record(stage, now - self._last)
+        self._last = now
+
+    def end(self):
+        """フレーム全体の時間を記録し、一定間隔で集計をログに出す"""
+        if self._last is None:
+            return
+        self.stats.record("frame", time.perf_counter() - self._frame_start)
+        self._last = None
+        if time.monotonic() - self._last_log >= self.log_interval:
+            logger.info(self.stats.format("frame stages"))
+            self._last_log = time.monotonic()
+
+    @property
+    def capturing(self):
+        return self._profile is not None
+
+    def start_capture(self, path):
+        """cProfile によるプロファイルを開始する (レンダースレッドで実行)"""
+        if self._profile is not None:
+            logger.warning(f"Profile capture already running ({self._capture_path})")
+            return False
+        self._capture_path = path
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        logger.info(f"Profile capture started ({path})")
+        return True
+
+    def stop_capture(self):
+        """プロファイルを止めて pstats 形式で保存し、保存先を返す (レンダースレッドで実行)"""
+        if self._capture_timer is not None:
+            self._capture_timer.cancel()
+            self._capture_timer = None
+        profile, self._profile = self._profile, None
+        if profile is None:
+            return None
+        profile.disable()
+        path = self._capture_path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        profile.dump_stats(path)
+        logger.info(f"Profile capture saved to {path} (python -m pstats {path})")
+        return path
+
+    def capture_for(self, seconds, path, submit):
+        """seconds 秒間のプロファイルを取る
+
+        submit はレンダースレッドで関数を実行させる関数 (FrameScheduler.submit) で、
+        開始と終了をどちらもそれ経由で行う。
+        """
+        def started():
+            if self.start_capture(path):
+                self._capture_timer = threading.Timer(seconds, submit, (self.stop_capture,))
+                self._capture_timer.daemon = True
+                self._capture_timer.start()
+
+        submit(started)
@@ -0,0 +1,106 @@
+import ctypes
+import logging
+
+import numpy as np
+from OpenGL import GL
+
+logger = logging.getLogger(__name__)
+
+
+class FrameReadback:
+    """FBOの内容を使い回しのNumPyバッファ (RGB uint8) に読み出すクラス
+
+    毎フレーム同じ配列に glReadPixels するため、定常状態ではフレームごとのメモリ確保がない。
+    use_pbo=True の場合は2つのピクセルバッファオブジェクト (PBO) を交互に使い、
+    読み出しを非同期に行う (その代わり返るフレームは1フレーム前のものになり、
+    最初の読み出しは None を返す。最後のフレームは flush() で取り出す)。
+    返す配列はOpenGLの行順 (下の行が先頭) のままなので、表示時に上下反転が必要。
+    """
+
+    def __init__(self, width, height, use_pbo=False, fbo=None):
+        """
+        Args:
+            width: 読み出す幅 (ピクセル)
+            height: 読み出す高さ (ピクセル)
+            use_pbo: PBOによる非同期読み出しを使うかどうか
+            fbo: 読み出し前にバインドするフレームバッファID (Noneなら現在のバインドのまま)
+        """
+        self.width = width
+        self.height = height
+        self.fbo = fbo
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.nbytes = self.frame.nbytes
+
+        self._pbos = None
+        self._pbo_index = 0
+        self._pending = None  # 読み出しを開始したまま、まだ取り出していないPBO
+        if use_pbo:
+            self._setup_pbos()
+
+    def _setup_pbos(self):
+        """読み出し用のPBOを2つ確保する"""
+        try:
+            self._pbos = [int(pbo) for pbo in GL.glGenBuffers(2)]
+            for pbo in self._pbos:
+                GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo)
+                GL.glBufferData(GL.GL_PIXEL_PACK_BUFFER, self.nbytes, None, GL.GL_STREAM_READ)
+            GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        except Exception as e:
+            logger.warning(f"PBO setup failed, falling back to synchronous readback: {e}")
+            self._pbos = None
+
+    @property
+    def uses_pbo(self):
+        return self._pbos is not None
+
+    def read(self, sync=False):
+        """現在のFBOの内容を読み出す
+
+        同期読み出しでは現在のフレームをバッファに読み出して返す。
+        PBOモードでは現在のフレームの読み出しを開始し、1つ前に開始したフレームを取り出して返す
+        (前のフレームがなければ None)。各フレームはちょうど1回ずつ、1フレーム遅れで返る。
+
+        Args:
+            sync: Trueの場合はPBOモードでも現在のフレームを同期的に読み出す
+                (取り出していないフレームは捨てるので、必要なら先に flush() を呼ぶ)
+        """
+        if self.fbo is not None:
+            GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.fbo)
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+
+        if self._pbos is None or sync:
+            GL.glReadPixels(0, 0, self.width, self.height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, self.frame)
+            self._pending = None
+            return self.frame
+
+        # このフレームの読み出しを一方のPBOに開始し、もう一方から1フレーム前の内容を取り出す
+        write_pbo = self._pbos[self._pbo_index]
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, write_pbo)
+        GL.glReadPixels(0, 0, self.width, self.height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        self._pbo_index = 1 - self._pbo_index
+
+        previous, self._pending = self._pending, write_pbo
+        if previous is None:
+            return None
+        return self._take(previous)
+
+    def flush(self):
+        """PBOに読み出しを開始したまま残っているフレームを取り出して返す (なければ None)"""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return None
+        return self._take(pending)
+
+    def _take(self, pbo):
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo)
+        GL.glGetBufferSubData(GL.GL_PIXEL_PACK_BUFFER, 0, self.nbytes, self.frame)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        return self.frame
+
+    def cleanup(self):
+        """PBOを解放する"""
+        if self._pbos is not None:
+            GL.glDeleteBuffers(len(self._pbos), self._pbos)
+            self._pbos = None
+            self._pending = None
@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class FrameScheduler:
+    """固定フレームクロックで描画タスクとアニメーションを処理するレンダーループ
+
+    MQTTのコールバックスレッドからは submit() / request_animation() で要求を積むだけにし、
+    OpenGLの描画とLEDへの出力はすべて run() を呼び出したスレッドで行う。
+    アニメーションは1フレーム進むごとに1回 yield するイテレータとして表す。
+    """
+
+    def __init__(self, fps=30, max_pending_age=0.25):
+        """
+        Args:
+            fps: アニメーションのフレームレート
+            max_pending_age: 再生待ちアニメーションの有効期限 (秒)。これより古い要求は破棄する
+        """
+        self.frame_interval = 1.0 / fps
+        self.max_pending_age = max_pending_age
+
+        self._cond = threading.Condition()
+        self._tasks = deque()
+        self._pending = None  # (要求時刻, アニメーション生成関数)
+        self._scheduled = None  # (開始予定時刻, アニメーション生成関数)
+        self._current = None
+        self._idle = None  # 空いているときに少しずつ進める処理
+        self._cancel = False
+        self._running = False
+
+        # 統計情報
+        self.started_animations = 0
+        self.merged_animations = 0
+        self.dropped_animations = 0
+
+    def submit(self, func, *args):
+        """次のフレームの前にレンダースレッドで実行する処理を登録する"""
+        with self._cond:
+            self._tasks.append((func, args))
+            self._cond.notify()
+
+    def request_animation(self, factory, requested_at=None):
+        """アニメーションの再生を要求する
+
+        再生中に届いた要求は1つの待ち枠にまとめ、最新のものだけを残す。
+        待ち枠の要求は現在のアニメーション終了時に max_pending_age を超えていれば破棄する。
+        """
+        if requested_at is None:
+            requested_at = time.time()
+        with self._cond:
+            if self._pending is not None:
+                self.merged_animations += 1
+            self._pending = (requested_at, factory)
+            self._cond.notify()
+
+    def schedule_animation(self, factory, start_at):
+        """指定した時刻 (time.time() 基準) にアニメーションを開始するよう予約する
+
+        予約は1つだけ保持し、新しい予約で置き換える。即時の要求が待っている場合はそちらを優先する。
+        開始時刻に別のアニメーションを再生中なら終了を待ち、max_pending_age を超えていれば破棄する。
+        """
+        with self._cond:
+            self._scheduled = (start_at, factory)
+            self._cond.notify()
+
+    def set_idle_task(self, func):
+        """レンダースレッドが空いているとき (タスクもアニメーションもないとき) に繰り返し呼び出す処理を登録する
+
+        func は1回あたり短い処理 (1フレーム分の描画など) だけを行い、続きがあれば True を返す。
+        False を返すと登録を解除する。登録できる処理は1つだけで、新しい処理で置き換える (None で解除)。
+        """
+        with self._cond:
+            self._idle = func
+            self._cond.notify()
+
+    def cancel_animations(self):
+        """再生中・再生待ち・予約中のアニメーションを破棄する"""
+        with self._cond:
+            self._pending = None
+            self._scheduled = None
+            self._cancel = True
+            self._cond.notify()
+
+    def stop(self):
+        """レンダーループを停止する"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _next_work(self):
+        """実行待ちのタスクと、開始すべきアニメーションを取り出す"""
+        with self._cond:
+            while (self._running and not self._tasks and self._pending is None and self._current is None
+                   and self._idle is None):
+                if self._scheduled is None:
+                    self._cond.wait()
+                    continue
+                # 予約があれば開始時刻まで待つ
+                delay = self._scheduled[0] - time.time()
+                if delay <= 0:
+                    break
+                self._cond.wait(delay)
+            tasks = list(self._tasks)
+            self._tasks.clear()
+            if self._cancel:
+                self._current = None
+                self._cancel = False
+            pending = None
+            if self._current is None:
+                if self._pending is not None:
+                    pending = self._pending
+                    self._pending = None
+                elif self._scheduled is not None and self._scheduled[0] <= time.time():
+                    pending = self._scheduled
+                    self._scheduled = None
+            return tasks, pending
+
+    def _run_idle(self):
+        """空いている間の処理を1回進める (終わったら登録を解除する)"""
+        idle = self._idle
+        if idle is None:
+            return
+        try:
+            more = idle()
+        except Exception as e:
+            logger.error(f"Error in idle task: {e}")
+            more = False
+        if not more:
+            with self._cond:
+                if self._idle is idle:
+                    self._idle = None
+
+    def run(self):
+        """レンダーループのメイン処理 (呼び出したスレッドをブロックする)"""
+        self._running = True
+        next_frame = time.monotonic()
+
+        while self._running:
+            idle = self._current is None
+            tasks, pending = self._next_work()
+            if idle:
+                # 待機明けはフレームクロックを現在時刻に合わせ直す
+                next_frame = time.monotonic()
+
+            for func, args in tasks:
+                try:
+                    func(*args)
+                except Exception as e:
+                    logger.error(f"Error in render task: {e}")
+            if self._cancel:
+                # タスク内から cancel_animations() が呼ばれた場合
+                with self._cond:
+                    self._current = None
+                    self._cancel = False
+                pending = None
+
+            if pending is not None:
+                # 予約の場合は開始予定時刻からの遅れで判定する
+                requested_at, factory = pending
+                if time.time() - requested_at > self.max_pending_age:
+                    self.dropped_animations += 1
+                    logger.debug("Dropped stale animation request")
+                else:
+                    try:
+                        self._current = iter(factory())
+                        self.started_animations += 1
+                    except Exception as e:
+                        logger.error(f"Error starting animation: {e}")
+
+            if self._current is None:
+                self._run_idle()
+                continue
+
+            try:
+                next(self._current)
+            except StopIteration:
+                self._current = None
+                continue
+            except Exception as e:
+                logger.error(f"Error in animation frame: {e}")
+                self._current = None
+                continue
+
+            # 固定フレームクロックで次のフレームまで待つ
+            next_frame += self.frame_interval
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.frame_interval:
+                # 大きく遅れた場合は追いつこうとせずクロックをリセットする
+                next_frame = time.monotonic()
@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# フレームヘッダ: フラグ(1byte), トピック長(2byte), ペイロード長(4byte) のビッグエンディアン
+FRAME_HEADER = struct.Struct(">BHI")
+FLAG_RETAIN = 0x01
+FLAG_TRACE = 0x02  # JSONペイロードの "trace" にデーモンの受信時刻を書き加える
+MAX_PAYLOAD_SIZE = 4 * 1024 * 1024
+
+
+class FrameError(Exception):
+    """不正なフレームを受信した場合の例外"""
+
+
+def encode_frame(topic, payload, flags=0):
+    """トピックとペイロードを1つのフレームにエンコードする
+
+    Args:
+        topic: MQTTトピック
+        payload: 送信するデータ (bytes、または JSON にシリアライズする dict)
+        flags: FLAG_RETAIN などのフラグ
+    """
+    if not isinstance(payload, (bytes, bytearray, memoryview)):
+        payload = json.dumps(payload).encode('utf-8')
+    topic_bytes = topic.encode('utf-8')
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise FrameError(f"Payload too large: {len(payload)} bytes")
+    return FRAME_HEADER.pack(flags, len(topic_bytes), len(payload)) + topic_bytes + bytes(payload)
+
+
+class FrameDecoder:
+    """ストリームから受け取ったバイト列を完成したフレームごとに切り出す"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """受信データを追加し、完成したフレームを (トピック, ペイロード, フラグ) で順に返す"""
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= FRAME_HEADER.size:
+            flags, topic_len, payload_len = FRAME_HEADER.unpack_from(self._buffer)
+            if payload_len > MAX_PAYLOAD_SIZE:
+                raise FrameError(f"Payload too large: {payload_len} bytes")
+            frame_len = FRAME_HEADER.size + topic_len + payload_len
+            if len(self._buffer) < frame_len:
+                break
+            topic_start = FRAME_HEADER.size
+            payload_start = topic_start + topic_len
+            topic = self._buffer[topic_start:payload_start].decode('utf-8')
+            payload = bytes(self._buffer[payload_start:frame_len])
+            del self._buffer[:frame_len]
+            frames.append((topic, payload, flags))
+        return frames
+
+
+class DaemonClient:
+    """MQTTデーモンへの常設UNIXソケット接続
+
+    最初の送信時に接続し、以降は同じ接続にフレームを書き込む。
+    デーモンの再起動などで接続が切れた場合は自動的に再接続する。
+    """
+
+    def __init__(self, socket_path, default_topic=None, reconnect_interval=1.0, error_log_interval=30.0):
+        """
+        Args:
+            socket_path: MQTTデーモンのUNIXソケットパス
+            default_topic: トピック省略時に使うトピック
+            reconnect_interval: 接続に失敗した後、次に接続を試みるまでの間隔 (秒)
+            error_log_interval: 接続できない間、エラーをログに出す間隔 (秒)
+        """
+        self.socket_path = socket_path
+        self.default_topic = default_topic
+        self.reconnect_interval = reconnect_interval
+        self.error_log_interval = error_log_interval
+        self._sock = None
+        self._lock = threading.Lock()
+        self._next_connect = 0.0
+        self._next_error_log = 0.0
+        self._failed_connects = 0
+
+    def _connect(self):
+        """デーモンに接続する (失敗直後は reconnect_interval の間は再試行しない)"""
+        now = time.monotonic()
+        if now < self._next_connect:
+            return False
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            self._next_connect = now + self.reconnect_interval
+            self._failed_connects += 1
+            # デーモンが止まっている間に送信のたびにエラーを出さないよう、間隔をあけてまとめて出す
+            if now >= self._next_error_log:
+                logger.error(f"Could not connect to MQTT daemon at {self.socket_path}: {e} "
+                             f"({self._failed_connects} failed attempts)")
+                self._next_error_log = now + self.error_log_interval
+            return False
+        self._sock = sock
+        if self._failed_connects:
+            logger.info(f"Connected to MQTT daemon at {self.socket_path} "
+                        f"after {self._failed_connects} failed attempts")
+        else:
+            logger.info(f"Connected to MQTT daemon at {self.socket_path}")
+        self._failed_connects = 0
+        self._next_error_log = 0.0
+        return True
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def send(self, payload, topic=None, flags=0):
+        """ペイロードを1フレームとして送信する。送信できた場合はTrueを返す"""
+        topic = topic or self.default_topic
+        frame = encode_frame(topic, payload, flags)
+        with self._lock:
+            # 切断済みの接続に書き込んだ場合は1度だけ再接続して送り直す
+            for _ in range(2):
+                if self._sock is None and not self._connect():
+                    return False
+                try:
+                    self._sock.sendall(frame)
+                    return True
+                except OSError as e:
+                    logger.warning(f"Connection to MQTT daemon lost: {e}")
+                    self._close()
+        return False
+
+    def close(self):
+        """接続を閉じる"""
+        with self._lock:
+            self._close()
+
+
+class BackgroundSender:
+    """DaemonClient への送信を専用のスレッドで行う
+
+    put() はブロックせずにキューに積むだけなので、オーディオコールバックのように
+    待たせられないスレッドからも呼べる。キューが一杯なら最も古いメッセージを捨てる。
+    送信の結果は on_sent() / on_failed() で通知する (送信スレッドから呼ばれる)。
+    """
+
+    def __init__(self, client, max_queued=16, on_sent=None, on_failed=None):
+        self.client = client
+        self.max_queued = max_queued
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.dropped = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def put(self, payload, topic=None, flags=0):
+        """メッセージを送信キューに積む (キューが一杯なら最も古いものを捨てる)"""
+        with self._cond:
+            if self._closed:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="daemon-sender", daemon=True)
+                self._thread.start()
+            if len(self._queue) >= self.max_queued:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append((payload, topic, flags))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                payload, topic, flags = self._queue.popleft()
+            try:
+                sent = self.client.send(payload, topic, flags)
+            except Exception as e:
+                logger.debug(f"Error sending message to MQTT daemon: {e}")
+                sent = False
+            callback = self.on_sent if sent else self.on_failed
+            if callback is not None:
+                callback()
+
+    def close(self, timeout=1.0):
+        """キューに残っているメッセージを送り終えるのを (最大 timeout 秒) 待ってスレッドを止める"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+def bind_datagram_socket(socket_path):
+    """socket_path にUNIXデータグラムソケットを作成する (別ユーザーのプロセスからも送信できるようにする)"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(socket_path)
+    os.chmod(socket_path, 0o777)
+    return sock
+
+
+class DatagramSender:
+    """UNIXデータグラムソケットへ1メッセージ1データグラムで送信する
+
+    送信はブロックしない。受信側が起動していない場合や受信バッファが一杯の場合は
+    そのメッセージを捨てて False を返す。
+    """
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+
+    def send(self, payload):
+        """ペイロード (bytes、または JSON にシリアライズする dict) を送信する。送信できた場合はTrueを返す"""
+        if not isinstance(payload, (bytes, bytearray, memoryview)):
+            payload = json.dumps(payload).encode('utf-8')
+        try:
+            self._sock.sendto(payload, self.socket_path)
+            return True
+        except (FileNotFoundError, ConnectionRefusedError, BlockingIOError):
+            return False
+        except OSError as e:
+            logger.debug(f"Could not send datagram to {self.socket_path}: {e}")
+            return False
+
+    def close(self):
+        self._sock.close()
@@ -0,0 +1,89 @@
+import itertools
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+# ビートが各段階を通過した時刻を、メッセージの "trace" に記録するキー (すべて time.time())
+#   captured: 音声ブロックを取得した時刻       (beats_publisher)
+#   sent:     MQTTデーモンに送信した時刻        (beats_publisher)
+#   daemon:   MQTTデーモンが受け取った時刻      (mqtt_daemon)
+#   received: サブスクライバーが受信した時刻    (led_subscriber, MQTT または直接の経路で先に届いた方)
+#   started:  レンダーループで回転を始めた時刻  (led_subscriber)
+#   presented: 最初のフレームをLEDに出した時刻  (led_subscriber)
+# 区間の名前と、その始まり・終わりのキー
+TRACE_STAGES = (
+    ("detect", "captured", "sent"),
+    ("daemon", "sent", "daemon"),
+    ("broker", "daemon", "received"),
+    ("queue", "received", "started"),
+    ("render", "started", "presented"),
+    ("transport", "sent", "received"),
+    ("total", "captured", "presented"),
+)
+
+_trace_ids = itertools.count(1)
+
+
+def new_trace(captured_at):
+    """新しいトレース (ID と取得時刻) を作る"""
+    return {"id": f"{os.getpid():x}-{next(_trace_ids)}", "captured": captured_at}
+
+
+def stamp_trace(payload, key, now=None):
+    """JSONペイロードの "trace" に時刻を書き加えたペイロードを返す (トレースがなければそのまま返す)"""
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return payload
+    trace = message.get("trace") if isinstance(message, dict) else None
+    if trace is None:
+        return payload
+    trace[key] = time.time() if now is None else now
+    return json.dumps(message).encode('utf-8')
+
+
+class LatencyStats:
+    """区間ごとの遅延を直近 window 件ずつ保持し、パーセンタイルを集計する"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = {}
+
+    def record(self, stage, seconds):
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples.setdefault(stage, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def record_trace(self, trace):
+        """トレースの時刻から分かる区間の遅延をすべて記録する"""
+        for stage, start, end in TRACE_STAGES:
+            if start in trace and end in trace:
+                self.record(stage, trace[end] - trace[start])
+
+    def summary(self):
+        """{区間: {"count", "p50", "p95", "p99"}} を返す (単位はミリ秒)"""
+        result = {}
+        for stage, samples in list(self._samples.items()):
+            values = np.array(samples) * 1000
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[stage] = {"count": len(values), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+        return result
+
+    def format(self, title="latency"):
+        """ログ出力用の1行の文字列にする"""
+        parts = []
+        summary = self.summary()
+        # TRACE_STAGES の順に並べ、それ以外の区間は記録した順に後ろに付ける
+        trace_stages = [stage for stage, _, _ in TRACE_STAGES]
+        order = trace_stages + [stage for stage in summary if stage not in trace_stages]
+        for stage in order:
+            if stage in summary:
+                s = summary[stage]
+                parts.append(f"{stage} {s['p50']:.2f}/{s['p95']:.2f}/{s['p99']:.2f}")
+        return f"{title} p50/p95/p99 ms: " + ", ".join(parts) if parts else f"{title}: no samples"
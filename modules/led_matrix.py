@@ -1,10 +1,33 @@
-from rgbmatrix import RGBMatrix, RGBMatrixOptions
+from PIL import Image
+import numpy as np
 import sys
 
+from modules import config
+from modules.matrix_backends import FramebufferMatrix, MatrixOptions, RecorderMatrix
+
+BACKENDS = ("rgbmatrix", "framebuffer", "recorder")
+
+
 class LEDMatrix:
-    def __init__(self):
+    def __init__(self, backend=None, record_path=None, vsync=True):
+        """
+        Args:
+            backend: 出力先 ("rgbmatrix": 実機, "framebuffer": メモリ上のエミュレータ,
+                "recorder": エミュレータ + ファイルへの記録)。省略時は config.LED_BACKEND
+            record_path: recorder で記録するファイル。省略時は config.LED_RECORD_PATH
+            vsync: エミュレータでパネルのリフレッシュに合わせて待つか
+        """
+        self.backend = backend or config.LED_BACKEND
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown LED backend: {self.backend}")
+
         # LEDマトリックスの設定
-        self.options = RGBMatrixOptions()
+        if self.backend == "rgbmatrix":
+            # 実機のライブラリはRaspberry Pi以外では入っていないので、使う場合だけ読み込む
+            from rgbmatrix import RGBMatrix, RGBMatrixOptions
+            self.options = RGBMatrixOptions()
+        else:
+            self.options = MatrixOptions()
         self.options.rows = 64
         self.options.cols = 64
         self.options.chain_length = 5
@@ -18,13 +41,69 @@ class LEDMatrix:
 
         # マトリックスの初期化
         try:
-            self.matrix = RGBMatrix(options=self.options)
-            print("LED Matrix initialized successfully")
+            if self.backend == "rgbmatrix":
+                self.matrix = RGBMatrix(options=self.options)
+            elif self.backend == "recorder":
+                self.matrix = RecorderMatrix(record_path or config.LED_RECORD_PATH, self.options, vsync=vsync)
+            else:
+                self.matrix = FramebufferMatrix(self.options, vsync=vsync)
+            print(f"LED Matrix initialized successfully ({self.backend})")
         except Exception as e:
             print(f"Matrix initialization error: {e}")
             sys.exit(1)
 
+        # ダブルバッファ用のオフスクリーンキャンバス
+        # (もう一方のキャンバスはSwapOnVSyncで表示中のものと入れ替わる)
+        self.offscreen_canvas = self.matrix.CreateFrameCanvas()
+        self._staging = None
+        # present() の段階ごとの時間を計測する FrameProfiler (省略可)
+        self.profiler = None
+
         # 現在表示中の画像を管理するための変数
         self.current_display = None
         self.display_thread = None
-        self.stop_display = False
\ No newline at end of file
+        self.stop_display = False
+
+    def _staging_image(self, width, height):
+        """NumPy配列の書き込み先となる使い回しのRGB画像を返す"""
+        if self._staging is None or self._staging.size != (width, height):
+            self._staging = Image.new("RGB", (width, height))
+        return self._staging
+
+    def present(self, frame, flip_vertical=False):
+        """フレームをオフスクリーンキャンバスに描画し、VSyncに合わせて表示を切り替える
+
+        Args:
+            frame: PILイメージ、または (高さ, 幅, 3) の uint8 RGB NumPy配列
+            flip_vertical: NumPy配列が下の行から並んでいる場合 (glReadPixelsの結果) にTrue
+        """
+        if isinstance(frame, np.ndarray):
+            if frame.dtype != np.uint8 or frame.ndim != 3 or frame.shape[2] != 3:
+                raise ValueError(f"Unsupported frame buffer: {frame.dtype} {frame.shape}")
+            if not frame.flags.c_contiguous:
+                frame = np.ascontiguousarray(frame)
+            # 新しいPILイメージを作らず、使い回しの画像に直接デコードする
+            image = self._staging_image(frame.shape[1], frame.shape[0])
+            # 上下反転はデコーダの行ステップで行い、配列のコピーを作らない
+            image.frombytes(frame, "raw", ("RGB", 0, -1 if flip_vertical else 1))
+        elif frame.mode != "RGB":
+            image = frame.convert("RGB")
+        else:
+            image = frame
+
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.lap("convert")
+        self.offscreen_canvas.SetImage(image, unsafe=True)
+        if profiler is not None:
+            profiler.lap("set_image")
+        # framerateはリフレッシュレートに対するVSyncの倍数 (60Hz / 2 = 30Hz)
+        self.offscreen_canvas = self.matrix.SwapOnVSync(self.offscreen_canvas, self.framerate)
+        if profiler is not None:
+            profiler.lap("swap")
+
+    def clear(self):
+        """表示中・オフスクリーンの両方のキャンバスをクリアする"""
+        self.offscreen_canvas.Clear()
+        self.offscreen_canvas = self.matrix.SwapOnVSync(self.offscreen_canvas, self.framerate)
+        self.offscreen_canvas.Clear()
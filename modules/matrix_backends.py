@@ -0,0 +1,158 @@
+import logging
+import os
+import time
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class MatrixOptions:
+    """rgbmatrix.RGBMatrixOptions と同じ属性を持つ設定 (rgbmatrix がない環境用)"""
+
+    def __init__(self):
+        self.rows = 32
+        self.cols = 32
+        self.chain_length = 1
+        self.parallel = 1
+        self.brightness = 100
+        self.show_refresh_rate = 0
+        self.limit_refresh_rate_hz = 0
+        self.gpio_slowdown = 1
+        self.hardware_mapping = 'regular'
+
+
+class FramebufferCanvas:
+    """rgbmatrix の FrameCanvas と同じ描画APIを持つメモリ上のキャンバス"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = np.zeros((height, width, 3), dtype=np.uint8)
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        src = np.asarray(image)
+        # キャンバスからはみ出す部分は切り捨てる (rgbmatrix と同じ)
+        x0, y0 = max(offset_x, 0), max(offset_y, 0)
+        x1 = min(offset_x + src.shape[1], self.width)
+        y1 = min(offset_y + src.shape[0], self.height)
+        if x1 > x0 and y1 > y0:
+            self.pixels[y0:y1, x0:x1] = src[y0 - offset_y:y1 - offset_y, x0 - offset_x:x1 - offset_x]
+
+    def SetPixel(self, x, y, r, g, b):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y, x] = (r, g, b)
+
+    def Fill(self, r, g, b):
+        self.pixels[...] = (r, g, b)
+
+    def Clear(self):
+        self.pixels.fill(0)
+
+
+class FramebufferMatrix(FramebufferCanvas):
+    """rgbmatrix.RGBMatrix の代わりにメモリ上のフレームバッファへ表示するエミュレータ
+
+    SwapOnVSync() はリフレッシュレートに合わせて待ち (vsync=True の場合)、
+    表示したフレームの時刻を記録する。stats() でフレームレートと間隔のばらつきを返す。
+    """
+
+    def __init__(self, options=None, vsync=True, history=1000):
+        """
+        Args:
+            options: MatrixOptions または RGBMatrixOptions
+            vsync: Trueならパネルのリフレッシュに合わせて SwapOnVSync() で待つ
+            history: 記録しておくフレーム時刻の数
+        """
+        options = options or MatrixOptions()
+        width = options.cols * options.chain_length
+        height = options.rows * options.parallel
+        super().__init__(width, height)
+        self.refresh_rate_hz = options.limit_refresh_rate_hz or 120
+        self.vsync = vsync
+        self.frame_times = deque(maxlen=history)
+        self.frames = 0
+        self._next_vsync = None
+
+    def CreateFrameCanvas(self):
+        return FramebufferCanvas(self.width, self.height)
+
+    def _wait_vsync(self, framerate_fraction):
+        """framerate_fraction 回分のリフレッシュの境目まで待つ"""
+        interval = framerate_fraction / self.refresh_rate_hz
+        now = time.monotonic()
+        if self._next_vsync is None or now - self._next_vsync > interval:
+            # 初回と大きく遅れた場合は現在時刻に合わせ直す
+            self._next_vsync = now
+        else:
+            self._next_vsync += interval
+            if self._next_vsync > now:
+                time.sleep(self._next_vsync - now)
+
+    def SwapOnVSync(self, canvas, framerate_fraction=1):
+        """キャンバスの内容を表示し、次に描画するキャンバスを返す"""
+        if self.vsync:
+            self._wait_vsync(framerate_fraction)
+        # 表示中のフレームバッファとキャンバスを入れ替える
+        self.pixels, canvas.pixels = canvas.pixels, self.pixels
+        self.frame_times.append(time.monotonic())
+        self.frames += 1
+        self.on_frame(self.pixels)
+        return canvas
+
+    def on_frame(self, pixels):
+        """フレームを表示した直後に呼び出す (サブクラスで記録などに使う)"""
+
+    def stats(self):
+        """記録しているフレームの fps と、フレーム間隔の平均・標準偏差・p99・最大 (ミリ秒) を返す"""
+        times = np.array(self.frame_times)
+        if len(times) < 2:
+            return {"frames": self.frames, "fps": 0.0}
+        intervals = np.diff(times) * 1000
+        return {
+            "frames": self.frames,
+            "fps": float((len(times) - 1) / (times[-1] - times[0])),
+            "interval_ms": {
+                "mean": float(intervals.mean()),
+                "std": float(intervals.std()),
+                "p99": float(np.percentile(intervals, 99)),
+                "max": float(intervals.max()),
+            },
+        }
+
+
+class RecorderMatrix(FramebufferMatrix):
+    """表示したフレームをファイルに記録するエミュレータ
+
+    path が .png で終わる場合は連番のPNG (path に {frame} を含めるとそこに番号を入れる)、
+    それ以外は rgb24 の生ビデオとして1ファイルに追記する。生ビデオは例えば
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s 320x64 -r 30 -i out.rgb out.mp4 で変換できる。
+    """
+
+    def __init__(self, path, options=None, vsync=True, history=1000):
+        super().__init__(options, vsync=vsync, history=history)
+        self.path = path
+        self._raw = None
+        if not path.endswith(".png"):
+            self._raw = open(path, "wb")
+            logger.info(f"Recording {self.width}x{self.height} rgb24 frames to {path}")
+
+    def on_frame(self, pixels):
+        if self._raw is not None:
+            self._raw.write(pixels.tobytes())
+            return
+        if "{frame" in self.path:
+            path = self.path.format(frame=self.frames)
+        else:
+            root, ext = os.path.splitext(self.path)
+            path = f"{root}_{self.frames:06d}{ext}"
+        Image.fromarray(pixels).save(path)
+
+    def close(self):
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
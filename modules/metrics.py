@@ -0,0 +1,266 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 秒単位のヒストグラムの既定の区切り
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """ラベルごとの子を持つメトリクスの共通部分"""
+
+    type_name = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """ラベルの値に対応する子を返す (初めての値なら作る)"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        """(接尾辞, ラベル文字列, 値) を順に返す"""
+        for values, child in list(self._children.items()):
+            yield from child._samples(self.labelnames, values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+        self.func = None
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set_function(self, func):
+        """出力のたびに func() を呼び出して値とする (すでに数えている統計の属性を出す場合)"""
+        self.func = func
+
+    def _samples(self, labelnames, values):
+        value = self.func() if self.func else self.value
+        yield "", _format_labels(labelnames, values), value
+
+
+class Counter(_Metric):
+    """増えるだけの値 (送信数、失敗数など)"""
+
+    type_name = "counter"
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        super().__init__(name, help_text, labelnames)
+        if func is not None:
+            self.set_function(func)
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def set_function(self, func):
+        self._children[()].set_function(func)
+
+    @property
+    def value(self):
+        return self._children[()].value
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0
+        self.func = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, func):
+        """出力のたびに func() を呼び出して値とする"""
+        self.func = func
+
+    def _samples(self, labelnames, values):
+        value = self.func() if self.func else self.value
+        yield "", _format_labels(labelnames, values), value
+
+
+class Gauge(_Metric):
+    """増減する値 (接続数、fps など)"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        super().__init__(name, help_text, labelnames)
+        if func is not None:
+            self.set_function(func)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def set_function(self, func):
+        self._children[()].set_function(func)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def _samples(self, labelnames, values):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            yield "_bucket", _format_labels(labelnames, values, [("le", _format_value(float(bound)))]), cumulative
+        yield "_sum", _format_labels(labelnames, values), total
+        yield "_count", _format_labels(labelnames, values), count
+
+
+class Histogram(_Metric):
+    """所要時間などの分布"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+
+class Registry:
+    """プロセスのメトリクスをまとめ、Prometheus のテキスト形式で出力する"""
+
+    def __init__(self, prefix="ledjukebox_"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as {metric.type_name}")
+        return metric
+
+    def counter(self, name, help_text, labelnames=(), func=None):
+        return self._register(Counter, name, help_text, labelnames, func=func)
+
+    def gauge(self, name, help_text, labelnames=(), func=None):
+        return self._register(Gauge, name, help_text, labelnames, func=func)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# プロセス全体で共有するレジストリ
+registry = Registry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = registry
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_http(host="127.0.0.1", port=0, metrics_registry=None):
+    """/metrics を返すHTTPサーバーを作り、バックグラウンドスレッドで動かして返す
+
+    port が0なら空いているポートを使う (実際のポートは server.server_address[1])。
+    ポートを使えなければ OSError を送出する。
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": metrics_registry or registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def start_http_server(port, host="127.0.0.1", metrics_registry=None):
+    """設定されたポートで /metrics を公開する (port が0なら起動しない)"""
+    if not port:
+        return None
+    try:
+        server = serve_http(host, port, metrics_registry)
+    except OSError as e:
+        logger.error(f"Could not start metrics server on {host}:{port}: {e}")
+        return None
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,127 @@
+import hashlib
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class PanoramaTextures:
+    """レンダラーのパノラマテクスチャを管理する
+
+    - アルバムアート1枚 (高さ, 幅, 3) から、repeat 枚を横に並べたRGBA配列を NumPy で作る (PILでの連結なし)
+    - テクスチャの内容をハッシュで識別し、今アップロードされている内容と同じならアップロードしない
+    - 回転後のテクスチャを (回転前の内容, 軸, 向き) ごとに覚えておき、2回目からはFBOを読み出さずに差し替える。
+      回転後の見た目が回転前と変わらなければ何もアップロードしない
+    """
+
+    def __init__(self, renderer, repeat=6, max_textures=16, tolerance=2.0):
+        """
+        Args:
+            renderer: set_panorama_texture(PILイメージ) を持つレンダラー
+            repeat: パノラマに並べるアルバムアートの数
+            max_textures: 覚えておくテクスチャの数
+            tolerance: 回転後のフレームを回転前と同じ内容とみなす画素値の平均誤差
+        """
+        self.renderer = renderer
+        self.repeat = repeat
+        self.max_textures = max_textures
+        self.tolerance = tolerance
+
+        self._textures = OrderedDict()  # 内容のハッシュ → RGBA配列
+        self._transitions = OrderedDict()  # (回転前のハッシュ, 軸, 向き) → 回転後のハッシュ
+        self._resident = None  # 今アップロードされているテクスチャのハッシュ
+
+        # 統計情報
+        self.uploads = 0
+        self.skipped_uploads = 0
+        self.captures = 0
+
+    @property
+    def resident(self):
+        """今アップロードされているテクスチャのハッシュ (なければNone)"""
+        return self._resident
+
+    @staticmethod
+    def _key(rgba):
+        return hashlib.blake2b(rgba.tobytes(), digest_size=16).hexdigest()
+
+    def _store(self, rgba):
+        key = self._key(rgba)
+        self._textures[key] = rgba
+        self._textures.move_to_end(key)
+        while len(self._textures) > max(self.max_textures, 2):
+            # アップロード中のものと今追加したものは残し、最も古いものから捨てる
+            oldest = next(k for k in self._textures if k != self._resident and k != key)
+            del self._textures[oldest]
+        # 消えたテクスチャへの遷移は忘れる
+        for transition in [t for t, k in self._transitions.items()
+                           if k not in self._textures or t[0] not in self._textures]:
+            del self._transitions[transition]
+        return key
+
+    def _upload(self, key):
+        """テクスチャをアップロードする (すでにアップロード済みなら何もしない)。アップロードしたらTrueを返す"""
+        if key == self._resident:
+            self.skipped_uploads += 1
+            return False
+        self.renderer.set_panorama_texture(Image.fromarray(self._textures[key]))
+        self._resident = key
+        self.uploads += 1
+        return True
+
+    def make_panorama(self, art):
+        """アルバムアート (高さ, 幅, 3) を横に repeat 枚並べたRGBA配列を作る"""
+        height, width, _ = art.shape
+        # 1枚分をRGBAにしてから並べる (チャネルを飛ばした書き込みを1枚分で済ませる)
+        rgba = np.empty((height, width, 4), dtype=np.uint8)
+        rgba[..., :3] = art
+        rgba[..., 3] = 255
+        return np.tile(rgba, (1, self.repeat, 1))
+
+    def set_tile(self, art):
+        """アルバムアートを全面に貼ったテクスチャにする。アップロードしたらTrueを返す"""
+        return self._upload(self._store(self.make_panorama(art)))
+
+    def knows_rotation(self, axis, direction):
+        """今のテクスチャからこの回転をした後のテクスチャを覚えているか"""
+        return (self._resident, axis, direction) in self._transitions
+
+    def rotated(self, axis, direction, capture):
+        """回転が終わったときに呼び出し、回転後の見た目をテクスチャにする
+
+        Args:
+            axis: 回転軸
+            direction: 回転の向き
+            capture: 回転後のフレームを (高さ, 幅, 3) の uint8 配列で返す関数。
+                この回転を初めて行ったときだけ呼び出す
+        Returns:
+            テクスチャをアップロードしたらTrue
+        """
+        transition = (self._resident, axis, direction)
+        key = self._transitions.get(transition)
+        if key is None:
+            rgb = np.asarray(capture())
+            self.captures += 1
+            resident = self._textures.get(self._resident)
+            if (resident is not None and resident.shape[:2] == rgb.shape[:2]
+                    and np.mean(np.abs(resident[..., :3].astype(np.int16) - rgb)) <= self.tolerance):
+                # 回転後も見た目が変わらない (同じ面が並んでいる場合など)
+                key = self._resident
+            else:
+                rgba = np.empty(rgb.shape[:2] + (4,), dtype=np.uint8)
+                rgba[..., :3] = rgb
+                rgba[..., 3] = 255
+                key = self._store(rgba)
+            self._transitions[transition] = key
+        else:
+            self._textures.move_to_end(key)
+        return self._upload(key)
+
+    def clear(self):
+        """覚えているテクスチャを破棄する (次の set_tile で必ずアップロードする)"""
+        self._textures.clear()
+        self._transitions.clear()
+        self._resident = None
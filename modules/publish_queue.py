@@ -0,0 +1,111 @@
+import itertools
+import time
+from collections import deque, namedtuple
+
+# トピックごとの発行ポリシー
+#   qos:        MQTTのQoS
+#   coalesce:   Trueならブローカーに送れない間は最新の1件だけを残す (古い値は捨てる)
+#   max_queued: ブローカーに送れない間に保持する件数の上限 (超えたら古いものから捨てる)
+#   max_age:    保持しているメッセージの有効期限 (秒, Noneなら期限なし)。再接続時に古いものは送らない
+#   dedupe:     ペイロードから重複判定のキーを返す関数。直前に送ったものと同じキーなら送らない
+TopicPolicy = namedtuple("TopicPolicy", ["qos", "coalesce", "max_queued", "max_age", "dedupe"],
+                         defaults=(0, False, 32, None, None))
+
+
+class PublishQueue:
+    """ブローカーに送れない間のメッセージを、トピックごとのポリシーに従って保持するキュー
+
+    paho の publish() は接続が切れている間のメッセージを無制限に溜めるため、
+    その代わりにこのキューで件数と有効期限を制限し、再接続したら drain() で取り出して送る。
+    捨てたメッセージは on_discard(トピック, 理由) で通知する
+    (理由は "coalesced", "overflow", "stale", "duplicate" のいずれか)。
+    """
+
+    def __init__(self, policies=None, default_policy=TopicPolicy(), on_discard=None):
+        self.policies = dict(policies or {})
+        self.default_policy = default_policy
+        self.on_discard = on_discard
+        self._queues = {}
+        self._last_keys = {}
+        self._sequence = itertools.count()
+
+    def policy(self, topic):
+        return self.policies.get(topic, self.default_policy)
+
+    def _discard(self, topic, reason, count=1):
+        if self.on_discard is not None:
+            for _ in range(count):
+                self.on_discard(topic, reason)
+
+    def accept(self, topic, payload):
+        """直前に送ったものと重複していなければ True を返す (重複なら捨てて False を返す)
+
+        重複判定のキーはここでは覚えず、送れた (または put() で保持した) ときに record() で覚える。
+        送れずに捨てたメッセージを、後で送り直しても重複として捨てないようにするため。
+        """
+        dedupe = self.policy(topic).dedupe
+        if dedupe is None:
+            return True
+        key = dedupe(payload)
+        if key is not None and self._last_keys.get(topic) == key:
+            self._discard(topic, "duplicate")
+            return False
+        return True
+
+    def record(self, topic, payload):
+        """送ったメッセージの重複判定のキーを覚える"""
+        dedupe = self.policy(topic).dedupe
+        if dedupe is not None:
+            self._last_keys[topic] = dedupe(payload)
+
+    def _forget(self, topic, payload):
+        """保持していたメッセージを送らずに捨てたら、そのキーを忘れる (同じ内容をまた送れるように)"""
+        dedupe = self.policy(topic).dedupe
+        if dedupe is not None and self._last_keys.get(topic) == dedupe(payload):
+            del self._last_keys[topic]
+
+    def put(self, topic, payload, flags=0, now=None):
+        """送れなかったメッセージを保持する (重複判定のキーも覚える)
+
+        now は保持し始めた時刻。drain() で取り出したものを送れずに戻すときは、
+        有効期限が延びないよう drain() が返した時刻を渡す。
+        """
+        policy = self.policy(topic)
+        queue = self._queues.get(topic)
+        if queue is None:
+            queue = self._queues[topic] = deque()
+        if policy.coalesce and queue:
+            self._discard(topic, "coalesced", len(queue))
+            queue.clear()
+        elif len(queue) >= policy.max_queued:
+            _, _, dropped, _ = queue.popleft()
+            self._forget(topic, dropped)
+            self._discard(topic, "overflow")
+        queue.append((next(self._sequence), time.monotonic() if now is None else now, payload, flags))
+        self.record(topic, payload)
+
+    def pending(self, topic):
+        """トピックに保持しているメッセージがあるか (あれば順序を保つため後続も保持する)"""
+        return bool(self._queues.get(topic))
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def drain(self, now=None):
+        """保持しているメッセージを受け取った順に (トピック, ペイロード, フラグ, 保持し始めた時刻) で返し、キューを空にする
+
+        有効期限を過ぎたものは捨てる。
+        """
+        now = time.monotonic() if now is None else now
+        entries = []
+        for topic, queue in self._queues.items():
+            max_age = self.policy(topic).max_age
+            for sequence, queued_at, payload, flags in queue:
+                if max_age is not None and now - queued_at > max_age:
+                    self._forget(topic, payload)
+                    self._discard(topic, "stale")
+                else:
+                    entries.append((sequence, topic, payload, flags, queued_at))
+            queue.clear()
+        entries.sort(key=lambda entry: entry[0])
+        return [entry[1:] for entry in entries]
@@ -0,0 +1,96 @@
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RotationFrameCache:
+    """回転アニメーションのフレームを (テクスチャ, 軸, 向き) ごとに保持するキャッシュ
+
+    1つの回転のフレームは (フレーム数, 高さ, 幅, 3) の uint8 配列1つにまとめて持つ。
+    合計サイズが max_bytes を超えたら、使われていないものから捨てる。
+    フレームは prerender() でレンダースレッドの空き時間に1フレームずつ描画して作る。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()  # (テクスチャのハッシュ, 軸, 向き) → フレームの配列
+        self.total_bytes = 0
+
+        # 統計情報
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        return key in self._frames
+
+    def get(self, texture_key, axis, direction):
+        """キャッシュしたフレームを返す (なければNone)"""
+        key = (texture_key, axis, direction)
+        frames = self._frames.get(key)
+        if frames is None:
+            self.misses += 1
+            return None
+        self._frames.move_to_end(key)
+        self.hits += 1
+        return frames
+
+    def put(self, texture_key, axis, direction, frames):
+        """フレームを追加し、上限を超えた分を古いものから捨てる"""
+        key = (texture_key, axis, direction)
+        old = self._frames.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old.nbytes
+        if frames.nbytes > self.max_bytes:
+            return
+        self._frames[key] = frames
+        self.total_bytes += frames.nbytes
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self.total_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self._frames.clear()
+        self.total_bytes = 0
+
+    def prerender(self, texture_key, rotations, angles, render, is_current):
+        """texture_key のテクスチャについて、まだキャッシュにない回転のフレームを作るジェネレータ
+
+        1フレーム描画するごとに yield するので、レンダーループの空き時間に少しずつ進められる。
+
+        Args:
+            texture_key: 描画するテクスチャのハッシュ
+            rotations: (軸, 向き) の一覧
+            angles: 1フレームごとの回転角 (向きが正の場合)
+            render: render(軸, 角度) で、その角度のフレームを (高さ, 幅, 3) の uint8 配列 (上の行が先頭) で返す関数。
+                呼び出しの前後でレンダラーの状態を変えないこと
+            is_current: texture_key のテクスチャがまだ表示中かを返す関数。
+                表示中でなくなったら (回転でテクスチャが変わった場合など) 途中で止める
+        """
+        rendered = False
+        for axis, direction in rotations:
+            if (texture_key, axis, direction) in self._frames:
+                continue
+            frames = None
+            for i, deg in enumerate(angles):
+                if not is_current():
+                    return
+                frame = render(axis, deg * direction)
+                if frames is None:
+                    frames = np.empty((len(angles),) + frame.shape, dtype=np.uint8)
+                frames[i] = frame
+                yield
+            if frames is not None:
+                # 各フレームは表示中のテクスチャで描画したものなので、途中で変わっていてもそのまま使える
+                self.put(texture_key, axis, direction, frames)
+                rendered = True
+        if rendered:
+            logger.info(f"Rotation frames cached: {len(self)} rotations, "
+                        f"{self.total_bytes / 1e6:.1f}/{self.max_bytes / 1e6:.1f} MB")
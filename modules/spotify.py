@@ -1,19 +1,78 @@
+import threading
+
 import spotipy
+from spotipy.cache_handler import MemoryCacheHandler
 from spotipy.oauth2 import SpotifyClientCredentials
 from modules import config
 
-# returns an image url of the album cover
-def get_album_url(track_id):
-    auth_manager = SpotifyClientCredentials(client_id=config.SPOTIFY_CLIENT_ID,client_secret=config.SPOTIFY_SECRET_KEY)
-    sp = spotipy.Spotify(auth_manager=auth_manager)
+# tracks() で1回のリクエストにまとめられるトラック数の上限 (Spotify APIの制限)
+MAX_TRACKS_PER_REQUEST = 50
 
-    # Get current playing
-    track = sp.track(track_id)
+# モジュール全体で使い回すクライアント (最初の呼び出しで作成する)
+_client = None
+_client_lock = threading.Lock()
 
-    # Ensure that a track is playing
-    if track is not None:
-        # Get the album art
-        return track['album']['images'][2]['url']
-    else:
+
+def get_client():
+    """Spotifyクライアントを返す
+
+    アクセストークンは有効期限が切れるまでメモリ上で使い回し、HTTP接続もセッションで使い回す。
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            auth_manager = SpotifyClientCredentials(client_id=config.SPOTIFY_CLIENT_ID,
+                                                    client_secret=config.SPOTIFY_SECRET_KEY,
+                                                    cache_handler=MemoryCacheHandler())
+            auth_manager.OAUTH_TOKEN_URL = config.SPOTIFY_TOKEN_URL
+            client = spotipy.Spotify(auth_manager=auth_manager)
+            client.prefix = config.SPOTIFY_API_PREFIX
+            _client = client
+        return _client
+
+
+def reset_client():
+    """クライアントを破棄する (次の呼び出しで設定を読み直して作り直す)"""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def get_track(track_id):
+    """トラック情報を取得する"""
+    return get_client().track(track_id)
+
+
+def tracks(track_ids):
+    """複数のトラック情報をまとめて取得し、{トラックID: トラック情報} を返す
+
+    存在しないトラックは結果に含めない。
+    """
+    client = get_client()
+    result = {}
+    track_ids = list(dict.fromkeys(track_ids))
+    for i in range(0, len(track_ids), MAX_TRACKS_PER_REQUEST):
+        response = client.tracks(track_ids[i:i + MAX_TRACKS_PER_REQUEST])
+        for track in response.get('tracks', []):
+            if track is not None:
+                result[track['id']] = track
+    return result
+
+
+def album_image_url(track, size=64):
+    """トラック情報から、size 以上で最も小さいアルバムアートのURLを返す"""
+    images = track['album']['images'] if track else None
+    if not images:
         return None
+    large_enough = [image for image in images if (image.get('width') or 0) >= size]
+    if large_enough:
+        return min(large_enough, key=lambda image: image['width'])['url']
+    return images[0]['url']
 
+
+# returns an image url of the album cover
+def get_album_url(track_id):
+    track = get_track(track_id)
+
+    # Ensure that a track is playing
+    return album_image_url(track)
@@ -0,0 +1,83 @@
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+# ヘッダ: マジック(2byte), バージョン(1byte), チャネル数(1byte), 幅(2byte), 高さ(2byte),
+# イベント名の長さ(1byte), トラックIDの長さ(1byte) のビッグエンディアン
+# ヘッダの後にイベント名、トラックID、画素 (幅 × 高さ × チャネル数, 行優先) が続く
+TRACK_HEADER = struct.Struct(">2sBBHHBB")
+TRACK_MAGIC = b"LJ"
+TRACK_VERSION = 1
+
+TrackMessage = namedtuple("TrackMessage", ["event", "track_id", "width", "height", "channels", "pixels"])
+
+
+class TrackMessageError(ValueError):
+    """不正なトラックメッセージを受信した場合の例外"""
+
+
+def encode_track_message(event, track_id=None, pixels=None, width=0, height=0, channels=3):
+    """トラックのイベントと画像をバイナリメッセージにエンコードする
+
+    Args:
+        event: librespot のイベント名
+        track_id: トラックID
+        pixels: RGBの画素データ (bytes)。画像がなければNone
+        width: 画像の幅
+        height: 画像の高さ
+        channels: 1画素あたりのバイト数
+    """
+    event_bytes = event.encode('utf-8')
+    track_bytes = (track_id or "").encode('utf-8')
+    if pixels is None:
+        pixels = b""
+        width = height = 0
+    if len(pixels) != width * height * channels:
+        raise TrackMessageError(f"Pixel data size {len(pixels)} does not match {width}x{height}x{channels}")
+    header = TRACK_HEADER.pack(TRACK_MAGIC, TRACK_VERSION, channels, width, height,
+                               len(event_bytes), len(track_bytes))
+    return b"".join((header, event_bytes, track_bytes, pixels))
+
+
+def is_track_message(payload):
+    """ペイロードがバイナリのトラックメッセージかどうか (従来のJSONと区別する)"""
+    return payload[:len(TRACK_MAGIC)] == TRACK_MAGIC
+
+
+def decode_track_message(payload):
+    """バイナリメッセージを TrackMessage に戻す (pixels はペイロードを参照する memoryview)"""
+    if len(payload) < TRACK_HEADER.size:
+        raise TrackMessageError(f"Track message too short: {len(payload)} bytes")
+    magic, version, channels, width, height, event_len, track_len = TRACK_HEADER.unpack_from(payload)
+    if magic != TRACK_MAGIC or version != TRACK_VERSION:
+        raise TrackMessageError(f"Unsupported track message (magic {magic!r}, version {version})")
+
+    view = memoryview(payload)
+    event_start = TRACK_HEADER.size
+    track_start = event_start + event_len
+    pixels_start = track_start + track_len
+    pixels_end = pixels_start + width * height * channels
+    if len(payload) != pixels_end:
+        raise TrackMessageError(f"Track message size mismatch: {len(payload)} != {pixels_end} bytes")
+
+    event = bytes(view[event_start:track_start]).decode('utf-8')
+    track_id = bytes(view[track_start:pixels_start]).decode('utf-8') or None
+    pixels = view[pixels_start:pixels_end] if width and height else None
+    return TrackMessage(event, track_id, width, height, channels, pixels)
+
+
+def pixels_to_array(message):
+    """メッセージの画素を (高さ, 幅, チャネル数) の uint8 配列として参照する (コピーしない)"""
+    if message.pixels is None:
+        return None
+    return np.frombuffer(message.pixels, dtype=np.uint8).reshape(message.height, message.width, message.channels)
+
+
+def track_message_key(payload):
+    """重複の判定に使う (イベント名, トラックID) を返す (トラックメッセージでなければNone)"""
+    try:
+        message = decode_track_message(payload)
+    except TrackMessageError:
+        return None
+    return message.event, message.track_id
@@ -1,28 +1,67 @@
 #!/usr/bin/env python3
 import paho.mqtt.client as mqtt
-import json
-import time
 import signal
 import sys
 import logging
 import socket
 import os
-import threading
+import selectors
 
 from modules import config
+from modules.ipc import FrameDecoder, FrameError, FLAG_RETAIN, FLAG_TRACE
+from modules.latency import stamp_trace
+from modules.publish_queue import PublishQueue, TopicPolicy
+from modules.track_message import track_message_key
+from modules import metrics
 
 # UNIXソケットパス
 SOCKET_PATH = config.SOCKET_PATH
+# ブローカーに送れないメッセージを保持している間、再接続を確認する間隔 (秒)
+OUTBOX_POLL_INTERVAL = 0.05
+# 接続切れを表す publish() のエラー
+# QoS 1以上のメッセージは paho が保持して再接続後に送り直すので、保持し直すのは QoS 0 のものだけ
+CONNECTION_ERRORS = (mqtt.MQTT_ERR_NO_CONN, mqtt.MQTT_ERR_CONN_LOST)
 
 # ログ設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# メトリクス
+connections_total = metrics.registry.counter("daemon_connections_total", "Socket client connections accepted")
+messages_received = metrics.registry.counter("daemon_messages_received_total", "Frames received from socket clients", ["topic"])
+messages_published = metrics.registry.counter("daemon_messages_published_total", "Messages published to the broker", ["topic"])
+publish_failures = metrics.registry.counter("daemon_publish_failures_total", "Messages the broker client rejected", ["topic"])
+invalid_frames = metrics.registry.counter("daemon_invalid_frames_total", "Connections closed because of an invalid frame")
+messages_coalesced = metrics.registry.counter("daemon_messages_coalesced_total",
+                                              "Held messages replaced by a newer one while the broker was unreachable", ["topic"])
+messages_dropped = metrics.registry.counter("daemon_messages_dropped_total",
+                                            "Messages dropped (overflow, stale or duplicate)", ["topic", "reason"])
+
+# トピックごとの発行ポリシー
+# ビートは最新の1件だけに意味があるので、接続が切れている間は最新のものだけを残し、古くなったら送らない。
+# トラックは取りこぼさないようQoS 1で送り、同じトラックの同じイベントが続いた場合は送らない。
+TOPIC_POLICIES = {
+    f"{config.MQTT_TOPIC_BASE}/beats": TopicPolicy(qos=config.MQTT_BEATS_QOS, coalesce=True,
+                                                   max_age=config.MQTT_BEATS_MAX_AGE),
+    f"{config.MQTT_TOPIC_BASE}/track": TopicPolicy(qos=config.MQTT_TRACK_QOS, max_queued=config.MQTT_OUTBOX_SIZE,
+                                                   dedupe=track_message_key),
+}
+DEFAULT_POLICY = TopicPolicy(max_queued=config.MQTT_OUTBOX_SIZE)
+
+def count_discarded(topic, reason):
+    if reason == "coalesced":
+        messages_coalesced.labels(topic).inc()
+    else:
+        messages_dropped.labels(topic, reason).inc()
+
 class MQTTDaemon:
     def __init__(self):
         self.running = True
         self.mqtt_client = None
         self.server_socket = None
+        self.selector = selectors.DefaultSelector()
+        # ブローカーに送れない間のメッセージ
+        self.outbox = PublishQueue(TOPIC_POLICIES, DEFAULT_POLICY, on_discard=count_discarded)
         
     def setup_mqtt(self):
         """MQTTクライアントを設定して接続する"""
@@ -38,6 +77,8 @@ class MQTTDaemon:
                     logger.error(f"Failed to connect to MQTT broker with code: {rc}")
             
             client.on_connect = on_connect
+            # QoS 1以上で送信中のメッセージの上限 (超えた分は publish() がエラーを返す)
+            client.max_queued_messages_set(config.MQTT_OUTBOX_SIZE)
             
             # ポート番号を整数型に変換して接続
             mqtt_port = int(config.MQTT_PORT) if isinstance(config.MQTT_PORT, str) else config.MQTT_PORT
@@ -70,34 +111,117 @@ class MQTTDaemon:
             logger.error(f"Error setting up socket server: {e}")
             return False
     
-    def handle_client(self, client_socket):
-        """クライアントからの接続を処理する"""
+    def accept_client(self):
+        """新しいクライアント接続を受け付けてセレクタに登録する"""
+        client_socket, _ = self.server_socket.accept()
+        client_socket.setblocking(False)
+        # 接続ごとにフレームデコーダを持たせる
+        self.selector.register(client_socket, selectors.EVENT_READ, FrameDecoder())
+        connections_total.inc()
+        logger.info("Client connected")
+
+    def close_client(self, client_socket):
+        """クライアント接続を閉じてセレクタから外す"""
+        self.selector.unregister(client_socket)
+        client_socket.close()
+
+    def handle_client(self, client_socket, decoder):
+        """クライアントから届いたデータを読み、完成したフレームから順に発行する"""
         try:
-            data = b""
-            while True:
-                chunk = client_socket.recv(4096)
-                if not chunk:
-                    break
-                data += chunk
-            
-            if data:
-                msg_data = json.loads(data.decode('utf-8'))
-                topic = msg_data.get('topic', f"{config.MQTT_TOPIC_BASE}/spotify")
-                payload = msg_data.get('payload', {})
-                
-                # MQTTにメッセージを発行
-                result = self.mqtt_client.publish(topic, json.dumps(payload))
-                
-                if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                    logger.info(f"Published message to topic {topic} successfully")
-                else:
-                    logger.error(f"Failed to publish message, error code: {result.rc}")
-                    
+            chunk = client_socket.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.error(f"Error reading from client: {e}")
+            self.close_client(client_socket)
+            return
+
+        if not chunk:
+            logger.info("Client disconnected")
+            self.close_client(client_socket)
+            return
+
+        try:
+            frames = decoder.feed(chunk)
+        except FrameError as e:
+            logger.error(f"Invalid frame from client, closing connection: {e}")
+            invalid_frames.inc()
+            self.close_client(client_socket)
+            return
+
+        for topic, payload, flags in frames:
+            messages_received.labels(topic).inc()
+            if flags & FLAG_TRACE:
+                # 遅延の計測用に、受け取った時刻をトレースに書き加える
+                payload = stamp_trace(payload, "daemon")
+            self.publish_message(topic, payload, flags)
+
+    def publish_message(self, topic, payload, flags=0):
+        """受け取ったペイロードをトピックのポリシーに従ってMQTTに発行する
+
+        ブローカーに接続していない間は outbox に保持し、再接続後に flush_outbox() で送る。
+        """
+        if not topic:
+            topic = f"{config.MQTT_TOPIC_BASE}/spotify"
+        if not self.outbox.accept(topic, payload):
+            logger.debug(f"Dropped duplicate message for topic {topic}")
+            return
+        # 保持中のメッセージがあれば、順序を保つため後ろに並べる
+        if self.outbox.pending(topic) or not self.mqtt_client.is_connected():
+            self.outbox.put(topic, payload, flags)
+            return
+        self.send_to_broker(topic, payload, flags)
+
+    def send_to_broker(self, topic, payload, flags=0, queued_at=None):
+        """MQTTにメッセージを発行する
+
+        ブローカーに渡せなかったが後で送れるもの (QoS 0で接続切れ・pahoの送信キューが満杯) は
+        outbox に戻し、False を返す。それ以外は (送れなかった場合も) True を返す。
+        queued_at は outbox から取り出したメッセージを保持し始めた時刻 (戻しても有効期限が延びないように)。
+        """
+        try:
+            qos = self.outbox.policy(topic).qos
+            result = self.mqtt_client.publish(topic, payload, qos=qos, retain=bool(flags & FLAG_RETAIN))
+
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.outbox.record(topic, payload)
+                messages_published.labels(topic).inc()
+                logger.debug(f"Published message to topic {topic} successfully")
+            elif result.rc in CONNECTION_ERRORS and qos > 0:
+                # paho が保持して再接続後に送り直すので、outbox には戻さない (二重に送らないように)
+                self.outbox.record(topic, payload)
+                logger.debug(f"Connection lost, paho will resend message for topic {topic}")
+            elif result.rc in CONNECTION_ERRORS or result.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+                # 接続が切れた直後か送信キューが満杯なので、保持して後で送り直す
+                logger.debug(f"Holding message for topic {topic}, error code: {result.rc}")
+                self.outbox.put(topic, payload, flags, now=queued_at)
+                return False
+            else:
+                publish_failures.labels(topic).inc()
+                logger.error(f"Failed to publish message, error code: {result.rc}")
+
         except Exception as e:
-            logger.error(f"Error handling client connection: {e}")
-        finally:
-            client_socket.close()
-    
+            publish_failures.labels(topic).inc()
+            logger.error(f"Error publishing message: {e}")
+        return True
+
+    def flush_outbox(self):
+        """ブローカーに再接続していれば、保持していたメッセージを送る"""
+        if not self.mqtt_client.is_connected():
+            return
+        messages = self.outbox.drain()
+        sent = 0
+        for topic, payload, flags, queued_at in messages:
+            if not self.send_to_broker(topic, payload, flags, queued_at):
+                # 送れなくなったら、順序を保つため残りも保持し直して次の機会に送る
+                # (保持し始めた時刻はそのままにして、古くなったものは期限切れで捨てる)
+                for rest_topic, rest_payload, rest_flags, rest_queued_at in messages[sent + 1:]:
+                    self.outbox.put(rest_topic, rest_payload, rest_flags, now=rest_queued_at)
+                break
+            sent += 1
+        if sent:
+            logger.info(f"Broker reachable again, sent {sent} held messages")
+
     def run(self):
         """デーモンのメインループ"""
         # MQTTクライアントのセットアップ
@@ -126,19 +250,31 @@ class MQTTDaemon:
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
         
+        # 接続中のクライアント数 (待ち受けソケットを除く)
+        metrics.registry.gauge("daemon_socket_connections", "Socket clients currently connected",
+                               func=lambda: max(0, len(self.selector.get_map()) - 1))
+        metrics.registry.gauge("daemon_outbox_messages", "Messages held while the broker is unreachable",
+                               func=lambda: len(self.outbox))
+        metrics.start_http_server(config.MQTT_DAEMON_METRICS_PORT, config.METRICS_HOST)
+
         logger.info("MQTT daemon is running...")
         
-        # クライアント接続を処理
+        # 待ち受けソケットと全クライアント接続を1つのセレクタで処理する
+        self.server_socket.setblocking(False)
+        self.selector.register(self.server_socket, selectors.EVENT_READ, None)
+
         while self.running:
             try:
-                self.server_socket.settimeout(1.0)  # タイムアウトを設定してCtrl+Cに応答できるようにする
-                try:
-                    client_socket, _ = self.server_socket.accept()
-                    client_thread = threading.Thread(target=self.handle_client, args=(client_socket,))
-                    client_thread.daemon = True
-                    client_thread.start()
-                except socket.timeout:
-                    continue
+                # タイムアウトを設定してCtrl+Cに応答できるようにする
+                # (保持中のメッセージがあれば再接続をこまめに確認する)
+                timeout = OUTBOX_POLL_INTERVAL if len(self.outbox) else 1.0
+                for key, _ in self.selector.select(timeout=timeout):
+                    if key.data is None:
+                        self.accept_client()
+                    else:
+                        self.handle_client(key.fileobj, key.data)
+                if len(self.outbox):
+                    self.flush_outbox()
             except Exception as e:
                 if self.running:  # 終了処理中でなければエラーログを出力
                     logger.error(f"Error in main loop: {e}")
@@ -3,5 +3,10 @@ echo $PLAYER_EVENT
 echo $TRACK_ID
 
 cd /usr/local/bin/LED-Jukebox
+
+# 常駐している track_publisher サービスにイベントを渡す
+python3 track_event.py && exit 0
+
+# サービスが動いていない場合は従来どおりイベントごとに起動する
 source venv/bin/activate
-python track_publisher.py "$TRACK_ID" "$PLAYER_EVENT"
\ No newline at end of file
+python track_publisher.py "$TRACK_ID" "$PLAYER_EVENT"
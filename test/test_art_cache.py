@@ -0,0 +1,51 @@
+import sys
+import os
+import tempfile
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.art_cache import ArtCache
+
+BITMAP_SIZE = 64 * 64 * 3
+
+
+def bitmap(value):
+    return bytes([value]) * BITMAP_SIZE
+
+
+def test_album_alias_and_persistence():
+    """同じアルバムのトラックが1つのビットマップを共有し、再起動後も引けることを確認する"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ArtCache(tmpdir)
+        cache.put(bitmap(1), track_id="t1", album_id="a1")
+        assert cache.get("t1") == bitmap(1)
+        assert cache.get("t2") is None
+        assert cache.get("t2", "a1") == bitmap(1)
+        assert len(cache) == 1
+
+        reopened = ArtCache(tmpdir)
+        assert reopened.get("t2") == bitmap(1)
+        assert reopened.total_bytes == BITMAP_SIZE
+
+
+def test_lru_eviction():
+    """上限を超えたら最後に使われた時刻が最も古いビットマップから削除することを確認する"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ArtCache(tmpdir, max_bytes=2 * BITMAP_SIZE)
+        cache.put(bitmap(1), track_id="t1", album_id="a1")
+        cache.put(bitmap(2), track_id="t2", album_id="a2")
+        # t1 を使ってから3つ目を入れると、使われていない t2 が削除される
+        cache._blobs[cache._tracks["t1"]][1] += 10
+        cache.put(bitmap(3), track_id="t3", album_id="a3")
+
+        assert cache.get("t1") == bitmap(1)
+        assert cache.get("t2", "a2") is None
+        assert cache.get("t3") == bitmap(3)
+        assert len(os.listdir(os.path.join(tmpdir, "blobs"))) == 2
+
+
+if __name__ == "__main__":
+    test_album_alias_and_persistence()
+    test_lru_eviction()
+    print("ok")
@@ -0,0 +1,55 @@
+import sys
+import os
+
+import numpy as np
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.audio_reactor import AudioBlockRing
+
+
+def block(value, frames=4, channels=2):
+    return np.full((frames, channels), value, dtype=np.float32)
+
+
+def test_overflow_drops_oldest():
+    """満杯のときは最も古いブロックを捨て、オーバーランと最大深さを数えることを確認する"""
+    ring = AudioBlockRing(3, 4, 2)
+    for value in range(5):
+        ring.put(block(value))
+    assert ring.depth == 3
+    assert ring.overruns == 2
+    assert ring.max_depth == 3
+    assert ring.total_blocks == 5
+
+    out = np.zeros((4, 2), dtype=np.float32)
+    values = []
+    while ring.get(out, timeout=0):
+        values.append(out[0, 0])
+    assert values == [2, 3, 4]
+    assert ring.depth == 0 and ring.max_depth == 3
+
+
+def test_partial_block_is_zero_padded():
+    """ブロックサイズに満たないブロックは残りをゼロで埋め、前の内容が残らないことを確認する"""
+    ring = AudioBlockRing(1, 4, 2)
+    out = np.zeros((4, 2), dtype=np.float32)
+    ring.put(block(1.0))
+    assert ring.get(out, timeout=0)
+    ring.put(block(2.0, frames=3))
+    assert ring.get(out, timeout=0)
+    assert np.array_equal(out[:, 0], [2.0, 2.0, 2.0, 0.0])
+    assert ring.overruns == 0
+
+
+def test_get_times_out_when_empty():
+    ring = AudioBlockRing(2, 4, 2)
+    assert not ring.get(np.zeros((4, 2), dtype=np.float32), timeout=0.01)
+
+
+if __name__ == "__main__":
+    test_overflow_drops_oldest()
+    test_partial_block_is_zero_padded()
+    test_get_times_out_when_empty()
+    print("ok")
@@ -0,0 +1,171 @@
+import sys
+import os
+from collections import deque
+
+import numpy as np
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.audio_reactor import AudioReactor
+from modules.beat_detectors import TempoTracker
+
+SAMPLE_RATE = 48000
+
+
+def click_track(bpm, seconds, first=0.25, seed=0):
+    """bpm の間隔でキック (70Hzの減衰正弦波 + 短いノイズ) を鳴らすステレオ音声と、その時刻を返す"""
+    rng = np.random.default_rng(seed)
+    mono = rng.normal(0, 1e-3, int(SAMPLE_RATE * seconds))
+    onsets = np.arange(first, seconds - 0.3, 60.0 / bpm)
+    t = np.arange(int(0.1 * SAMPLE_RATE)) / SAMPLE_RATE
+    for onset in onsets:
+        start = int(onset * SAMPLE_RATE)
+        mono[start:start + len(t)] += (0.8 * np.exp(-t / 0.03) * np.sin(2 * np.pi * 70 * t)
+                                       + 0.3 * np.exp(-t / 0.003) * rng.normal(0, 1, len(t)))
+    return np.stack([mono, mono], axis=1).astype(np.float32), onsets
+
+
+def run_reactor(reactor, samples):
+    """音声をブロックごとに流し、帯域ごとのオンセット時刻 (ストリーム先頭からの秒数) を返す"""
+    block_size = reactor.block_size
+    found = {name: [] for name in reactor.band_names}
+    for i in range(len(samples) // block_size):
+        reactor.detect_beats(samples[i * block_size:(i + 1) * block_size])
+        for name, offset in reactor.onset_offsets().items():
+            found[name].append(i * block_size / SAMPLE_RATE + offset)
+    return found
+
+
+def baseline_detect_beats(reactor, samples):
+    """ベクトル化する前の detect_beats() と同じ手順 (帯域ごとのループ) で、ブロックごとの検出結果を返す"""
+    block_size = reactor.block_size
+    histories = {name: deque([0.0] * reactor.history_len, maxlen=reactor.history_len) for name in reactor.band_names}
+    cooldowns = {name: 0 for name in reactor.band_names}
+    results = []
+    for i in range(len(samples) // block_size):
+        mono = np.mean(samples[i * block_size:(i + 1) * block_size], axis=1)
+        amplitude = np.abs(np.fft.rfft(mono * np.hanning(block_size)))
+        detected = {}
+        for name in reactor.band_names:
+            energy = np.sum(amplitude[reactor.band_indices[name]])
+            detected[name] = bool(cooldowns[name] == 0
+                                  and energy > np.mean(histories[name]) * reactor.threshold_ratio[name]
+                                  and energy > reactor.min_energy_threshold[name])
+            if detected[name]:
+                cooldowns[name] = reactor.cooldown_blocks[name]
+            histories[name].append(energy)
+            if cooldowns[name] > 0:
+                cooldowns[name] -= 1
+        results.append(detected)
+    return results
+
+
+def test_energy_detector_matches_baseline():
+    """ベクトル化した detect_beats() が、従来の帯域ごとのループとブロックごとに同じ結果になることを確認する"""
+    samples, onsets = click_track(120, 10.0)
+    reactor = AudioReactor(log_beats=False)
+    expected = baseline_detect_beats(reactor, samples)
+    block_size = reactor.block_size
+    actual = [reactor.detect_beats(samples[i * block_size:(i + 1) * block_size])
+              for i in range(len(samples) // block_size)]
+    assert actual == expected
+    # 履歴がゼロから始まるため最初の数ブロックはノイズで検出し、最初のキックはクールダウン中になる。
+    # それ以降はキックを含むブロックごとに低域のビートを1回ずつ検出する (従来と同じ)
+    bass_blocks = [i for i, result in enumerate(actual) if result["Bass"]]
+    assert bass_blocks == [0, 4] + [int(onset * SAMPLE_RATE) // block_size for onset in onsets[1:]]
+
+
+def test_flux_detects_clicks():
+    """スペクトルフラックス検出器がクリックごとに1回ずつ、1ホップ以内の誤差で検出することを確認する"""
+    samples, onsets = click_track(120, 8.0)
+    reactor = AudioReactor(detector="flux", hop_size=600, log_beats=False)
+    found = run_reactor(reactor, samples)
+    hop = reactor.hop_size / SAMPLE_RATE
+    for name in reactor.band_names:
+        assert len(found[name]) == len(onsets), name
+        assert np.all(np.abs(np.array(found[name]) - onsets) <= hop), name
+
+
+def test_flux_ignores_steady_noise():
+    samples, _ = click_track(120, 4.0, first=10.0)  # クリックなし
+    reactor = AudioReactor(detector="flux", hop_size=600, log_beats=False)
+    assert all(not times for times in run_reactor(reactor, samples).values())
+
+
+def test_overlapping_frames_locate_onset():
+    """窓長がブロックより長い場合も、オンセットを含むホップの位置を1ホップ以内で返すことを確認する"""
+    sample_rate = 51200
+    onset = sample_rate + 77  # ブロック (256サンプル) の途中から鳴り始める
+    rng = np.random.default_rng(0)
+    mono = rng.normal(0, 1e-4, 2 * sample_rate)
+    t = np.arange(len(mono) - onset) / sample_rate
+    mono[onset:] += 0.5 * np.sin(2 * np.pi * 70 * t)
+    samples = np.stack([mono, mono], axis=1).astype(np.float32)
+
+    for hop_size in (128, 256, 512):
+        reactor = AudioReactor(sample_rate=sample_rate, block_duration_ms=5, fft_size=4096, hop_size=hop_size,
+                               freq_bands={"Bass": (50, 100)}, detector="flux", log_beats=False)
+        block_size = reactor.block_size
+        assert block_size == 256
+        found = []
+        for i in range(len(samples) // block_size):
+            reactor.detect_beats(samples[i * block_size:(i + 1) * block_size])
+            offsets = reactor.onset_offsets()
+            if offsets:
+                found.append(i * block_size + round(offsets["Bass"] * sample_rate))
+                captured_at = 100.0
+                times = reactor.onset_times(captured_at)
+                assert times["Bass"] == captured_at - block_size / sample_rate + offsets["Bass"]
+        assert len(found) == 1, hop_size
+        # 報告される位置はホップの境界で、オンセットを含むホップの先頭から1ホップ以内
+        hop_start = onset // hop_size * hop_size
+        assert found[0] % hop_size == 0, hop_size
+        assert hop_start <= found[0] <= hop_start + hop_size, hop_size
+
+
+def test_tempo_converges_on_click_track():
+    """クリックのテンポに収束し、次のビートを予測できることを確認する"""
+    samples, onsets = click_track(120, 8.0)
+    reactor = AudioReactor(detector="flux", hop_size=600, log_beats=False, tempo_band="Bass")
+    run_reactor(reactor, samples)
+    assert abs(reactor.tempo.bpm - 120) < 1
+    assert reactor.tempo.confidence >= 0.5
+
+    captured_at = 1000.0
+    prediction = reactor.tempo_prediction(captured_at)
+    stream_now = reactor._sample_count / SAMPLE_RATE
+    expected = onsets[-1] + 60.0 / 120
+    while expected <= stream_now:
+        expected += 60.0 / 120
+    assert abs(prediction["next_beat"] - (captured_at + expected - stream_now)) < 0.02
+
+
+def test_tempo_tracker_folds_and_predicts():
+    """裏拍を含むオンセットからも周期を範囲内に折り返して推定し、次のビートを予測することを確認する"""
+    tracker = TempoTracker()
+    assert tracker.next_beat(0.0) is None
+    rng = np.random.default_rng(1)
+    # 100 BPM (0.6秒) のビートに、倍の間隔や少しの揺れを混ぜる
+    beats = [0.0, 0.6, 1.8, 2.4, 3.0, 4.2, 4.8, 5.4, 6.0, 6.6, 7.2]
+    for t in beats:
+        tracker.add_onset(t + rng.uniform(-0.01, 0.01))
+    assert abs(tracker.bpm - 100) < 2
+    assert tracker.confidence >= 0.5
+    next_beat = tracker.next_beat(7.5)
+    assert 7.5 < next_beat and abs(next_beat - 7.8) < 0.05
+
+    # 予測から外れたオンセットでは周期を変えず、信頼度だけ下げる
+    period, confidence = tracker.period, tracker.confidence
+    tracker.add_onset(7.5)
+    assert tracker.period == period and tracker.confidence < confidence
+
+
+if __name__ == "__main__":
+    test_energy_detector_matches_baseline()
+    test_flux_detects_clicks()
+    test_flux_ignores_steady_noise()
+    test_overlapping_frames_locate_onset()
+    test_tempo_converges_on_click_track()
+    test_tempo_tracker_folds_and_predicts()
+    print("ok")
@@ -0,0 +1,28 @@
+import sys
+import os
+
+# モジュール検索パスにプロジェクトのルートディレクトリとtoolsを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tools')))
+
+from beats_benchmark import f_measure, match_onsets
+
+
+def test_match_onsets_one_to_one():
+    """1つの正解に複数の検出が近くても一致は1つとして数えることを確認する"""
+    reference = [1.0, 2.0, 3.0]
+    estimated = [0.98, 1.02, 2.04, 3.2]
+    assert match_onsets(reference, estimated, 0.05) == 2
+
+
+def test_f_measure():
+    score, precision, recall = f_measure([1.0, 2.0, 3.0, 4.0], [1.01, 2.0, 5.0], tolerance=0.05)
+    assert precision == 2 / 3
+    assert recall == 0.5
+    assert abs(score - 4 / 7) < 1e-9
+
+
+if __name__ == "__main__":
+    test_match_onsets_one_to_one()
+    test_f_measure()
+    print("ok")
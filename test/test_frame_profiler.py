@@ -0,0 +1,68 @@
+import sys
+import os
+import pstats
+import tempfile
+import time
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.frame_profiler import FrameProfiler
+
+
+def render_frame(profiler):
+    profiler.begin()
+    time.sleep(0.001)
+    profiler.lap("draw")
+    profiler.lap("present")
+    profiler.end()
+
+
+def test_stage_timings():
+    """有効にしている間だけ段階ごとの時間が記録されることを確認する"""
+    profiler = FrameProfiler(window=10, log_interval=float("inf"))
+    render_frame(profiler)
+    assert profiler.stats.summary() == {}
+
+    profiler.enable()
+    for _ in range(20):
+        render_frame(profiler)
+    summary = profiler.stats.summary()
+    assert list(summary) == ["draw", "present", "frame"]
+    assert summary["draw"]["count"] == 10  # 直近 window フレーム分だけ保持する
+    assert summary["draw"]["p50"] >= 1.0
+    assert summary["frame"]["p50"] >= summary["draw"]["p50"]
+    assert profiler.stats.format("frame stages").startswith("frame stages p50/p95/p99 ms: draw")
+
+    profiler.disable()
+    render_frame(profiler)
+    assert profiler.stats.summary()["draw"]["count"] == 10
+
+
+def test_capture():
+    """capture_for() で指定した秒数のプロファイルが pstats 形式で保存されることを確認する"""
+    profiler = FrameProfiler()
+    tasks = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "profiles", "render.pstats")
+        profiler.capture_for(0.05, path, lambda func, *args: tasks.append((func, args)))
+        # レンダースレッドの代わりに登録された処理を順に実行する
+        func, args = tasks.pop(0)
+        func(*args)
+        assert profiler.capturing
+        for _ in range(5):
+            render_frame(profiler)
+        deadline = time.monotonic() + 5
+        while not tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        func, args = tasks.pop(0)
+        assert func(*args) == path
+        assert not profiler.capturing
+        stats = pstats.Stats(path)
+        assert any(name == "render_frame" for _, _, name in stats.stats)
+
+
+if __name__ == "__main__":
+    test_stage_timings()
+    test_capture()
+    print("ok")
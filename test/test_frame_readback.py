@@ -0,0 +1,101 @@
+import sys
+import os
+import types
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    import OpenGL.GL  # noqa: F401
+except ImportError:
+    # PyOpenGL がない環境でも読み込めるようにする (GLの呼び出しはすべて FakeGL に置き換える)
+    sys.modules["OpenGL"] = types.ModuleType("OpenGL")
+    sys.modules["OpenGL"].GL = types.ModuleType("OpenGL.GL")
+    sys.modules["OpenGL.GL"] = sys.modules["OpenGL"].GL
+
+from modules import frame_readback
+from modules.frame_readback import FrameReadback
+
+
+class FakeGL:
+    """FBOの内容を番号で持ち、PBOへの読み出しと取り出しを真似るGL"""
+
+    GL_FRAMEBUFFER = 1
+    GL_PACK_ALIGNMENT = 2
+    GL_PIXEL_PACK_BUFFER = 3
+    GL_STREAM_READ = 4
+    GL_RGB = 5
+    GL_UNSIGNED_BYTE = 6
+
+    def __init__(self):
+        self.fbo_value = 0  # FBOに描画されているフレームの番号
+        self.buffers = {}
+        self.bound = 0
+
+    def glGenBuffers(self, count):
+        ids = list(range(len(self.buffers) + 1, len(self.buffers) + 1 + count))
+        for pbo in ids:
+            self.buffers[pbo] = None
+        return ids
+
+    def glBindBuffer(self, target, pbo):
+        self.bound = pbo
+
+    def glBufferData(self, target, size, data, usage):
+        pass
+
+    def glBindFramebuffer(self, target, fbo):
+        pass
+
+    def glPixelStorei(self, name, value):
+        pass
+
+    def glReadPixels(self, x, y, width, height, fmt, type_, dest):
+        if self.bound:
+            self.buffers[self.bound] = self.fbo_value
+        else:
+            dest[...] = self.fbo_value
+
+    def glGetBufferSubData(self, target, offset, size, dest):
+        dest[...] = self.buffers[self.bound]
+
+    def glDeleteBuffers(self, count, pbos):
+        pass
+
+
+def present_sequence(gl, readback, values):
+    """values の順に描画して streaming で読み出し、表示されたフレームの番号を返す"""
+    presented = []
+    for value in values:
+        gl.fbo_value = value
+        frame = readback.read()
+        if frame is not None:
+            presented.append(int(frame[0, 0, 0]))
+    frame = readback.flush()
+    if frame is not None:
+        presented.append(int(frame[0, 0, 0]))
+    return presented
+
+
+def test_pbo_frames_presented_once_in_order():
+    """PBOの読み出しで各フレームがちょうど1回ずつ、順番どおりに返ることを確認する"""
+    gl = FakeGL()
+    original = frame_readback.GL
+    frame_readback.GL = gl
+    try:
+        readback = FrameReadback(4, 2, use_pbo=True)
+        assert readback.uses_pbo
+        assert present_sequence(gl, readback, range(1, 19)) == list(range(1, 19))
+        assert readback.flush() is None
+
+        # 同期読み出しは現在のフレームを返し、その後の streaming はまた1フレーム遅れで始まる
+        gl.fbo_value = 50
+        assert int(readback.read(sync=True)[0, 0, 0]) == 50
+        assert present_sequence(gl, readback, [51, 52, 53]) == [51, 52, 53]
+    finally:
+        frame_readback.GL = original
+
+
+if __name__ == "__main__":
+    test_pbo_frames_presented_once_in_order()
+    print("ok")
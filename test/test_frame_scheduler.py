@@ -0,0 +1,126 @@
+import sys
+import os
+import threading
+import time
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.frame_scheduler import FrameScheduler
+
+
+def start(scheduler):
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    return thread
+
+
+def finish(scheduler, thread):
+    scheduler.stop()
+    thread.join(1.0)
+    assert not thread.is_alive()
+
+
+def animation(played, name, frames=2, done=None):
+    """frames フレームの間 played に name を記録し、終わったら done を立てるアニメーション"""
+    def factory():
+        for _ in range(frames):
+            played.append(name)
+            yield
+        if done is not None:
+            done.set()
+    return factory
+
+
+def idle_event():
+    """アイドル処理として1回だけ呼ばれたら立つイベントと、その処理を返す"""
+    event = threading.Event()
+
+    def idle():
+        event.set()
+        return False
+    return event, idle
+
+
+def test_requests_merge_into_pending_slot():
+    """再生待ちの要求は最新のものだけが残ることを確認する"""
+    scheduler = FrameScheduler(fps=200)
+    played = []
+    done = threading.Event()
+    scheduler.request_animation(animation(played, "a"))
+    scheduler.request_animation(animation(played, "b", done=done))
+    assert scheduler.merged_animations == 1
+
+    thread = start(scheduler)
+    assert done.wait(1.0)
+    finish(scheduler, thread)
+    assert played == ["b", "b"]
+    assert scheduler.started_animations == 1
+
+
+def test_stale_request_is_dropped():
+    """max_pending_age より古い要求は再生しないことを確認する"""
+    scheduler = FrameScheduler(fps=200, max_pending_age=0.25)
+    played = []
+    scheduler.request_animation(animation(played, "old"), requested_at=time.time() - 1.0)
+    # アイドル処理は要求を処理した後、アニメーションがないときに呼ばれる
+    idle_done, idle = idle_event()
+    scheduler.set_idle_task(idle)
+
+    thread = start(scheduler)
+    assert idle_done.wait(1.0)
+    finish(scheduler, thread)
+    assert played == []
+    assert scheduler.dropped_animations == 1 and scheduler.started_animations == 0
+
+
+def test_cancel_from_task():
+    """タスク内から cancel_animations() を呼ぶと再生中のアニメーションが止まることを確認する"""
+    scheduler = FrameScheduler(fps=200)
+    played = []
+    started = threading.Event()
+
+    def endless():
+        started.set()
+        while True:
+            played.append("frame")
+            yield
+
+    thread = start(scheduler)
+    scheduler.request_animation(endless)
+    assert started.wait(1.0)
+    idle_done, idle = idle_event()
+    scheduler.set_idle_task(idle)
+    scheduler.submit(scheduler.cancel_animations)
+    assert idle_done.wait(1.0)
+    frames = len(played)
+    time.sleep(0.05)
+    finish(scheduler, thread)
+    assert len(played) == frames
+
+
+def test_scheduled_animation_starts_on_time():
+    """予約したアニメーションが開始時刻を過ぎてからすぐに始まることを確認する"""
+    scheduler = FrameScheduler(fps=200)
+    started_at = []
+    done = threading.Event()
+
+    def factory():
+        started_at.append(time.time())
+        yield
+        done.set()
+
+    thread = start(scheduler)
+    start_at = time.time() + 0.05
+    scheduler.schedule_animation(factory, start_at)
+    assert done.wait(1.0)
+    finish(scheduler, thread)
+    assert start_at <= started_at[0] < start_at + 0.05
+
+
+if __name__ == "__main__":
+    test_requests_merge_into_pending_slot()
+    test_stale_request_is_dropped()
+    test_cancel_from_task()
+    test_scheduled_animation_starts_on_time()
+    print("ok")
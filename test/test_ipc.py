@@ -0,0 +1,126 @@
+import sys
+import os
+import logging
+import socket
+import tempfile
+import threading
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.ipc import BackgroundSender, DaemonClient, DatagramSender, FrameDecoder, bind_datagram_socket, encode_frame, FLAG_RETAIN
+
+
+def test_frame_roundtrip():
+    """分割して届いたフレームも元のトピックとペイロードに戻ることを確認する"""
+    data = encode_frame("led-jukebox/beats", {"beats": {"Bass": True}})
+    data += encode_frame("led-jukebox/track", b"\x00\x01\x02", flags=FLAG_RETAIN)
+
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(len(data)):
+        frames.extend(decoder.feed(data[i:i + 1]))
+
+    assert frames == [
+        ("led-jukebox/beats", b'{"beats": {"Bass": true}}', 0),
+        ("led-jukebox/track", b"\x00\x01\x02", FLAG_RETAIN),
+    ]
+
+
+def test_client_reconnects_after_server_restart():
+    """サーバーが再起動しても次の送信で自動的に再接続することを確認する"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "daemon.sock")
+
+        def start_server():
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(1)
+            return server
+
+        server = start_server()
+        client = DaemonClient(path, default_topic="led-jukebox/beats", reconnect_interval=0)
+        assert client.send({"n": 1})
+        conn, _ = server.accept()
+        assert FrameDecoder().feed(conn.recv(4096)) == [("led-jukebox/beats", b'{"n": 1}', 0)]
+
+        # サーバーを再起動する
+        conn.close()
+        server.close()
+        os.unlink(path)
+        server = start_server()
+
+        assert client.send({"n": 2})
+        conn, _ = server.accept()
+        assert FrameDecoder().feed(conn.recv(4096)) == [("led-jukebox/beats", b'{"n": 2}', 0)]
+
+        conn.close()
+        server.close()
+        client.close()
+
+
+def test_datagram_sender():
+    """受信側がいなければ捨て、いれば1メッセージ1データグラムで届くことを確認する"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "beats.sock")
+        sender = DatagramSender(path)
+        assert not sender.send({"n": 0})
+
+        receiver = bind_datagram_socket(path)
+        assert sender.send({"n": 1})
+        assert sender.send(b'{"n": 2}')
+        assert receiver.recv(4096) == b'{"n": 1}'
+        assert receiver.recv(4096) == b'{"n": 2}'
+
+        receiver.close()
+        sender.close()
+
+
+def test_connect_errors_are_rate_limited(caplog):
+    """デーモンに接続できない間、送信のたびにエラーを出さないことを確認する"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        client = DaemonClient(os.path.join(tmpdir, "missing.sock"), "led-jukebox/beats", reconnect_interval=0)
+        with caplog.at_level(logging.ERROR, logger="modules.ipc"):
+            for i in range(5):
+                assert not client.send({"n": i})
+        assert len(caplog.records) == 1
+
+
+class BlockingClient:
+    """release されるまで send() がブロックするクライアント"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.sent = []
+
+    def send(self, payload, topic=None, flags=0):
+        self.started.set()
+        self.release.wait()
+        self.sent.append(payload)
+        return True
+
+
+def test_background_sender_does_not_block():
+    """送信がブロックしていても put() はすぐ戻り、溢れた分は古いものから捨てることを確認する"""
+    client = BlockingClient()
+    sent = []
+    sender = BackgroundSender(client, max_queued=2, on_sent=lambda: sent.append(True))
+    sender.put(0)
+    assert client.started.wait(1.0)
+    for i in range(1, 5):
+        sender.put(i)
+    client.release.set()
+    sender.close()
+    # 送信中だった1件と、残りのうち新しい2件だけが送られる
+    assert client.sent == [0, 3, 4]
+    assert sender.dropped == 2
+    assert len(sent) == 3
+
+
+if __name__ == "__main__":
+    test_frame_roundtrip()
+    test_client_reconnects_after_server_restart()
+    test_datagram_sender()
+    test_background_sender_does_not_block()
+    print("ok")
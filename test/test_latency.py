@@ -0,0 +1,38 @@
+import sys
+import os
+import json
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.latency import LatencyStats, new_trace, stamp_trace
+
+
+def test_stamp_trace():
+    """トレースのあるペイロードだけに時刻が書き加えられることを確認する"""
+    trace = new_trace(100.0)
+    payload = json.dumps({"beats": {"Bass": True}, "trace": trace}).encode('utf-8')
+    stamped = json.loads(stamp_trace(payload, "daemon", now=100.5))
+    assert stamped["trace"] == dict(trace, daemon=100.5)
+
+    plain = json.dumps({"beats": {}}).encode('utf-8')
+    assert stamp_trace(plain, "daemon") is plain
+    assert stamp_trace(b"\x00binary", "daemon") == b"\x00binary"
+
+
+def test_record_trace():
+    stats = LatencyStats()
+    for i in range(100):
+        stats.record_trace({"captured": 0.0, "sent": 0.001, "daemon": 0.002, "received": 0.004,
+                            "started": 0.005 + i * 0.0001, "presented": 0.020})
+    summary = stats.summary()
+    assert summary["detect"]["count"] == 100
+    assert abs(summary["broker"]["p50"] - 2.0) < 1e-6
+    assert abs(summary["total"]["p99"] - 20.0) < 1e-6
+    assert stats.format().startswith("latency p50/p95/p99 ms: detect")
+
+
+if __name__ == "__main__":
+    test_stamp_trace()
+    test_record_trace()
+    print("ok")
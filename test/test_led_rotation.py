@@ -0,0 +1,143 @@
+import sys
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# 読み込むだけではLEDマトリクスやOpenGLを初期化しない
+import led_subscriber
+from modules.panorama_textures import PanoramaTextures
+from modules.rotation_cache import RotationFrameCache
+
+
+class FakeRenderer:
+    """回転角だけパノラマを横にずらして描画するレンダラー (テクスチャを設定すると回転は元に戻る)"""
+
+    def __init__(self):
+        self.texture = None
+        self.angles = {}
+        self.frame = None
+        self.draws = 0
+
+    def set_panorama_texture(self, img):
+        self.texture = np.asarray(img.convert("RGB"))
+        self.angles = {}
+
+    def rotate(self, axis, deg):
+        self.angles[axis] = deg
+
+    def on_draw(self):
+        shift = int(sum(self.angles.values()) / 90 * 4)
+        self.frame = np.roll(self.texture, shift, axis=1)
+        self.draws += 1
+
+    def get_current_panorama_frame(self):
+        return Image.fromarray(self.frame)
+
+    def state(self):
+        return {axis: deg for axis, deg in self.angles.items() if deg}, self.texture.tobytes(), self.frame.tobytes()
+
+
+class FakeMatrix:
+    def __init__(self):
+        self.presented = 0
+
+    def present(self, frame, flip_vertical=False):
+        self.presented += 1
+
+
+def setup_display(monkeypatch):
+    renderer = FakeRenderer()
+    textures = PanoramaTextures(renderer)
+    monkeypatch.setattr(led_subscriber, "renderer", renderer)
+    monkeypatch.setattr(led_subscriber, "textures", textures)
+    monkeypatch.setattr(led_subscriber, "led_matrix", FakeMatrix())
+    monkeypatch.setattr(led_subscriber, "readback", None)
+    monkeypatch.setattr(led_subscriber, "rotation_axes", ["Z"])
+    monkeypatch.setattr(led_subscriber, "renderer_angles", {})
+    monkeypatch.setattr(led_subscriber, "rotation_cache", RotationFrameCache(1024 * 1024))
+    monkeypatch.setattr(led_subscriber.scheduler, "_idle", None)
+    art = np.arange(4 * 4 * 3, dtype=np.uint8).reshape(4, 4, 3) * 5
+    textures.set_tile(art)
+    return renderer
+
+
+def run_idle_task():
+    """空き時間の処理 (回転フレームの事前描画) を終わるまで進める"""
+    while led_subscriber.scheduler._idle is not None:
+        led_subscriber.scheduler._run_idle()
+
+
+def test_cached_and_live_rotation_leave_same_state(monkeypatch):
+    """キャッシュから再生しても、その場で描画しても同じレンダラーの状態で終わることを確認する"""
+    live = setup_display(monkeypatch)
+    for _ in led_subscriber.rotation_animation("Z", 1):
+        pass
+    live_state = live.state()
+    assert led_subscriber.rotation_cache.misses == 1
+
+    cached = setup_display(monkeypatch)
+    led_subscriber.start_prerender()
+    run_idle_task()
+    for _ in led_subscriber.rotation_animation("Z", 1):
+        pass
+    assert led_subscriber.rotation_cache.hits == 1
+    assert cached.state() == live_state
+
+
+def test_prerender_restores_rotation(monkeypatch):
+    """事前描画の後はその前の回転角に戻ることを確認する"""
+    renderer = setup_display(monkeypatch)
+    led_subscriber.rotate_renderer("Z", 30)
+    led_subscriber.render_rotation_frame("Z", 45)
+    assert renderer.angles["Z"] == 30
+
+
+def test_track_change_during_cached_rotation(monkeypatch):
+    """キャッシュの再生中にトラックが変わったら、前のトラックの見た目に戻さないことを確認する"""
+    renderer = setup_display(monkeypatch)
+    led_subscriber.start_prerender()
+    run_idle_task()
+    rotation = led_subscriber.rotation_animation("Z", 1)
+    next(rotation)
+
+    new_art = np.full((4, 4, 3), 200, dtype=np.uint8)
+    led_subscriber.show_track(new_art)
+    new_texture = renderer.texture.copy()
+    for _ in rotation:
+        pass
+    assert np.array_equal(renderer.texture, new_texture)
+    assert not led_subscriber.textures.knows_rotation("Z", 1)
+
+
+def test_cancelled_rotation_does_not_leave_tilt(monkeypatch):
+    """途中で取り消された回転の角度が、次のトラックの事前描画に残らないことを確認する"""
+    renderer = setup_display(monkeypatch)
+    rotation = led_subscriber.rotation_animation("Z", 1)
+    for _ in range(9):
+        next(rotation)
+    assert led_subscriber.renderer_angles["Z"] == 45
+    # cancel_animations() で回転は最後まで進まない
+    rotation.close()
+
+    led_subscriber.show_track(np.full((4, 4, 3), 200, dtype=np.uint8))
+    assert led_subscriber.renderer_angles["Z"] == led_subscriber.ROTATION_START_DEG
+    led_subscriber.start_prerender()
+    run_idle_task()
+    assert renderer.angles["Z"] == led_subscriber.ROTATION_START_DEG
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_cached_and_live_rotation_leave_same_state(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_prerender_restores_rotation(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_track_change_during_cached_rotation(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_cancelled_rotation_does_not_leave_tilt(monkeypatch)
+    print("ok")
@@ -0,0 +1,90 @@
+import sys
+import os
+from collections import deque
+
+import pytest
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# 読み込むだけではLEDマトリクスやOpenGLを初期化しない
+import led_subscriber
+from modules.frame_scheduler import FrameScheduler
+from modules.track_message import decode_track_message, encode_track_message
+
+
+def test_track_buffered_until_display_ready(monkeypatch):
+    """表示の準備ができるまでに届いたトラックは最新の1件だけが表示されることを確認する"""
+    assert led_subscriber.led_matrix is None and led_subscriber.renderer is None
+    monkeypatch.setattr(led_subscriber, "display_ready", False)
+    monkeypatch.setattr(led_subscriber, "startup_track", None)
+    monkeypatch.setattr(led_subscriber, "scheduler", FrameScheduler())
+    shown = []
+
+    pixels = bytes(64 * 64 * 3)
+    led_subscriber.process_track_message(decode_track_message(encode_track_message("playing", "a", pixels, 64, 64)))
+    assert led_subscriber.startup_track[0] is led_subscriber.show_track
+    led_subscriber.process_track_message(decode_track_message(encode_track_message("stopped")))
+    assert led_subscriber.startup_track == (led_subscriber.show_blank, ())
+
+    led_subscriber.submit_track(shown.append, "old")
+    led_subscriber.submit_track(shown.append, "new")
+    led_subscriber.mark_display_ready()
+    assert led_subscriber.startup_track is None
+
+    # 準備ができた後はそのままレンダーループに渡す
+    led_subscriber.submit_track(shown.append, "after")
+    led_subscriber.scheduler.submit(led_subscriber.scheduler.stop)
+    led_subscriber.scheduler.run()
+    assert shown == ["new", "after"]
+
+
+def test_startup_timings(monkeypatch):
+    monkeypatch.setattr(led_subscriber, "startup_phases", {})
+    monkeypatch.setattr(led_subscriber, "startup_marks", {})
+    led_subscriber.timed_phase("phase", lambda: None)
+    led_subscriber.mark_startup("ready")
+    line = led_subscriber.format_startup()
+    assert line.startswith("Startup: ") and "phase " in line and "ready at " in line
+
+
+def test_beat_delivered_once_across_transports(monkeypatch):
+    """直接の経路とMQTTの両方で届いた同じビートは1回だけ処理されることを確認する"""
+    processed = []
+    monkeypatch.setattr(led_subscriber, "process_beat_message", processed.append)
+    monkeypatch.setattr(led_subscriber, "recent_trace_ids", deque(maxlen=64))
+    payload = b'{"beats": {"Bass": true}, "trace": {"id": "1-1", "captured": 1.0, "sent": 1.001}}'
+    led_subscriber.receive_beat(payload)
+    led_subscriber.receive_beat(payload)
+    led_subscriber.receive_beat(b'{"beats": {"Bass": true}}')
+    assert len(processed) == 2
+    assert "received" in processed[0]["trace"]
+
+
+class Message:
+    def __init__(self, topic, payload, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.retain = retain
+
+
+def test_legacy_track_payload_ignored(monkeypatch):
+    """以前のJSON形式で保持されたトラック情報は処理せずに捨てることを確認する"""
+    processed = []
+    monkeypatch.setattr(led_subscriber, "process_track_message", processed.append)
+    topic = f"{led_subscriber.config.MQTT_TOPIC_BASE}/track"
+    led_subscriber.on_message(None, None, Message(topic, b'{"event": "playing"}', retain=True))
+    led_subscriber.on_message(None, None, Message(topic, encode_track_message("stopped")))
+    assert [message.event for message in processed] == ["stopped"]
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_track_buffered_until_display_ready(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_startup_timings(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_beat_delivered_once_across_transports(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_legacy_track_payload_ignored(monkeypatch)
+    print("ok")
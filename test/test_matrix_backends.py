@@ -0,0 +1,46 @@
+import sys
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.led_matrix import LEDMatrix
+
+
+def test_framebuffer_present_and_clear():
+    """present() した内容がフレームバッファに表示され、clear() で消えることを確認する"""
+    led_matrix = LEDMatrix(backend="framebuffer", vsync=False)
+    matrix = led_matrix.matrix
+    frame = np.random.default_rng(0).integers(0, 256, (matrix.height, matrix.width, 3), dtype=np.uint8)
+
+    led_matrix.present(frame, flip_vertical=True)
+    assert np.array_equal(matrix.pixels, frame[::-1])
+    led_matrix.present(Image.fromarray(frame))
+    assert np.array_equal(matrix.pixels, frame)
+    assert matrix.stats()["frames"] == 2
+
+    led_matrix.clear()
+    assert not matrix.pixels.any()
+
+
+def test_recorder_writes_raw_frames():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "out.rgb")
+        led_matrix = LEDMatrix(backend="recorder", record_path=path, vsync=False)
+        matrix = led_matrix.matrix
+        for value in (10, 20, 30):
+            led_matrix.present(np.full((matrix.height, matrix.width, 3), value, dtype=np.uint8))
+        matrix.close()
+
+        frames = np.fromfile(path, dtype=np.uint8).reshape(-1, matrix.height, matrix.width, 3)
+        assert [int(f[0, 0, 0]) for f in frames] == [10, 20, 30]
+
+
+if __name__ == "__main__":
+    test_framebuffer_present_and_clear()
+    test_recorder_writes_raw_frames()
+    print("ok")
@@ -0,0 +1,59 @@
+import sys
+import os
+import urllib.request
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.metrics import Registry, serve_http, start_http_server
+
+
+def test_render():
+    """カウンター・ゲージ・ヒストグラムがPrometheusのテキスト形式で出力されることを確認する"""
+    registry = Registry(prefix="test_")
+    published = registry.counter("published_total", "Messages published", ["topic"])
+    published.labels("a/b").inc()
+    published.labels("a/b").inc(2)
+    registry.gauge("depth", "Queue depth", func=lambda: 7)
+    registry.counter("started_total", "Started", func=lambda: 5)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.01, 0.1))
+    latency.observe(0.005)
+    latency.observe(0.05)
+    latency.observe(1.0)
+
+    # 同じ名前で登録し直すと同じメトリクスが返る
+    assert registry.counter("published_total", "Messages published", ["topic"]) is published
+
+    text = registry.render()
+    assert "# TYPE test_published_total counter" in text
+    assert 'test_published_total{topic="a/b"} 3' in text
+    assert "test_depth 7" in text
+    assert "# TYPE test_started_total counter" in text and "test_started_total 5" in text
+    assert 'test_latency_seconds_bucket{le="0.01"} 1' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_count 3" in text
+
+
+def test_http_server():
+    registry = Registry(prefix="test_")
+    registry.counter("requests_total", "Requests").inc()
+    server = start_http_server(0, metrics_registry=registry)
+    assert server is None  # ポート0なら公開しない
+
+    # 空いているポートで起動し、実際のポートに接続する
+    server = serve_http(port=0, metrics_registry=registry)
+    port = server.server_address[1]
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.status == 200
+            assert "test_requests_total 1" in response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_render()
+    test_http_server()
+    print("ok")
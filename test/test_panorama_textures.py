@@ -0,0 +1,70 @@
+import sys
+import os
+
+import numpy as np
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.panorama_textures import PanoramaTextures
+
+
+class FakeRenderer:
+    """アップロードされたテクスチャを記録するだけのレンダラー"""
+
+    def __init__(self):
+        self.uploaded = []
+
+    def set_panorama_texture(self, img):
+        self.uploaded.append(np.asarray(img))
+
+
+def make_art(value):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_panorama_layout_and_duplicate_upload():
+    """パノラマが横に並んだRGBAになり、同じ内容は再アップロードしないことを確認する"""
+    renderer = FakeRenderer()
+    textures = PanoramaTextures(renderer, repeat=6)
+    art = np.arange(4 * 4 * 3, dtype=np.uint8).reshape(4, 4, 3)
+
+    assert textures.set_tile(art)
+    panorama = renderer.uploaded[0]
+    assert panorama.shape == (4, 24, 4)
+    assert np.array_equal(panorama[:, 20:, :3], art)
+    assert (panorama[..., 3] == 255).all()
+
+    assert not textures.set_tile(art.copy())
+    assert len(renderer.uploaded) == 1
+
+
+def test_rotation_transitions_are_remembered():
+    """回転後のテクスチャを覚え、2回目はフレームを読み出さないことを確認する"""
+    renderer = FakeRenderer()
+    textures = PanoramaTextures(renderer, repeat=1)
+    textures.set_tile(make_art(10))
+    captured = []
+
+    def capture(value):
+        captured.append(value)
+        return make_art(value)
+
+    # 見た目が変わらない回転は何もアップロードしない
+    assert not textures.rotated("Y", 1, lambda: capture(10))
+    assert not textures.rotated("Y", 1, lambda: capture(10))
+    assert captured == [10]
+
+    # 見た目が変わる回転は1回目だけ読み出し、2回目は覚えたテクスチャを使う
+    assert textures.rotated("Z", 1, lambda: capture(50))
+    textures.set_tile(make_art(10))
+    assert textures.knows_rotation("Z", 1)
+    assert textures.rotated("Z", 1, lambda: capture(50))
+    assert captured == [10, 50]
+    assert np.array_equal(renderer.uploaded[-1][..., :3], make_art(50))
+
+
+if __name__ == "__main__":
+    test_panorama_layout_and_duplicate_upload()
+    test_rotation_transitions_are_remembered()
+    print("ok")
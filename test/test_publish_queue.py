@@ -0,0 +1,86 @@
+import sys
+import os
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.publish_queue import PublishQueue, TopicPolicy
+from modules.track_message import encode_track_message, track_message_key
+
+BEATS = "led-jukebox/beats"
+TRACK = "led-jukebox/track"
+
+
+def make_queue(discarded):
+    policies = {
+        BEATS: TopicPolicy(coalesce=True, max_age=0.25),
+        TRACK: TopicPolicy(qos=1, max_queued=2, dedupe=track_message_key),
+    }
+    return PublishQueue(policies, on_discard=lambda topic, reason: discarded.append((topic, reason)))
+
+
+def test_beats_coalesce_and_expire():
+    """接続が切れている間のビートは最新の1件だけが残り、古くなったら送られないことを確認する"""
+    discarded = []
+    queue = make_queue(discarded)
+    for i in range(5):
+        queue.put(BEATS, f"beat {i}".encode(), now=10.0 + i * 0.01)
+    assert len(queue) == 1
+    assert discarded == [(BEATS, "coalesced")] * 4
+    assert queue.drain(now=10.1) == [(BEATS, b"beat 4", 0, 10.0 + 4 * 0.01)]
+
+    queue.put(BEATS, b"old beat", now=20.0)
+    assert queue.drain(now=21.0) == []
+    assert discarded[-1] == (BEATS, "stale")
+
+    # 送れずに戻したビートは、最初に保持した時刻で期限が切れる
+    queue.put(BEATS, b"held beat", now=30.0)
+    for topic, payload, flags, queued_at in queue.drain(now=30.2):
+        queue.put(topic, payload, flags, now=queued_at)
+    assert queue.drain(now=30.3) == []
+    assert discarded[-1] == (BEATS, "stale")
+
+
+def test_track_dedupe_and_bounded_queue():
+    discarded = []
+    queue = make_queue(discarded)
+    playing = encode_track_message("playing", "track-a", bytes(12), 2, 2)
+    assert queue.accept(TRACK, playing)
+    # 送れたと記録するまでは重複として扱わない (送れなかったものを送り直せるように)
+    assert queue.accept(TRACK, playing)
+    queue.record(TRACK, playing)
+    assert not queue.accept(TRACK, playing)
+    assert discarded == [(TRACK, "duplicate")]
+    # イベントが変われば同じトラックでも送る
+    paused = encode_track_message("paused", "track-a")
+    assert queue.accept(TRACK, paused)
+    queue.record(TRACK, paused)
+    assert queue.accept(TRACK, playing)
+
+    for event in ("loading", "preloading", "playing"):
+        queue.put(TRACK, event.encode(), flags=1, now=0.0)
+    queue.put(BEATS, b"beat", now=0.0)
+    assert discarded[-1] == (TRACK, "overflow")
+    # 期限のないトピックは古くても送り、受け取った順に返す
+    assert queue.drain(now=100.0) == [(TRACK, b"preloading", 1, 0.0), (TRACK, b"playing", 1, 0.0)]
+    assert not queue.pending(TRACK) and len(queue) == 0
+
+
+def test_discarded_message_can_be_sent_again():
+    """保持したまま捨てたメッセージは、同じ内容でも重複として捨てずに受け付けることを確認する"""
+    discarded = []
+    policies = {TRACK: TopicPolicy(max_age=1.0, dedupe=track_message_key)}
+    queue = PublishQueue(policies, on_discard=lambda topic, reason: discarded.append((topic, reason)))
+    playing = encode_track_message("playing", "track-a", bytes(12), 2, 2)
+    queue.put(TRACK, playing, now=0.0)
+    assert not queue.accept(TRACK, playing)
+    assert queue.drain(now=5.0) == []
+    assert discarded == [(TRACK, "duplicate"), (TRACK, "stale")]
+    assert queue.accept(TRACK, playing)
+
+
+if __name__ == "__main__":
+    test_beats_coalesce_and_expire()
+    test_track_dedupe_and_bounded_queue()
+    test_discarded_message_can_be_sent_again()
+    print("ok")
@@ -62,7 +62,7 @@ def test_opengl_cube():
             renderer.on_draw()  # FBOに描画
             img = renderer.get_current_panorama_frame()  # FBOから画像取得
             if img:
-                led_matrix_ctrl.SetImage(img.convert("RGB"))
+                led_matrix_obj.present(img)
             else:
                 print(f"警告: get_current_panorama_frame がNoneを返しました。")
             update.deg = current_deg
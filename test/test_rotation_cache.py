@@ -0,0 +1,92 @@
+import sys
+import os
+
+import numpy as np
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.frame_scheduler import FrameScheduler
+from modules.rotation_cache import RotationFrameCache
+
+ANGLES = [30, 60, 90]
+ROTATIONS = [("X", -1), ("X", 1), ("Y", -1), ("Y", 1)]
+
+
+def render(axis, deg):
+    """回転角を画素値にした 2x4 のフレームを返す"""
+    return np.full((2, 4, 3), deg % 256, dtype=np.uint8)
+
+
+def test_prerender_and_bounded_memory():
+    """空き時間の描画で全回転のフレームがそろい、上限を超えると古いものから捨てることを確認する"""
+    rotation_bytes = len(ANGLES) * 2 * 4 * 3
+    cache = RotationFrameCache(max_bytes=rotation_bytes * 6)
+    steps = list(cache.prerender("a", ROTATIONS, ANGLES, render, lambda: True))
+    assert len(steps) == len(ROTATIONS) * len(ANGLES)
+    assert len(cache) == 4 and cache.total_bytes == rotation_bytes * 4
+
+    frames = cache.get("a", "X", -1)
+    assert frames.shape == (3, 2, 4, 3)
+    assert [int(frame[0, 0, 0]) for frame in frames] == [256 - 30, 256 - 60, 256 - 90]
+    assert cache.get("b", "X", -1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # 2回目は何も描画しない
+    assert list(cache.prerender("a", ROTATIONS, ANGLES, render, lambda: True)) == []
+
+    list(cache.prerender("b", ROTATIONS, ANGLES, render, lambda: True))
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.evictions == 2
+    # 最近使ったものは残る
+    assert ("a", "X", -1) in cache and ("a", "X", 1) not in cache
+
+
+def test_prerender_stops_when_texture_changes():
+    cache = RotationFrameCache(max_bytes=1 << 20)
+    current = {"key": "a"}
+    steps = cache.prerender("a", ROTATIONS, ANGLES, render, lambda: current["key"] == "a")
+    for _ in range(len(ANGLES) + 1):
+        next(steps)
+    current["key"] = "b"
+    assert next(steps, None) is None
+    assert len(cache) == 1
+
+
+def test_idle_task_runs_only_when_idle():
+    """空き時間の処理はタスクとアニメーションの合間にだけ進むことを確認する"""
+    scheduler = FrameScheduler(fps=1000)
+    log = []
+    remaining = [3]
+
+    def idle():
+        log.append("idle")
+        remaining[0] -= 1
+        return remaining[0] > 0
+
+    def animation():
+        for i in range(2):
+            log.append(f"frame {i}")
+            yield
+
+    scheduler.set_idle_task(idle)
+    scheduler.request_animation(animation)
+    scheduler.submit(log.append, "task")
+
+    def finish():
+        if remaining[0] > 0:
+            scheduler.submit(finish)
+        else:
+            scheduler.stop()
+
+    scheduler.submit(finish)
+    scheduler.run()
+    assert log[:3] == ["task", "frame 0", "frame 1"]
+    assert log.count("idle") == 3
+
+
+if __name__ == "__main__":
+    test_prerender_and_bounded_memory()
+    test_prerender_stops_when_texture_changes()
+    test_idle_task_runs_only_when_idle()
+    print("ok")
@@ -0,0 +1,109 @@
+import sys
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules import config
+from modules import spotify
+
+
+def make_track(track_id):
+    return {
+        "id": track_id,
+        "album": {
+            "id": f"album-{track_id}",
+            "images": [
+                {"url": f"http://img/{track_id}/640", "width": 640, "height": 640},
+                {"url": f"http://img/{track_id}/300", "width": 300, "height": 300},
+                {"url": f"http://img/{track_id}/64", "width": 64, "height": 64},
+            ],
+        },
+    }
+
+
+class StubSpotifyHandler(BaseHTTPRequestHandler):
+    """Spotify API の代わりに応答するスタブ (リクエストを記録する)"""
+
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.requests.append(("POST", self.path))
+        self.reply({"access_token": "stub-token", "token_type": "Bearer", "expires_in": 3600})
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path))
+        assert self.headers["Authorization"] == "Bearer stub-token"
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/v1/tracks":
+            ids = parse_qs(url.query)["ids"][0].split(",")
+            self.reply({"tracks": [make_track(i) if i != "missing" else None for i in ids]})
+        else:
+            self.reply(make_track(url.path.rsplit("/", 1)[1]))
+
+
+def start_stub(monkeypatch):
+    StubSpotifyHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSpotifyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(config, "SPOTIFY_CLIENT_ID", "id")
+    monkeypatch.setattr(config, "SPOTIFY_SECRET_KEY", "secret")
+    monkeypatch.setattr(config, "SPOTIFY_API_PREFIX", f"{base}/v1/")
+    monkeypatch.setattr(config, "SPOTIFY_TOKEN_URL", f"{base}/api/token")
+    spotify.reset_client()
+    return server
+
+
+def test_token_is_reused(monkeypatch):
+    """2回目以降の取得でトークンを取り直さないことを確認する"""
+    server = start_stub(monkeypatch)
+    try:
+        assert spotify.get_album_url("aaa") == "http://img/aaa/64"
+        assert spotify.get_album_url("bbb") == "http://img/bbb/64"
+        methods = [method for method, _ in StubSpotifyHandler.requests]
+        assert methods == ["POST", "GET", "GET"]
+    finally:
+        server.shutdown()
+        spotify.reset_client()
+
+
+def test_batch_tracks(monkeypatch):
+    """tracks() が50件ずつまとめて取得し、存在しないトラックを除くことを確認する"""
+    server = start_stub(monkeypatch)
+    try:
+        ids = [f"t{i}" for i in range(60)] + ["missing", "t0"]
+        result = spotify.tracks(ids)
+        assert sorted(result) == sorted(f"t{i}" for i in range(60))
+        assert spotify.album_image_url(result["t5"]) == "http://img/t5/64"
+        gets = [path for method, path in StubSpotifyHandler.requests if method == "GET"]
+        assert len(gets) == 2
+    finally:
+        server.shutdown()
+        spotify.reset_client()
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_token_is_reused(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_batch_tracks(monkeypatch)
+    print("ok")
@@ -0,0 +1,45 @@
+import sys
+import os
+
+import numpy as np
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.track_message import (TrackMessageError, decode_track_message, encode_track_message,
+                                   is_track_message, pixels_to_array)
+
+
+def test_roundtrip_with_pixels():
+    """画素がコピーなしで (高さ, 幅, 3) の配列として取り出せることを確認する"""
+    art = np.arange(4 * 2 * 3, dtype=np.uint8).reshape(2, 4, 3)
+    payload = encode_track_message("playing", "abc", art.tobytes(), width=4, height=2)
+    assert is_track_message(payload)
+
+    message = decode_track_message(payload)
+    assert (message.event, message.track_id, message.width, message.height) == ("playing", "abc", 4, 2)
+    assert np.array_equal(pixels_to_array(message), art)
+
+
+def test_event_without_image():
+    message = decode_track_message(encode_track_message("stopped", None))
+    assert message.event == "stopped"
+    assert message.track_id is None
+    assert pixels_to_array(message) is None
+
+
+def test_truncated_message():
+    payload = encode_track_message("playing", "abc", bytes(12), width=2, height=2)
+    try:
+        decode_track_message(payload[:-1])
+    except TrackMessageError:
+        pass
+    else:
+        raise AssertionError("truncated message was accepted")
+
+
+if __name__ == "__main__":
+    test_roundtrip_with_pixels()
+    test_event_without_image()
+    test_truncated_message()
+    print("ok")
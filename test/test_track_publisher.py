@@ -0,0 +1,132 @@
+import sys
+import os
+
+import pytest
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import track_publisher
+from modules.ipc import FLAG_RETAIN
+from modules.track_message import decode_track_message
+
+
+class RecordingClient:
+    """DaemonClient の代わりに送信したメッセージを記録する"""
+
+    default_topic = "led-jukebox/track"
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, payload, topic=None, flags=0):
+        self.sent.append((decode_track_message(payload), flags))
+        return True
+
+
+def test_display_state_is_retained(monkeypatch):
+    """表示を決めるイベントだけがブローカーに保持されるよう送信されることを確認する"""
+    client = RecordingClient()
+    monkeypatch.setattr(track_publisher, "daemon_client", client)
+    # アートワークのキャッシュやネットワークは使わない
+    monkeypatch.setattr(track_publisher, "art_cache", None)
+    monkeypatch.setattr(track_publisher, "last_art", ("track-a", bytes(64 * 64 * 3)))
+
+    track_publisher.handle_event("track-a", "playing")
+    track_publisher.handle_event("track-a", "paused")
+    track_publisher.handle_event(None, "stopped")
+
+    (playing, playing_flags), (paused, paused_flags), (stopped, stopped_flags) = client.sent
+    assert playing.event == "playing" and playing.pixels is not None
+    assert playing_flags & FLAG_RETAIN
+    assert not paused_flags & FLAG_RETAIN
+    assert stopped.event == "stopped" and stopped_flags & FLAG_RETAIN
+
+
+class DeferredExecutor:
+    """先読みのスレッドの代わりに、渡された処理を run() まで溜めておく"""
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, fn, *args):
+        self.tasks.append((fn, args))
+
+    def run(self):
+        tasks, self.tasks = self.tasks, []
+        for fn, args in tasks:
+            fn(*args)
+
+
+def test_prefetch_batches_track_lookups(monkeypatch):
+    """先読みを待っている間に届いたトラックの情報を、まとめて1回で取得することを確認する"""
+    executor = DeferredExecutor()
+    lookups = []
+    loaded = []
+
+    def tracks(track_ids):
+        lookups.append(list(track_ids))
+        return {track_id: {"id": track_id} for track_id in track_ids if track_id != "missing"}
+
+    def load_album_art(track_id, track=None):
+        if track is None:
+            raise LookupError(track_id)
+        loaded.append(track_id)
+        return track_id.encode()
+
+    monkeypatch.setattr(track_publisher, "prefetch_executor", executor)
+    monkeypatch.setattr(track_publisher, "prefetched", {})
+    monkeypatch.setattr(track_publisher, "prefetch_pending", [])
+    monkeypatch.setattr(track_publisher, "art_cache", None)
+    monkeypatch.setattr(track_publisher, "last_art", (None, None))
+    monkeypatch.setattr(track_publisher, "load_album_art", load_album_art)
+    monkeypatch.setattr(track_publisher.spotify, "tracks", tracks)
+
+    for track_id in ("track-a", "track-b", "missing"):
+        track_publisher.prefetch_album_art(track_id)
+    assert len(executor.tasks) == 1
+    executor.run()
+
+    assert lookups == [["track-a", "track-b", "missing"]]
+    assert loaded == ["track-a", "track-b"]
+    assert track_publisher.prefetched["track-b"].result() == b"track-b"
+    assert isinstance(track_publisher.prefetched["missing"].exception(), LookupError)
+
+
+def test_playing_does_not_wait_for_queued_prefetch(monkeypatch):
+    """先読みのスレッドが取り出す前に再生されたトラックは、待たずにその場で取得することを確認する"""
+    executor = DeferredExecutor()
+    loaded = []
+
+    def load_album_art(track_id, track=None):
+        loaded.append(track_id)
+        return track_id.encode()
+
+    monkeypatch.setattr(track_publisher, "prefetch_executor", executor)
+    monkeypatch.setattr(track_publisher, "prefetched", {})
+    monkeypatch.setattr(track_publisher, "prefetch_pending", [])
+    monkeypatch.setattr(track_publisher, "art_cache", None)
+    monkeypatch.setattr(track_publisher, "last_art", (None, None))
+    monkeypatch.setattr(track_publisher, "load_album_art", load_album_art)
+    monkeypatch.setattr(track_publisher.spotify, "tracks", lambda track_ids: {})
+
+    # preloading Y の取得中に loading Z が届き、Z は次の取り出しを待っている
+    track_publisher.prefetch_album_art("track-y")
+    executor.run()
+    track_publisher.prefetch_album_art("track-z")
+    assert len(executor.tasks) == 1
+
+    # 先読みのスレッドを進めなくても playing Z は返る
+    assert track_publisher.take_album_art("track-z") == b"track-z"
+    executor.run()
+    assert loaded == ["track-y", "track-z"]
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_display_state_is_retained(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_prefetch_batches_track_lookups(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_playing_does_not_wait_for_queued_prefetch(monkeypatch)
+    print("ok")
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""AudioReactor.detect_beats のオフラインベンチマーク・精度評価ツール
+
+WAV または RAW PCM ファイルをサウンドデバイスなしで検出器に流し込み、
+処理速度 (ブロック/秒・ブロックごとの処理時間) と検出したビートの時刻を出力する。
+正解のオンセット時刻ファイル (1行1時刻, 秒) があれば許容幅内での F値 を計算する。
+
+例:
+    python tools/beats_benchmark.py song.wav --annotations song.onsets --band Bass
+    python tools/beats_benchmark.py song.raw --format s16le --rate 48000 --channels 2 \\
+        --block-ms 40 --threshold Bass=1.8 --cooldown Bass=5
+    python tools/beats_benchmark.py song.wav --fft-size 4096 --hop-size 256 --detector energy --detector flux
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.audio_reactor import AudioReactor
+from modules.beat_detectors import DETECTORS
+
+RAW_FORMATS = {
+    "s16le": (np.dtype("<i2"), 32768.0),
+    "s32le": (np.dtype("<i4"), 2147483648.0),
+    "f32le": (np.dtype("<f4"), 1.0),
+}
+
+
+def load_wav(path):
+    """WAVファイルを (サンプル数, チャネル数) の float32 配列として読み込む"""
+    with wave.open(path, "rb") as wav:
+        sample_rate = wav.getframerate()
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        # 24bit は下位に0を詰めて32bitとして読む
+        bytes24 = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((bytes24.shape[0], 4), dtype=np.uint8)
+        padded[:, 1:] = bytes24
+        samples = padded.view("<i4").reshape(-1).astype(np.float32) / 2147483648.0
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported sample width: {width} bytes")
+
+    return samples.reshape(-1, channels), sample_rate
+
+
+def load_raw(path, fmt, channels):
+    """RAW PCMファイルを (サンプル数, チャネル数) の float32 配列として読み込む"""
+    dtype, scale = RAW_FORMATS[fmt]
+    samples = np.fromfile(path, dtype=dtype).astype(np.float32) / scale
+    usable = len(samples) - len(samples) % channels
+    return samples[:usable].reshape(-1, channels)
+
+
+def load_onsets(path):
+    """正解オンセットファイルを読み込む (各行の先頭の数値を秒として扱い、#以降は無視する)"""
+    onsets = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                onsets.append(float(line.split()[0]))
+    return sorted(onsets)
+
+
+def match_onsets(reference, estimated, tolerance):
+    """許容幅内で正解と検出結果を1対1に対応付け、一致した数を返す
+
+    どちらも時刻順に並べて前から貪欲に対応付ける (1次元の区間なのでこれで最大マッチングになる)。
+    """
+    reference = sorted(reference)
+    estimated = sorted(estimated)
+    matched = 0
+    i = j = 0
+    while i < len(reference) and j < len(estimated):
+        diff = estimated[j] - reference[i]
+        if abs(diff) <= tolerance:
+            matched += 1
+            i += 1
+            j += 1
+        elif diff < 0:
+            j += 1
+        else:
+            i += 1
+    return matched
+
+
+def f_measure(reference, estimated, tolerance=0.05):
+    """(F値, 適合率, 再現率) を返す"""
+    if not reference and not estimated:
+        return 1.0, 1.0, 1.0
+    if not reference or not estimated:
+        return 0.0, 0.0, 0.0
+    matched = match_onsets(reference, estimated, tolerance)
+    precision = matched / len(estimated)
+    recall = matched / len(reference)
+    if matched == 0:
+        return 0.0, precision, recall
+    return 2 * precision * recall / (precision + recall), precision, recall
+
+
+def parse_band_values(items, cast):
+    """["Bass=2.0", ...] 形式の指定を辞書にする"""
+    values = {}
+    for item in items or []:
+        name, value = item.split("=", 1)
+        values[name] = cast(value)
+    return values
+
+
+def make_reactor(args, sample_rate, channels, detector):
+    """コマンドライン引数からAudioReactorを作る (指定のない帯域はデフォルト値のまま)"""
+    reactor_args = dict(
+        sample_rate=sample_rate,
+        channels=channels,
+        block_duration_ms=args.block_ms,
+        history_len=args.history,
+        fft_size=args.fft_size,
+        hop_size=args.hop_size,
+        detector=detector,
+        tempo_band=args.band,
+        log_beats=False,
+    )
+    for key, option, cast in (("threshold_ratio", args.threshold, float),
+                              ("min_energy_threshold", args.min_energy, float),
+                              ("cooldown_blocks", args.cooldown, int)):
+        overrides = parse_band_values(option, cast)
+        if overrides:
+            reactor_args[key] = overrides
+    return AudioReactor(**reactor_args)
+
+
+def load_audio(args, path):
+    """(サンプル配列, サンプリングレート) を返す"""
+    if args.format == "wav":
+        return load_wav(path)
+    return load_raw(path, args.format, args.channels), args.rate
+
+
+def run_file(args, path, samples, sample_rate, detector):
+    """1ファイルを検出器に流し、計測結果を辞書で返す"""
+    channels = samples.shape[1]
+
+    reactor = make_reactor(args, sample_rate, channels, detector)
+    block_size = reactor.block_size
+
+    # 最後の半端なブロックはゼロで埋める
+    n_blocks = -(-len(samples) // block_size)
+    padded = np.zeros((n_blocks * block_size, channels), dtype=np.float32)
+    padded[:len(samples)] = samples
+
+    latencies = np.zeros(n_blocks)
+    beat_times = {name: [] for name in reactor.freq_bands}
+    started = time.perf_counter()
+    for i in range(n_blocks):
+        chunk = padded[i * block_size:(i + 1) * block_size]
+        t0 = time.perf_counter()
+        detected = reactor.detect_beats(chunk)
+        latencies[i] = time.perf_counter() - t0
+        if any(detected.values()):
+            # 検出したフレームの最新ホップの先頭をビートの時刻とする
+            for name, offset in reactor.onset_offsets().items():
+                beat_times[name].append(i * block_size / sample_rate + offset)
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "file": path,
+        "detector": detector,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "block_size": block_size,
+        "fft_size": reactor.fft_size,
+        "hop_size": reactor.hop_size,
+        "blocks": n_blocks,
+        "audio_seconds": len(samples) / sample_rate,
+        "blocks_per_second": n_blocks / elapsed if elapsed > 0 else float("inf"),
+        "realtime_factor": (len(samples) / sample_rate) / elapsed if elapsed > 0 else float("inf"),
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50) * 1000),
+            "p95": float(np.percentile(latencies, 95) * 1000),
+            "p99": float(np.percentile(latencies, 99) * 1000),
+            "max": float(latencies.max() * 1000),
+        },
+        "beats": beat_times,
+        "tempo_band": args.band,
+        "tempo_bpm": reactor.tempo.bpm,
+        "tempo_confidence": reactor.tempo.confidence,
+    }
+
+    annotations = args.annotations or find_annotations(path)
+    if annotations:
+        reference = load_onsets(annotations)
+        score, precision, recall = f_measure(reference, beat_times.get(args.band, []), args.tolerance)
+        result["accuracy"] = {
+            "annotations": annotations,
+            "band": args.band,
+            "tolerance": args.tolerance,
+            "reference": len(reference),
+            "estimated": len(beat_times.get(args.band, [])),
+            "f_measure": score,
+            "precision": precision,
+            "recall": recall,
+        }
+    return result
+
+
+def find_annotations(path):
+    """音声ファイルと同じ名前の .onsets / .txt ファイルがあれば返す"""
+    stem = os.path.splitext(path)[0]
+    for ext in (".onsets", ".txt"):
+        if os.path.exists(stem + ext):
+            return stem + ext
+    return None
+
+
+def print_result(result, print_beats):
+    print(f"=== {result['file']} ({result['detector']} detector) ===")
+    print(f"  {result['audio_seconds']:.1f}s audio, {result['sample_rate']} Hz, {result['channels']} ch, "
+          f"block {result['block_size']}, fft {result['fft_size']}, hop {result['hop_size']} samples")
+    print(f"  {result['blocks']} blocks, {result['blocks_per_second']:.0f} blocks/s "
+          f"({result['realtime_factor']:.0f}x realtime)")
+    latency = result["latency_ms"]
+    print(f"  detect_beats latency: p50 {latency['p50']:.3f} ms, p95 {latency['p95']:.3f} ms, "
+          f"p99 {latency['p99']:.3f} ms, max {latency['max']:.3f} ms")
+    for name, times in result["beats"].items():
+        print(f"  {name:>6s}: {len(times)} beats")
+        if print_beats:
+            print("    " + " ".join(f"{t:.3f}" for t in times))
+    if result["tempo_bpm"]:
+        print(f"  tempo ({result['tempo_band']}): {result['tempo_bpm']:.1f} BPM, confidence {result['tempo_confidence']:.2f}")
+    accuracy = result.get("accuracy")
+    if accuracy:
+        print(f"  {accuracy['band']} vs {accuracy['annotations']} (±{accuracy['tolerance'] * 1000:.0f} ms): "
+              f"F {accuracy['f_measure']:.3f}, P {accuracy['precision']:.3f}, R {accuracy['recall']:.3f} "
+              f"({accuracy['estimated']} detected / {accuracy['reference']} annotated)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark and accuracy check for AudioReactor")
+    parser.add_argument("files", nargs="+", help="WAV or raw PCM files")
+    parser.add_argument("--format", choices=["wav"] + sorted(RAW_FORMATS), default="wav")
+    parser.add_argument("--rate", type=int, default=48000, help="sample rate for raw PCM")
+    parser.add_argument("--channels", type=int, default=2, help="channel count for raw PCM")
+    parser.add_argument("--block-ms", type=float, default=50, help="block_duration_ms")
+    parser.add_argument("--detector", action="append", choices=sorted(DETECTORS),
+                        help="detector engine, repeat to compare engines on the same files (default: energy)")
+    parser.add_argument("--history", type=int, default=15, help="history_len")
+    parser.add_argument("--fft-size", type=int, help="FFT window in samples (default: block size)")
+    parser.add_argument("--hop-size", type=int, help="hop between analysis frames in samples (default: block size)")
+    parser.add_argument("--threshold", action="append", metavar="BAND=RATIO", help="threshold_ratio override")
+    parser.add_argument("--min-energy", action="append", metavar="BAND=ENERGY", help="min_energy_threshold override")
+    parser.add_argument("--cooldown", action="append", metavar="BAND=BLOCKS", help="cooldown_blocks override")
+    parser.add_argument("--annotations", help="ground-truth onset file (default: <file>.onsets or <file>.txt)")
+    parser.add_argument("--band", default="Bass", help="band scored against the annotations")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="matching window in seconds")
+    parser.add_argument("--print-beats", action="store_true", help="print every beat timestamp")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.annotations and len(args.files) > 1:
+        parser.error("--annotations can only be used with a single file")
+
+    results = []
+    for path in args.files:
+        samples, sample_rate = load_audio(args, path)
+        for detector in args.detector or ["energy"]:
+            result = run_file(args, path, samples, sample_rate, detector)
+            print_result(result, args.print_beats)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
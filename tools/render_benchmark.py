@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""LEDマトリクスの表示経路の負荷試験ツール
+
+実機のパネルの代わりにエミュレータ (modules/matrix_backends.py) に出力し、
+トラック変更とビート (回転アニメーション) を一定の間隔で送り込みながら、
+表示したフレームの fps・フレーム間隔のばらつき・1フレームの描画時間を計測する。
+描画は led_subscriber の表示関数 (show_track / rotation_animation) とレンダーループをそのまま使い、
+レンダラーとLEDマトリクスだけを差し替える。
+
+OpenGLのレンダラー (LED-Jukebox-Visualizer) が読み込めない環境では
+--renderer synthetic で NumPy だけの代用レンダラーを使う。
+
+例:
+    python tools/render_benchmark.py --renderer synthetic --duration 10 --beat-interval 0.3
+    python tools/render_benchmark.py --backend recorder --record out.rgb --duration 5
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# 読み込むだけではLEDマトリクスやOpenGLを初期化しない
+import led_subscriber
+from modules.led_matrix import LEDMatrix
+from modules.panorama_textures import PanoramaTextures
+from modules.rotation_cache import RotationFrameCache
+
+ART_SIZE = 64
+
+
+class SyntheticRenderer:
+    """OpenGLを使わずにレンダラーのAPIを真似る代用品
+
+    回転角に応じてパノラマを横にずらしたものをフレームとする (テクスチャを設定すると回転は元に戻る)。
+    描画内容は実物と違うが、テクスチャの受け渡しとフレームの受け取りの経路は同じになる。
+    """
+
+    def __init__(self):
+        self.texture = np.zeros((ART_SIZE, ART_SIZE * led_subscriber.PANORAMA_REPEAT, 3), dtype=np.uint8)
+        self.angles = {}
+        self.frame = self.texture
+
+    def set_panorama_texture(self, img):
+        self.texture = np.asarray(img.convert("RGB"))
+        self.angles = {}
+
+    def rotate(self, axis, deg):
+        self.angles[axis] = deg
+
+    def on_draw(self):
+        shift = int(sum(self.angles.values()) / 90 * ART_SIZE)
+        self.frame = np.roll(self.texture, shift, axis=1)
+
+    def get_current_panorama_frame(self):
+        return Image.fromarray(self.frame)
+
+
+def load_renderer(name):
+    """(レンダラー, 回転軸の一覧) を返す"""
+    if name == "synthetic":
+        return SyntheticRenderer(), ["X", "Y", "Z"]
+    module = importlib.import_module("modules.LED-Jukebox-Visualizer.renderer.scroll_renderer")
+    axes = [module.RotationAxis.X, module.RotationAxis.Y, module.RotationAxis.Z]
+    return module.ScrollRenderer(ART_SIZE, ART_SIZE, use_offscreen=True), axes
+
+
+class TimedMatrix:
+    """LEDMatrix の present() にかかった時間を記録する (VSyncの待ちを含む)"""
+
+    def __init__(self, led_matrix):
+        self.led_matrix = led_matrix
+        self.present_times = []
+
+    def present(self, frame, flip_vertical=False):
+        started = time.perf_counter()
+        self.led_matrix.present(frame, flip_vertical=flip_vertical)
+        self.present_times.append(time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self.led_matrix, name)
+
+
+def percentiles(values):
+    values = np.array(values) * 1000 if values else np.zeros(1)
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the LED render path on an emulated matrix")
+    parser.add_argument("--backend", choices=["framebuffer", "recorder"], default="framebuffer")
+    parser.add_argument("--record", default="led_frames.rgb", help="output file for the recorder backend")
+    parser.add_argument("--renderer", choices=["visualizer", "synthetic"], default="visualizer")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--beat-interval", type=float, default=0.5, help="seconds between beats")
+    parser.add_argument("--track-interval", type=float, default=3.0, help="seconds between track changes")
+    parser.add_argument("--no-vsync", action="store_true", help="do not wait for the emulated panel refresh")
+    parser.add_argument("--rotation-cache", type=float, default=0,
+                        help="MB of pre-rendered rotation frames (0: render every beat live)")
+    parser.add_argument("--stages", action="store_true", help="also time each stage of the frame")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    led_matrix = LEDMatrix(backend=args.backend, record_path=args.record, vsync=not args.no_vsync)
+    renderer, axes = load_renderer(args.renderer)
+    rotation_cache = RotationFrameCache(int(args.rotation_cache * 1024 * 1024)) if args.rotation_cache else None
+
+    # led_subscriber の表示系を差し替え、実際の表示関数 (show_track / rotation_animation) をそのまま動かす
+    timed_matrix = TimedMatrix(led_matrix)
+    textures = PanoramaTextures(renderer, repeat=led_subscriber.PANORAMA_REPEAT)
+    led_subscriber.led_matrix = timed_matrix
+    led_subscriber.renderer = renderer
+    led_subscriber.readback = None
+    led_subscriber.textures = textures
+    led_subscriber.rotation_axes = axes
+    led_subscriber.renderer_angles = {}
+    led_subscriber.rotation_cache = rotation_cache
+    scheduler = led_subscriber.scheduler
+    scheduler.frame_interval = led_matrix.framerate / led_matrix.options.limit_refresh_rate_hz
+
+    # 1フレームの描画から表示までの時間 (キャッシュからの再生は表示のみ)
+    frame_times = []
+    frame_presented = led_subscriber.frame_presented
+
+    def timed_frame_presented(started):
+        frame_times.append(time.perf_counter() - started)
+        frame_presented(started)
+
+    led_subscriber.frame_presented = timed_frame_presented
+
+    # led_subscriber と同じ段階 (draw / readback / convert / set_image / swap) で計測する
+    profiler = led_subscriber.profiler
+    profiler.log_interval = float("inf")
+    if args.stages:
+        profiler.enable()
+        led_matrix.profiler = profiler
+    led_subscriber.mark_display_ready()
+
+    def feed():
+        """トラック変更とビートを一定間隔でレンダーループに送る"""
+        rng = np.random.default_rng(0)
+        started = time.monotonic()
+        next_beat = next_track = started
+        while time.monotonic() - started < args.duration:
+            now = time.monotonic()
+            if now >= next_track:
+                art = rng.integers(0, 256, (ART_SIZE, ART_SIZE, 3), dtype=np.uint8)
+                led_subscriber.submit_track(led_subscriber.show_track, art)
+                next_track += args.track_interval
+            if now >= next_beat:
+                scheduler.request_animation(led_subscriber.random_rotation)
+                next_beat += args.beat_interval
+            time.sleep(max(0.0, min(next_beat, next_track) - time.monotonic()))
+        scheduler.stop()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    scheduler.run()
+    feeder.join()
+
+    # 表示したフレームごとに present() は1回なので、その分を引いたものを描画時間とする
+    present_times = timed_matrix.present_times
+    render_times = [frame - present for frame, present in zip(frame_times, present_times)]
+
+    matrix = led_matrix.matrix
+    if hasattr(matrix, "close"):
+        matrix.close()
+    result = {
+        "backend": args.backend,
+        "renderer": args.renderer,
+        "target_fps": 1.0 / scheduler.frame_interval,
+        "display": matrix.stats(),
+        "render_ms": percentiles(render_times),
+        "present_ms": percentiles(present_times),
+        "animations": {
+            "started": scheduler.started_animations,
+            "merged": scheduler.merged_animations,
+            "dropped": scheduler.dropped_animations,
+        },
+        "textures": {
+            "uploads": textures.uploads,
+            "skipped_uploads": textures.skipped_uploads,
+            "captures": textures.captures,
+        },
+    }
+    if rotation_cache is not None:
+        result["rotation_cache"] = {
+            "hits": rotation_cache.hits,
+            "misses": rotation_cache.misses,
+            "rotations": len(rotation_cache),
+            "bytes": rotation_cache.total_bytes,
+        }
+    if args.stages:
+        result["stages_ms"] = profiler.stats.summary()
+
+    display = result["display"]
+    print(f"{display['frames']} frames, {display['fps']:.1f} fps (target {result['target_fps']:.1f})")
+    if "interval_ms" in display:
+        interval = display["interval_ms"]
+        print(f"  frame interval: mean {interval['mean']:.2f} ms, jitter (std) {interval['std']:.2f} ms, "
+              f"p99 {interval['p99']:.2f} ms, max {interval['max']:.2f} ms")
+    for label, times in (("render", result["render_ms"]), ("present (incl. vsync wait)", result["present_ms"])):
+        print(f"  {label}: p50 {times['p50']:.3f} ms, p95 {times['p95']:.3f} ms, "
+              f"p99 {times['p99']:.3f} ms, max {times['max']:.3f} ms")
+    print(f"  animations: {result['animations']}, textures: {result['textures']}")
+    if rotation_cache is not None:
+        print(f"  rotation cache: {result['rotation_cache']}")
+    if args.stages:
+        print(f"  {profiler.stats.format('frame stages')}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
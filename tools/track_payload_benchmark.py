@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""トラック変更メッセージのペイロードサイズとデコード時間を比較するベンチマーク
+
+従来の形式 (PNG → Base64 → JSON) と、バイナリ形式 (modules/track_message.py) について、
+送信するバイト数と、受信側でパノラマテクスチャ用のイメージを作るまでの時間を計測する。
+
+例:
+    python tools/track_payload_benchmark.py
+    python tools/track_payload_benchmark.py cover.jpg --repeat 2000
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+# モジュール検索パスにプロジェクトのルートディレクトリを追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.ipc import encode_frame
+from modules.panorama_textures import PanoramaTextures
+from modules.track_message import decode_track_message, encode_track_message, pixels_to_array
+
+ART_SIZE = (64, 64)
+PANORAMA_REPEAT = 6
+TRACK_ID = "5QMrH5nszZZR3nefIj6Mar"
+
+# パノラマを作るだけなのでレンダラーは不要
+PANORAMA = PanoramaTextures(None, repeat=PANORAMA_REPEAT)
+
+
+def load_art(path):
+    """64x64のRGBイメージを用意する (ファイル指定がなければグラデーションとノイズの合成画像)"""
+    if path:
+        img = Image.open(path).convert("RGB")
+        return img.resize(ART_SIZE, resample=Image.BICUBIC) if img.size != ART_SIZE else img
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:ART_SIZE[1], 0:ART_SIZE[0]]
+    art = np.stack([x * 4, y * 4, (x + y) * 2], axis=-1) + rng.integers(0, 32, (ART_SIZE[1], ART_SIZE[0], 3))
+    return Image.fromarray(np.clip(art, 0, 255).astype(np.uint8))
+
+
+def encode_legacy(img):
+    """従来の track_publisher と同じく PNG → Base64 → JSON にする"""
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    data = {"event": "playing", "track_id": TRACK_ID, "image": base64.b64encode(buffer.getvalue()).decode('utf-8')}
+    return json.dumps(data).encode('utf-8')
+
+
+def decode_legacy(payload):
+    """従来の led_subscriber と同じくパノラマ用のRGBAイメージを作る"""
+    message_data = json.loads(payload.decode('utf-8'))
+    img = Image.open(io.BytesIO(base64.b64decode(message_data['image'])))
+    if img.size[0] != 64 or img.size[1] != 64:
+        img = img.resize((64, 64), resample=Image.BICUBIC)
+    concatenated_img = Image.new('RGBA', (img.width * PANORAMA_REPEAT, img.height))
+    for i in range(PANORAMA_REPEAT):
+        concatenated_img.paste(img, (i * img.width, 0))
+    return concatenated_img
+
+
+def encode_binary(img):
+    return encode_track_message("playing", TRACK_ID, img.tobytes(), *img.size)
+
+
+def decode_binary(payload):
+    """led_subscriber と同じくパノラマ用のRGBAイメージを作る"""
+    art = pixels_to_array(decode_track_message(payload))
+    return Image.fromarray(PANORAMA.make_panorama(art))
+
+
+def measure(func, arg, repeat):
+    """1回あたりの平均時間 (ミリ秒) を返す"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare track message payload formats")
+    parser.add_argument("image", nargs="?", help="album art image (default: synthetic 64x64 image)")
+    parser.add_argument("--repeat", type=int, default=500, help="iterations per measurement")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    img = load_art(args.image)
+    topic = "led-jukebox/track"
+    results = {}
+    for name, encode, decode in (("json+base64+png", encode_legacy, decode_legacy),
+                                 ("binary", encode_binary, decode_binary)):
+        payload = encode(img)
+        # 受信側の結果が同じ画素になっていることを確かめておく
+        assert np.array_equal(np.asarray(decode(payload))[:, :ART_SIZE[0], :3], np.asarray(img))
+        results[name] = {
+            "payload_bytes": len(payload),
+            "socket_frame_bytes": len(encode_frame(topic, payload)),
+            "encode_ms": measure(encode, img, args.repeat),
+            "decode_ms": measure(decode, payload, args.repeat),
+        }
+
+    for name, result in results.items():
+        print(f"{name:>16s}: {result['payload_bytes']:6d} bytes payload, "
+              f"encode {result['encode_ms']:.3f} ms, decode {result['decode_ms']:.3f} ms")
+    legacy, binary = results["json+base64+png"], results["binary"]
+    print(f"  per track change: {binary['payload_bytes'] - legacy['payload_bytes']:+d} bytes sent, "
+          f"{legacy['encode_ms'] - binary['encode_ms']:.3f} ms encode and "
+          f"{legacy['decode_ms'] - binary['decode_ms']:.3f} ms decode saved")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
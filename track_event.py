@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""librespot の onevent フックから常駐している track_publisher にイベントを渡すクライアント
+
+venv や外部ライブラリを読み込まずに済むよう、標準ライブラリだけで書いている。
+サービスに送れなかった場合は終了コード1を返す (raspotify_handler.sh が従来の方法で処理する)。
+"""
+import json
+import os
+import socket
+import sys
+
+SOCKET_PATH = os.getenv("LED_JUKEBOX_TRACK_SOCKET", "/tmp/led_jukebox_track.sock")
+
+
+def main():
+    event = os.getenv("PLAYER_EVENT")
+    track_id = os.getenv("TRACK_ID")
+    if not event:
+        return 1
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(json.dumps({"track_id": track_id, "event": event}).encode("utf-8"), SOCKET_PATH)
+    except OSError as e:
+        print(f"Could not send track event to {SOCKET_PATH}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
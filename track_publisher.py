@@ -1,94 +1,301 @@
 import sys
+import os
+import json
+import signal
+import logging
 import requests
 from PIL import Image
 import io
-import base64
-import json
-import socket
-import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from modules import spotify
 from modules import config
+from modules.ipc import DaemonClient, FLAG_RETAIN, bind_datagram_socket
+from modules.art_cache import ArtCache
+from modules.track_message import encode_track_message
+
+# ロギング設定
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('track_publisher')
+
+# 次に再生するトラックが分かるイベント (アルバムアートを裏で準備しておく)
+PREFETCH_EVENTS = ("preloading", "preload_next", "loading", "track_changed")
+# 準備しておくトラック数の上限
+MAX_PREFETCHED = 4
+# LEDマトリクスに表示するアルバムアートの大きさ
+ART_SIZE = (64, 64)
+# 表示の状態を決めるイベント。ブローカーに保持 (retain) させ、
+# 再起動したサブスクライバーが次のイベントを待たずに現在の表示を復元できるようにする
+RETAINED_EVENTS = ("playing", "stopped")
+
+# MQTTデーモンへの接続 (切断時は自動で再接続する)
+daemon_client = DaemonClient(config.SOCKET_PATH, default_topic=f"{config.MQTT_TOPIC_BASE}/track")
+
+# 画像ダウンロード用のHTTPセッション (サービスとして常駐する場合は接続を使い回す)
+http_session = requests.Session()
+# 画像ダウンロードのタイムアウト (秒, spotipy の既定値に合わせる)
+# 常駐サービスでは1件のダウンロードが止まると以降のイベントがすべて止まるため
+IMAGE_TIMEOUT = 5
+
+def open_art_cache():
+    """アルバムアートのディスクキャッシュを開く (無効、または開けなければNone)"""
+    if not config.ART_CACHE_DIR:
+        return None
+    try:
+        return ArtCache(config.ART_CACHE_DIR, config.ART_CACHE_MAX_BYTES)
+    except OSError as e:
+        logger.warning(f"Album art cache disabled: {e}")
+        return None
+
+# アルバムアートのディスクキャッシュ (読み込んだだけではディレクトリを作らないよう main() で開く)
+art_cache = None
 
-SOCKET_PATH = config.SOCKET_PATH
+# 先読み中・先読み済みのアルバムアート {トラックID: Future}
+prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+prefetched = {}
+# 先読みを待っている (トラックID, Future)。先読みのスレッドがまとめて取り出し、
+# トラック情報を spotify.tracks() の1回のリクエストで取得する
+prefetch_pending = []
+prefetch_lock = threading.Lock()
+# 先読みの統計 (hits: 再生前に準備済み, late: 再生時に取得中, misses: 先読みしていなかった)
+prefetch_stats = {"hits": 0, "late": 0, "misses": 0}
 
-def send_mqtt_message(payload, topic=None):
+# 直前に取得したアルバムアート (トラックID, 画素)
+# loading → playing のように同じトラックのイベントが続いた場合に取得し直さない
+# (イベントを処理するスレッドと先読みのスレッドの両方から使うので last_art_lock で守る)
+last_art = (None, None)
+last_art_lock = threading.Lock()
+
+def send_mqtt_message(payload, topic=None, flags=0):
     """UNIXソケット経由でMQTTデーモンにメッセージを送信する"""
     try:
-        # UNIXソケットに接続
-        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        client.connect(SOCKET_PATH)
-        
-        # トピックが指定されていなければデフォルト値を使用
-        if not topic:
-            topic = f"{config.MQTT_TOPIC_BASE}/track"
-        
-        # メッセージを準備
-        message = {
-            "topic": topic,
-            "payload": payload
-        }
-        
-        # メッセージを送信
-        client.sendall(json.dumps(message).encode('utf-8'))
-        client.close()
-        
-        print(f"Message sent to MQTT daemon for topic: {topic}")
+        if not daemon_client.send(payload, topic, flags):
+            logger.error("Error sending message to MQTT daemon: not connected")
+            return False
+
+        logger.info(f"Message sent to MQTT daemon for topic: {topic or daemon_client.default_topic}")
         return True
     except Exception as e:
-        print(f"Error sending message to MQTT daemon: {e}")
+        logger.error(f"Error sending message to MQTT daemon: {e}")
         return False
 
-def main():
-    track_id = sys.argv[1] if len(sys.argv) > 1 else None
-    event = sys.argv[2] if len(sys.argv) > 2 else None
-    
-    if not track_id or not event:
-        print("Usage: python main.py <track_id> <event>")
-        return
-    
-    # JSONデータの初期化
-    data = {"event": event, "track_id": track_id}
-    
-    if event == "loading" or event == "track_changed" or event == "playing":
+def load_album_art(track_id, track=None):
+    """アルバムアートを64x64のRGBビットマップ (bytes) で返す
+
+    キャッシュにあればネットワークにも画像のデコードにも触れずに返す。
+    なければSpotifyから取得し、トラックIDとアルバムIDの両方でキャッシュする。
+    track にトラック情報を渡せば、それを使ってトラック情報の取得を省く。
+    """
+    if art_cache:
+        bitmap = art_cache.get(track_id)
+        if bitmap:
+            return bitmap
+
+    # Spotifyからトラック情報を取得 (同じアルバムの画像がキャッシュにあればそれを使う)
+    if track is None:
+        track = spotify.get_track(track_id)
+    album_id = track['album']['id']
+    if art_cache:
+        bitmap = art_cache.get(track_id, album_id)
+        if bitmap:
+            return bitmap
+
+    image_url = spotify.album_image_url(track)
+    logger.info(f"Fetching album art for track: {track_id}")
+
+    # 画像をダウンロード
+    img_response = http_session.get(image_url, timeout=IMAGE_TIMEOUT)
+    img_response.raise_for_status()
+    img = Image.open(io.BytesIO(img_response.content)).convert("RGB")
+
+    # 画像をリサイズ（必要に応じて）
+    if img.size != ART_SIZE:
+        img = img.resize(ART_SIZE, resample=Image.BICUBIC)
+
+    bitmap = img.tobytes()
+    if art_cache:
+        art_cache.put(bitmap, track_id, album_id)
+    return bitmap
+
+def recent_album_art(track_id):
+    """直前に取得したのが track_id のアルバムアートならその画素を返す (なければNone)"""
+    with last_art_lock:
+        art_track_id, bitmap = last_art
+    return bitmap if art_track_id == track_id else None
+
+def fetch_album_art(track_id, track=None):
+    """アルバムアートの画素 (64x64のRGB) を返す"""
+    global last_art
+    bitmap = recent_album_art(track_id)
+    if bitmap is not None:
+        return bitmap
+
+    # 取得中はロックを持たない (ネットワークを待つ間も他方のスレッドを止めない)
+    bitmap = load_album_art(track_id, track)
+    with last_art_lock:
+        last_art = (track_id, bitmap)
+    return bitmap
+
+def prefetch_album_art(track_id):
+    """アルバムアートの取得と変換を裏で始める (すでに先読みしていれば何もしない)"""
+    with prefetch_lock:
+        if track_id in prefetched or recent_album_art(track_id) is not None:
+            return
+        future = prefetched[track_id] = Future()
+        prefetch_pending.append((track_id, future))
+        # 待っているものがなければ取り出す処理を始める (あれば次に取り出すときにまとめて取得する)
+        start = len(prefetch_pending) == 1
+        # 再生されなかったトラックの分は古いものから捨てる (まだ取得していなければ取り消す)
+        while len(prefetched) > MAX_PREFETCHED:
+            prefetched.pop(next(iter(prefetched))).cancel()
+    if start:
+        prefetch_executor.submit(run_prefetch)
+    logger.info(f"Prefetching album art for track: {track_id}")
+
+def run_prefetch():
+    """先読みを待っているトラックのアルバムアートを取得する (先読みのスレッドで動く)
+
+    キャッシュにないトラックの情報は spotify.tracks() でまとめて取得する。
+    """
+    with prefetch_lock:
+        # 取り消されたもの (捨てられたか、待たずに取得されたもの) は取得しない
+        batch = [(track_id, future) for track_id, future in prefetch_pending if not future.cancelled()]
+        prefetch_pending.clear()
+
+    missing = [track_id for track_id, _ in batch if not (art_cache and art_cache.get(track_id))]
+    tracks = {}
+    if missing:
+        try:
+            tracks = spotify.tracks(missing)
+        except Exception as e:
+            # 1件ずつ取得し直す
+            logger.warning(f"Batch track lookup failed: {e}")
+
+    for track_id, future in batch:
+        if not future.set_running_or_notify_cancel():
+            continue
         try:
-            # Spotifyからアルバムアートを取得
-            image_url = spotify.get_album_url(track_id)
-            print(f"Fetching album art for track: {track_id}")
-            
-            # 画像をダウンロード
-            img_response = requests.get(image_url, stream=True)
-            img = Image.open(io.BytesIO(img_response.content))
-            
-            # 画像をリサイズ（必要に応じて）
-            if img.size[0] != 64 or img.size[1] != 64:
-                img = img.resize((64, 64), resample=Image.BICUBIC)
-            
-            # PILイメージをバイナリデータに変換
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
-            
-            # Base64エンコード
-            base64_image = base64.b64encode(img_byte_arr).decode('utf-8')
-            
-            # JSONデータに画像を追加
-            data["image"] = base64_image
-            
+            future.set_result(fetch_album_art(track_id, tracks.get(track_id)))
         except Exception as e:
-            print(f"Error fetching album art: {e}")
-    
+            future.set_exception(e)
+
+def take_album_art(track_id):
+    """再生するトラックのアルバムアートを返す (先読み済みならその結果を使う)"""
+    with prefetch_lock:
+        future = prefetched.pop(track_id, None)
+        if future is None:
+            if recent_album_art(track_id) is None:
+                prefetch_stats["misses"] += 1
+        elif future.done():
+            prefetch_stats["hits"] += 1
+        else:
+            prefetch_stats["late"] += 1
+            # まだ先読みのスレッドが取り出していなければ、前の取得を待たずにここで取得する
+            if future.cancel():
+                future = None
+
+    if future is not None:
+        try:
+            return future.result()
+        except Exception as e:
+            logger.warning(f"Prefetch failed, fetching again: {e}")
+    return fetch_album_art(track_id)
+
+def handle_event(track_id, event):
+    """librespotのイベントを1件処理してMQTTデーモンに送信する"""
+    image = None
+
+    if event in PREFETCH_EVENTS and track_id:
+        # 表示は playing で行うので、ここでは待たずに裏で準備だけしておく
+        prefetch_album_art(track_id)
+
+    elif event == "playing" and track_id:
+        try:
+            image = take_album_art(track_id)
+        except Exception as e:
+            logger.error(f"Error fetching album art: {e}")
+        logger.info(f"Prefetch: {prefetch_stats['hits']} hits, {prefetch_stats['late']} late, "
+                    f"{prefetch_stats['misses']} misses")
+
     elif event == "stopped" or event == "paused":
-        print("draw blackscreen")
-    
+        logger.info("draw blackscreen")
+
     elif event == "session_connected":
-        print("session connected")
-    
+        logger.info("session connected")
+
     elif event == "session_disconnected":
-        print("session disconnected")
-    
-    # MQTTデーモンにメッセージを送信
-    send_mqtt_message(data)
+        logger.info("session disconnected")
+
+    # ヘッダと画素だけのバイナリメッセージとしてMQTTデーモンに送信
+    # (アートワークを取得できなかった playing では、保持している表示を置き換えない)
+    retain = event in RETAINED_EVENTS and (event != "playing" or image is not None)
+    send_mqtt_message(encode_track_message(event, track_id, image, *ART_SIZE),
+                      flags=FLAG_RETAIN if retain else 0)
+
+def open_event_socket(socket_path):
+    """イベントを受け取るUNIXデータグラムソケットを作成する
+
+    librespot のフックは別ユーザーで動くことがあるので誰でも書き込めるようにする。
+    """
+    return bind_datagram_socket(socket_path)
+
+def serve(socket_path=config.TRACK_SOCKET_PATH):
+    """常駐してイベントを受け取り続ける
+
+    フック (track_event.py) から1イベント1データグラムの JSON {"track_id": ..., "event": ...} を受け取る。
+    インタープリタの起動やライブラリの読み込みがイベントごとに発生しないので、
+    トラックが変わってから表示されるまでの時間はアートワークの取得時間だけになる。
+    """
+    sock = open_event_socket(socket_path)
+
+    def signal_handler(sig, frame):
+        logger.info("Received signal to terminate")
+        sock.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        daemon_client.close()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    logger.info(f"Track event service started at {socket_path}")
+    while True:
+        data = sock.recv(4096)
+        try:
+            message = json.loads(data)
+            track_id = message.get("track_id") or None
+            event = message["event"]
+        except (ValueError, KeyError, AttributeError) as e:
+            logger.warning(f"Ignoring malformed track event: {e}")
+            continue
+
+        logger.info(f"Track event: {event} ({track_id})")
+        try:
+            handle_event(track_id, event)
+        except Exception as e:
+            logger.error(f"Error handling track event: {e}")
+
+def main():
+    global art_cache
+    art_cache = open_art_cache()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve()
+        return
+
+    track_id = sys.argv[1] if len(sys.argv) > 1 else None
+    event = sys.argv[2] if len(sys.argv) > 2 else None
+
+    if not track_id or not event:
+        print("Usage: python track_publisher.py <track_id> <event>")
+        print("       python track_publisher.py --serve")
+        return
+
+    handle_event(track_id, event)
+    daemon_client.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()